@@ -0,0 +1,170 @@
+""" Routing against ensemble forecasts
+
+Candidate routes come from routing every member at once (route_fleet,
+one lane per member) and from routing the ensemble mean. Each candidate
+is then sailed through every member in one vectorized pass, giving an
+ETA distribution per route; the route with the best mean or chosen
+percentile wins.
+
+    ens = Weather.EnsembleWindField.load("ens/")
+    result = route_ensemble(polar, ens, departure, *start, *finish, objective=90)
+    result.summary   # mean, std, p10/p50/p90 and arrived fraction
+"""
+import numpy as np
+from dataclasses import dataclass
+import Geodesy as geo
+import Isochrones as iso
+import Weather
+from Polars import Polar, PolarStack
+
+
+@dataclass
+class EnsembleRoute:
+    """ Result of route_ensemble
+
+    route is a list of (lat, lon), hours its ETA in hours for every member
+    (inf where the finish is not reached). candidates holds one dict per
+    route considered (source, route, hours, summary), chosen indexes it.
+    """
+    route: list
+    hours: np.ndarray
+    summary: dict
+    candidates: list
+    chosen: int
+
+
+def route_hours(polars, ensemble, routes, start_time):
+    """ Hours to sail every route in every member
+
+    Like leg_hours, each leg is sailed at the boatspeed for the wind at its
+    first waypoint when the boat gets there, which differs per member. All
+    routes and members advance together, one array operation per leg.
+
+    Args:
+        polars: pandas dataframe or Polars.Polar
+        ensemble: Weather.EnsembleWindField
+        routes: list of routes, each a sequence of (lat, lon[, ...])
+        start_time: departure datetime
+
+    Returns:
+        hours: (n_routes, n_members), inf where a leg cannot be sailed
+    """
+    polar = polars if isinstance(polars, Polar) else Polar.from_dataframe(polars)
+    length = max(len(route) for route in routes)
+    points = np.array([[p[:2] for p in route] + [route[-1][:2]] * (length - len(route)) for route in routes],
+                      dtype=np.float64)
+    lat, lon = points[:, :, 0], points[:, :, 1]
+    dist = geo.distance(lat[:, :-1], lon[:, :-1], lat[:, 1:], lon[:, 1:])
+    hdg = geo.rhumb_bearing(lat[:, :-1], lon[:, :-1], lat[:, 1:], lon[:, 1:])
+
+    t0 = Weather.to_epoch(start_time)
+    t = np.full((len(routes), ensemble.members), t0)
+    member = np.arange(ensemble.members)[None, :]
+    for k in range(length - 1):
+        tws, twd = ensemble.tws_twd(lat[:, k, None], lon[:, k, None], t, member=member)
+        bsp = polar.speed(tws, twd - hdg[:, k, None])
+        leg = dist[:, k, None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = t + np.where(leg > 0, np.where(bsp > 0, leg / bsp, np.inf), 0.0) * 3600.0
+    return (t - t0) / 3600.0
+
+
+def percentile(hours, q, axis=-1):
+    """ Linear-interpolation percentile that keeps unreached (inf) members ordered last
+
+    np.percentile turns inf - inf into NaN while interpolating; here a
+    percentile that gives any weight to an inf is inf, and one landing
+    exactly on a finite value is that value.
+
+    Args:
+        hours: array of member ETAs in hours
+        q: percentile in [0, 100]
+        axis: member axis
+
+    Returns:
+        float or array
+    """
+    hours = np.asarray(hours, dtype=np.float64)
+    lo = np.percentile(hours, q, axis=axis, method="lower")
+    hi = np.percentile(hours, q, axis=axis, method="higher")
+    pos = q / 100.0 * (hours.shape[axis] - 1)
+    frac = pos - np.floor(pos)
+    if frac == 0:
+        return lo
+    with np.errstate(invalid="ignore"):
+        return np.where(np.isfinite(hi), lo + (hi - lo) * frac, np.inf)[()]
+
+
+def score(hours, objective="mean"):
+    """ Objective per candidate from a (candidates, members) hours array, inf when it cannot be trusted
+
+    Args:
+        hours: member ETAs in hours, see route_hours
+        objective: "mean", or a percentile of member ETAs
+
+    Returns:
+        array (candidates,)
+    """
+    hours = np.asarray(hours, dtype=np.float64)
+    if objective == "mean":
+        return np.where(np.isfinite(hours).all(axis=1), hours.mean(axis=1), np.inf)
+    return percentile(hours, float(objective), axis=1)
+
+
+def summarize(hours, percentiles=(10, 50, 90)):
+    """ Mean, spread and percentiles of member ETAs in hours, unreached members count as inf """
+    hours = np.asarray(hours, dtype=np.float64)
+    arrived = np.isfinite(hours)
+    summary = {
+        "mean": float(hours.mean()) if arrived.all() else float("inf"),
+        "std": float(hours.std()) if arrived.all() else float("inf"),
+        "arrived": float(arrived.mean()),
+    }
+    for q in percentiles:
+        summary[f"p{q:g}"] = float(percentile(hours, q))
+    return summary
+
+
+def route_ensemble(polars, ensemble, start_time, start_lat, start_lon, endlat, endlon, objective="mean",
+                   percentiles=(10, 50, 90), member_routes=True, **route_kwargs):
+    """ Route chosen for its ETA distribution over an ensemble
+
+    Args:
+        polars: pandas dataframe or Polars.Polar
+        ensemble: Weather.EnsembleWindField
+        start_time: departure datetime
+        start_lat, start_lon: start
+        endlat, endlon: finish
+        objective: "mean", or a percentile (e.g. 90) of member ETAs to minimize
+        percentiles: reported in every summary
+        member_routes: also route every member as a candidate, in one
+            route_fleet pass; only the ensemble mean route otherwise
+        route_kwargs: passed to Isochrones.route_isochrones / route_fleet
+
+    Returns:
+        EnsembleRoute
+    """
+    polar = polars if isinstance(polars, Polar) else Polar.from_dataframe(polars)
+    candidates = []
+
+    mean_route = iso.route_isochrones(polar, start_time, start_lat, start_lon, endlat, endlon,
+                                      wind=ensemble.mean(), **route_kwargs)
+    if mean_route.eta is not None:
+        candidates.append({"source": "mean", "route": [p[:2] for p in mean_route.route]})
+    if member_routes:
+        lanes = PolarStack([polar] * ensemble.members)
+        for k, result in enumerate(iso.route_fleet(lanes, start_time, start_lat, start_lon, endlat, endlon,
+                                                   wind=ensemble, **route_kwargs)):
+            if result.eta is not None:
+                candidates.append({"source": f"member {k}", "route": [p[:2] for p in result.route]})
+    if not candidates:
+        return EnsembleRoute([], np.full(ensemble.members, np.inf), summarize(np.full(1, np.inf), percentiles), [], -1)
+
+    hours = route_hours(polar, ensemble, [c["route"] for c in candidates], start_time)
+    for c, h in zip(candidates, hours):
+        c["hours"] = h
+        c["summary"] = summarize(h, percentiles)
+
+    chosen = int(np.argmin(score(hours, objective)))
+    best = candidates[chosen]
+    return EnsembleRoute(best["route"], best["hours"], best["summary"], candidates, chosen)
@@ -0,0 +1,196 @@
+""" Compact export of grids, isochrones and routes
+
+The folium visualizers add one marker object per node, which makes both
+the Python side and the browser slow for large grids. These writers
+stream straight to disk instead:
+
+    write_geojson: one FeatureCollection, the grid as a single MultiPoint
+    write_map: a standalone Leaflet page, grid points embedded as a base64
+        Float32Array and drawn on one canvas, lines as GeoJSON
+
+Both accept Grid objects or the dict nodes of create_grid /
+create_hexagonal_grid, Isochrones.Front lists or the dict lists of
+build_isochrones, and routes as (lat, lon[, time]) sequences or a GridRoute.
+"""
+import base64
+import json
+import numpy as np
+from Stats import stats
+
+CHUNK = 20000
+
+
+def node_points(nodes):
+    """ lat, lon arrays from a Grid, a list of node dicts or rows of node dicts """
+    if hasattr(nodes, "lat") and hasattr(nodes, "lon"):
+        return np.asarray(nodes.lat, dtype=np.float64), np.asarray(nodes.lon, dtype=np.float64)
+    flat = [node for row in nodes for node in row] if nodes and isinstance(nodes[0], list) else nodes
+    positions = np.array([node['position'] for node in flat], dtype=np.float64).reshape(-1, 2)
+    return positions[:, 0], positions[:, 1]
+
+
+def line_points(line):
+    """ lat, lon arrays from a Front, a list of point dicts or (lat, lon, ...) tuples """
+    if hasattr(line, "lat") and hasattr(line, "lon"):
+        return np.asarray(line.lat, dtype=np.float64), np.asarray(line.lon, dtype=np.float64)
+    if len(line) and isinstance(line[0], dict):
+        return np.array([p['lat'] for p in line], dtype=np.float64), np.array([p['lon'] for p in line], dtype=np.float64)
+    coords = np.array([(p[0], p[1]) for p in line], dtype=np.float64).reshape(-1, 2)
+    return coords[:, 0], coords[:, 1]
+
+
+def decimate(lat, lon, stride=1, max_points=None):
+    """ Every stride-th point, with stride raised so at most max_points remain """
+    if max_points is not None and len(lat) > max_points:
+        stride = max(stride, int(np.ceil(len(lat) / max_points)))
+    return lat[::stride], lon[::stride]
+
+
+def _write_coords(f, lat, lon, precision):
+    """ Streams [[lon, lat], ...] in chunks without building the whole string """
+    f.write("[")
+    fmt = f"[{{:.{precision}f}},{{:.{precision}f}}]"
+    for i in range(0, len(lat), CHUNK):
+        if i:
+            f.write(",")
+        f.write(",".join(fmt.format(x, y) for x, y in zip(lon[i:i + CHUNK].tolist(), lat[i:i + CHUNK].tolist())))
+    f.write("]")
+
+
+def _route_of(route):
+    return route.path if hasattr(route, "path") else route
+
+
+def write_geojson(path, start=None, finish=None, grid=None, isochrones=None, route=None, stride=1, max_points=None, precision=4):
+    """ Writes grid, isochrones and route as one GeoJSON FeatureCollection
+
+    Args:
+        path: output file
+        start, finish: optional (lat, lon) markers
+        grid: Grid or node dicts, written as a single MultiPoint
+        isochrones: list of fronts, written as one MultiLineString
+        route: route points, written as a LineString
+        stride: keep every stride-th grid node
+        max_points: cap on grid nodes written
+        precision: decimals kept on coordinates
+    """
+    with stats.stage("render"), open(path, "w") as f:
+        f.write('{"type":"FeatureCollection","features":[')
+        first = True
+
+        def feature(kind, geometry_type, write_coords):
+            nonlocal first
+            if not first:
+                f.write(",")
+            first = False
+            f.write('{"type":"Feature","properties":{"kind":"%s"},"geometry":{"type":"%s","coordinates":' % (kind, geometry_type))
+            write_coords()
+            f.write("}}")
+
+        if grid is not None:
+            lat, lon = decimate(*node_points(grid), stride, max_points)
+            feature("grid", "MultiPoint", lambda: _write_coords(f, lat, lon, precision))
+
+        if isochrones:
+            lines = [line_points(line) for line in isochrones]
+
+            def write_lines():
+                f.write("[")
+                for k, (lat, lon) in enumerate(lines):
+                    if k:
+                        f.write(",")
+                    _write_coords(f, lat, lon, precision)
+                f.write("]")
+            feature("isochrones", "MultiLineString", write_lines)
+
+        if route:
+            lat, lon = line_points(_route_of(route))
+            feature("route", "LineString", lambda: _write_coords(f, lat, lon, precision))
+
+        for kind, point in (("start", start), ("finish", finish)):
+            if point is not None:
+                feature(kind, "Point", lambda: f.write(f"[{point[1]:.{precision}f},{point[0]:.{precision}f}]"))
+
+        f.write("]}")
+
+
+_MAP_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>sailingnav</title>
+<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"/>
+<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<style>html,body,#map{{height:100%;margin:0}}</style></head>
+<body><div id="map"></div><script>
+var map = L.map('map', {{preferCanvas: true}}).setView([{lat:.5f}, {lon:.5f}], {zoom});
+L.tileLayer('https://{{s}}.tile.openstreetmap.org/{{z}}/{{x}}/{{y}}.png', {{maxZoom: 18}}).addTo(map);
+function decode(b64) {{
+  var s = atob(b64), bytes = new Uint8Array(s.length);
+  for (var i = 0; i < s.length; i++) bytes[i] = s.charCodeAt(i);
+  return new Float32Array(bytes.buffer);
+}}
+var PointLayer = L.Layer.extend({{
+  initialize: function (pts) {{ this.pts = pts; }},
+  onAdd: function (map) {{
+    this.canvas = L.DomUtil.create('canvas', 'leaflet-zoom-hide');
+    map.getPanes().overlayPane.appendChild(this.canvas);
+    map.on('moveend zoomend resize', this.draw, this);
+    this.draw();
+  }},
+  onRemove: function (map) {{
+    L.DomUtil.remove(this.canvas);
+    map.off('moveend zoomend resize', this.draw, this);
+  }},
+  draw: function () {{
+    var size = map.getSize(), topLeft = map.containerPointToLayerPoint([0, 0]);
+    L.DomUtil.setPosition(this.canvas, topLeft);
+    this.canvas.width = size.x; this.canvas.height = size.y;
+    var ctx = this.canvas.getContext('2d'), pts = this.pts;
+    ctx.fillStyle = '#000';
+    for (var i = 0; i < pts.length; i += 2) {{
+      var p = map.latLngToContainerPoint([pts[i], pts[i + 1]]);
+      if (p.x >= 0 && p.y >= 0 && p.x < size.x && p.y < size.y) ctx.fillRect(p.x - 1, p.y - 1, 2, 2);
+    }}
+  }}
+}});
+"""
+
+
+def write_map(path, start, finish, grid=None, isochrones=None, route=None, stride=1, max_points=None, zoom=6):
+    """ Writes a standalone Leaflet page for a grid, isochrones and a route
+
+    Grid nodes are embedded as a base64 Float32Array and drawn on a single
+    canvas, so a 100k-node grid is a ~1 MB page that opens at once.
+
+    Args:
+        path: output html file
+        start, finish: (lat, lon)
+        grid: Grid or node dicts
+        isochrones: list of fronts
+        route: route points
+        stride: keep every stride-th grid node
+        max_points: cap on grid nodes written
+        zoom: initial zoom level
+    """
+    with stats.stage("render"), open(path, "w") as f:
+        f.write(_MAP_TEMPLATE.format(lat=start[0], lon=start[1], zoom=zoom))
+
+        if grid is not None:
+            lat, lon = decimate(*node_points(grid), stride, max_points)
+            interleaved = np.empty(2 * len(lat), dtype="<f4")
+            interleaved[0::2], interleaved[1::2] = lat, lon
+            f.write("new PointLayer(decode('")
+            f.write(base64.b64encode(interleaved.tobytes()).decode("ascii"))
+            f.write("')).addTo(map);\n")
+
+        for line in isochrones or []:
+            lat, lon = line_points(line)
+            coords = np.round(np.column_stack([lat, lon]), 4).tolist()
+            f.write(f"L.polyline({json.dumps(coords)}, {{color: 'blue', weight: 3, opacity: 0.7}}).addTo(map);\n")
+
+        if route:
+            lat, lon = line_points(_route_of(route))
+            coords = np.round(np.column_stack([lat, lon]), 4).tolist()
+            f.write(f"L.polyline({json.dumps(coords)}, {{color: 'red', weight: 3}}).addTo(map);\n")
+
+        f.write(f"L.marker([{start[0]}, {start[1]}]).bindPopup('Start').addTo(map);\n")
+        f.write(f"L.marker([{finish[0]}, {finish[1]}]).bindPopup('Finish').addTo(map);\n")
+        f.write("</script></body></html>\n")
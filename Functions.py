@@ -1,9 +1,8 @@
-import pandas as pd
 import numpy as np
-import geopy.distance
-from geopy.distance import geodesic
 import math
 import Weather
+from Polars import Polar
+from Stats import stats
 
 
 def polarpandas(polar_csv):
@@ -15,6 +14,7 @@ def polarpandas(polar_csv):
     Returns:
         polars: pandas dataframe fo polars
     """
+    import pandas as pd
     polars = pd.read_csv(polar_csv, sep = ';', index_col = 0)
     polars.columns = [float(c) for c in polars.columns]
     polars.index = [float(i) for i in polars.index]
@@ -31,6 +31,7 @@ def find_distance(start_coords,end_coords):
     Returns:
         distance_nm: distance between points in nautical miles
     """
+    from geopy.distance import geodesic
     distance_nm = geodesic(start_coords,end_coords).nm
     return distance_nm
 
@@ -78,13 +79,17 @@ def find_speed(polars, tws, twa):
     """ Interpolates speed at and instancee based off tws, twa, and polars
     
     Args:
-        polars: pandas dataframe
+        polars: pandas dataframe or Polars.Polar
         tws: positive float
         twa: float [0,360]
     
     Returns:
         twa: float [0,360]
     """
+    if isinstance(polars, Polar):
+        return polars.speed(tws, twa)
+    stats.count("polar.evaluations")
+
     twa = np.clip(twa, polars.index.min(), polars.index.max())
     tws = np.clip(tws, polars.columns.min(), polars.columns.max())
 
@@ -126,7 +131,7 @@ def find_speed(polars, tws, twa):
     return V
 
 
-def find_speed_at(polars, datetime, lat, lon, hdg):
+def find_speed_at(polars, datetime, lat, lon, hdg, wind=None):
     """ Finds boatspeed at specific time and location
     
     Args:
@@ -135,11 +140,15 @@ def find_speed_at(polars, datetime, lat, lon, hdg):
         lat: float
         lon: float
         hdg: float [0,360]
+        wind: optional Weather.WindField, live API is used when None
     
     Returns:
         bsp: float boatspeed
     """
-    tws, twd = Weather.tws_twd(lat, lon, datetime)
+    if wind is None:
+        tws, twd = Weather.tws_twd(lat, lon, datetime)
+    else:
+        tws, twd = wind.tws_twd(lat, lon, datetime)
     twa = abs(get_twa(hdg, twd))
 
     bsp = find_speed(polars, tws, twa)
@@ -158,11 +167,13 @@ def find_new_pos(cur_lat, cur_lon, hdg, dist_nm):
     Returns:
         new position (lat, lon)
     """
+    stats.count("geodesy.destinations")
+    import geopy.distance
     new = geopy.distance.distance(meters = dist_nm * 1852).destination((cur_lat,cur_lon), bearing = hdg)
     return new.latitude, new.longitude
 
 
-def find_time_to(polars, datetime, cur_lat, cur_lon, fut_lat, fut_lon):
+def find_time_to(polars, datetime, cur_lat, cur_lon, fut_lat, fut_lon, wind=None):
     """ Finds time between two points based on bsp at starting point
     
     Args:
@@ -172,12 +183,13 @@ def find_time_to(polars, datetime, cur_lat, cur_lon, fut_lat, fut_lon):
         cur_lon: float
         fut_lat: float
         fut_lon: float
+        wind: optional Weather.WindField
         
     Returns:
         dt: time to travel between points
     """
     hdg = rhumb_bearing(cur_lat, cur_lon, fut_lat, fut_lon)
-    bsp = find_speed_at(polars, datetime, cur_lat, cur_lon, hdg)
+    bsp = find_speed_at(polars, datetime, cur_lat, cur_lon, hdg, wind)
     dist = find_distance((cur_lat, cur_lon) , (fut_lat, fut_lon))
     dt = dist / bsp * 60
     return dt
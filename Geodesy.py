@@ -0,0 +1,226 @@
+""" Array versions of the geodesy in Functions
+
+Every function takes floats or NumPy arrays (broadcast against each other)
+and never builds per-point Python objects, so whole candidate sets can be
+advanced at once.
+
+Two accuracy modes are available where it matters:
+    "spherical": mean-radius sphere, fast, within ~0.6% of geopy
+    "ellipsoidal": Vincenty on WGS-84, agrees with geopy's geodesic to
+        better than 1e-6 nm (about 2 mm). Nearly antipodal pairs, where
+        Vincenty's inverse does not converge, fall back to the sphere.
+"""
+import numpy as np
+from Stats import stats
+
+EARTH_RADIUS_NM = 6371008.8 / 1852
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+MODES = ("spherical", "ellipsoidal")
+
+
+def _check_mode(mode):
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+
+
+def wrap_lon(lon):
+    """ Wraps longitudes onto [-180, 180)
+
+    Args:
+        lon: float or array in degrees
+
+    Returns:
+        lon: wrapped longitude
+    """
+    return (np.asarray(lon, dtype=np.float64) + 180) % 360 - 180
+
+
+def destination(lat, lon, hdg, dist_nm, mode="spherical"):
+    """ Position reached after sailing a distance along an initial bearing
+
+    Args:
+        lat: float or array
+        lon: float or array
+        hdg: initial bearing in degrees
+        dist_nm: distance in nautical miles
+        mode: "spherical" or "ellipsoidal"
+
+    Returns:
+        lat, lon: new positions, longitude wrapped onto [-180, 180)
+    """
+    _check_mode(mode)
+    lat, lon, hdg, dist_nm = np.broadcast_arrays(*(np.asarray(x, dtype=np.float64) for x in (lat, lon, hdg, dist_nm)))
+    stats.count("geodesy.destinations", lat.size)
+    if mode == "ellipsoidal":
+        lat2, lon2 = _vincenty_direct(lat, lon, hdg, dist_nm * 1852)
+        return lat2[()], lon2[()]
+
+    phi1, lam1, theta = np.radians(lat), np.radians(lon), np.radians(hdg)
+    delta = dist_nm / EARTH_RADIUS_NM
+
+    sin_phi2 = np.sin(phi1) * np.cos(delta) + np.cos(phi1) * np.sin(delta) * np.cos(theta)
+    phi2 = np.arcsin(np.clip(sin_phi2, -1, 1))
+    lam2 = lam1 + np.arctan2(
+        np.sin(theta) * np.sin(delta) * np.cos(phi1),
+        np.cos(delta) - np.sin(phi1) * sin_phi2)
+    return np.degrees(phi2)[()], wrap_lon(np.degrees(lam2))[()]
+
+
+def distance(lat1, lon1, lat2, lon2, mode="spherical"):
+    """ Shortest (great-circle or geodesic) distance between points
+
+    Args:
+        lat1, lon1: float or array
+        lat2, lon2: float or array
+        mode: "spherical" or "ellipsoidal"
+
+    Returns:
+        distance_nm: distance in nautical miles
+    """
+    _check_mode(mode)
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(*(np.asarray(x, dtype=np.float64) for x in (lat1, lon1, lat2, lon2)))
+    sphere = _haversine(lat1, lon1, lat2, lon2)
+    if mode == "spherical":
+        return sphere[()]
+
+    dist_m, ok = _vincenty_inverse(lat1, lon1, lat2, lon2)
+    return np.where(ok, dist_m / 1852, sphere)[()]
+
+
+def rhumb_bearing(lat1, lon1, lat2, lon2):
+    """ Constant bearing between points, array version of Functions.rhumb_bearing
+
+    Args:
+        lat1, lon1: float or array
+        lat2, lon2: float or array
+
+    Returns:
+        bearing: degrees [0,360)
+    """
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dlon = _dlon(lon1, lon2)
+    dpsi = _dpsi(phi1, phi2)
+    return (np.degrees(np.arctan2(dlon, dpsi)) % 360)[()]
+
+
+def rhumb_distance(lat1, lon1, lat2, lon2):
+    """ Length of the constant-bearing track between points on the sphere
+
+    Args:
+        lat1, lon1: float or array
+        lat2, lon2: float or array
+
+    Returns:
+        distance_nm: distance in nautical miles
+    """
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dpsi = _dpsi(phi1, phi2)
+    dlon = _dlon(lon1, lon2)
+
+    # east-west legs have dpsi ~ 0, use the parallel's scale instead
+    flat = np.abs(dpsi) < 1e-12
+    q = np.where(flat, np.cos(phi1), dphi / np.where(flat, 1.0, dpsi))
+    return (np.hypot(dphi, q * dlon) * EARTH_RADIUS_NM)[()]
+
+
+def _dlon(lon1, lon2):
+    """ Longitude difference in radians taking the short way round the anti-meridian """
+    dlon = np.radians(np.asarray(lon2, dtype=np.float64) - np.asarray(lon1, dtype=np.float64))
+    return (dlon + np.pi) % (2 * np.pi) - np.pi
+
+
+def _dpsi(phi1, phi2):
+    """ Difference in isometric latitude (Mercator projected latitude) """
+    return np.log(np.tan(np.pi / 4 + phi2 / 2) / np.tan(np.pi / 4 + phi1 / 2))
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlam = np.radians(lon2 - lon1)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlam / 2) ** 2
+    return 2 * EARTH_RADIUS_NM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def _ab_coefficients(cos2_alpha):
+    u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    return A, B
+
+
+def _delta_sigma(B, sin_sigma, cos_sigma, cos_2sm):
+    return B * sin_sigma * (cos_2sm + B / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sm ** 2)
+        - B / 6 * cos_2sm * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sm ** 2)))
+
+
+def _vincenty_direct(lat, lon, hdg, dist_m, iterations=20):
+    f = WGS84_F
+    alpha1 = np.radians(hdg)
+    sin_a1, cos_a1 = np.sin(alpha1), np.cos(alpha1)
+
+    tan_u1 = (1 - f) * np.tan(np.radians(lat))
+    cos_u1 = 1 / np.sqrt(1 + tan_u1 ** 2)
+    sin_u1 = tan_u1 * cos_u1
+
+    sigma1 = np.arctan2(tan_u1, cos_a1)
+    sin_alpha = cos_u1 * sin_a1
+    cos2_alpha = 1 - sin_alpha ** 2
+    A, B = _ab_coefficients(cos2_alpha)
+
+    sigma = dist_m / (WGS84_B * A)
+    for _ in range(iterations):
+        cos_2sm = np.cos(2 * sigma1 + sigma)
+        sigma_new = dist_m / (WGS84_B * A) + _delta_sigma(B, np.sin(sigma), np.cos(sigma), cos_2sm)
+        done = np.max(np.abs(sigma_new - sigma), initial=0) < 1e-12
+        sigma = sigma_new
+        if done:
+            break
+
+    sin_s, cos_s = np.sin(sigma), np.cos(sigma)
+    cos_2sm = np.cos(2 * sigma1 + sigma)
+    x = sin_u1 * sin_s - cos_u1 * cos_s * cos_a1
+    phi2 = np.arctan2(sin_u1 * cos_s + cos_u1 * sin_s * cos_a1, (1 - f) * np.sqrt(sin_alpha ** 2 + x ** 2))
+    lam = np.arctan2(sin_s * sin_a1, cos_u1 * cos_s - sin_u1 * sin_s * cos_a1)
+    C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+    L = lam - (1 - C) * f * sin_alpha * (sigma + C * sin_s * (cos_2sm + C * cos_s * (-1 + 2 * cos_2sm ** 2)))
+    return np.degrees(phi2), wrap_lon(lon + np.degrees(L))
+
+
+def _vincenty_inverse(lat1, lon1, lat2, lon2, iterations=200):
+    f = WGS84_F
+    L = _dlon(lon1, lon2)
+    u1 = np.arctan((1 - f) * np.tan(np.radians(lat1)))
+    u2 = np.arctan((1 - f) * np.tan(np.radians(lat2)))
+    sin_u1, cos_u1 = np.sin(u1), np.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+
+    lam = L
+    ok = np.zeros(L.shape, dtype=bool)
+    for _ in range(iterations):
+        sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+        sin_sigma = np.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+        cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+        sigma = np.arctan2(sin_sigma, cos_sigma)
+
+        safe_sin = np.where(sin_sigma == 0, 1.0, sin_sigma)
+        sin_alpha = np.where(sin_sigma == 0, 0.0, cos_u1 * cos_u2 * sin_lam / safe_sin)
+        cos2_alpha = 1 - sin_alpha ** 2
+        safe_cos2 = np.where(cos2_alpha == 0, 1.0, cos2_alpha)
+        cos_2sm = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sin_u1 * sin_u2 / safe_cos2)
+
+        C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+        lam_new = L + (1 - C) * f * sin_alpha * (
+            sigma + C * sin_sigma * (cos_2sm + C * cos_sigma * (-1 + 2 * cos_2sm ** 2)))
+        ok = np.abs(lam_new - lam) < 1e-12
+        lam = lam_new
+        if ok.all():
+            break
+
+    A, B = _ab_coefficients(cos2_alpha)
+    dist_m = WGS84_B * A * (sigma - _delta_sigma(B, sin_sigma, cos_sigma, cos_2sm))
+    return dist_m, ok & (np.abs(lam) <= np.pi)
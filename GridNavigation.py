@@ -1,8 +1,13 @@
 import Functions as func
-import folium
+import Geodesy as geo
+import Weather
 import numpy as np
 import heapq
 import math
+from dataclasses import dataclass
+from datetime import timedelta
+from Polars import Polar
+from Stats import stats
 
 
 def grid_visualize(start, finish, nodes):
@@ -16,6 +21,12 @@ def grid_visualize(start, finish, nodes):
     Returns:
         none
     """
+    with stats.stage("render"):
+        _grid_visualize(start, finish, nodes)
+
+
+def _grid_visualize(start, finish, nodes):
+    import folium
     m = folium.Map(location=start, zoom_start=6)
 
     for row in nodes:
@@ -156,29 +167,12 @@ def create_grid(start, finish, padding=5, resolution=50):
     return nodes
     
 
-def node_weight(node_a, node_b, polars, datetime):
-    node_weight = func.find_time_to(polars, datetime, node_a[0], node_a[1], node_b[0], node_b[1])
+def node_weight(node_a, node_b, polars, datetime, wind=None):
+    node_weight = func.find_time_to(polars, datetime, node_a[0], node_a[1], node_b[0], node_b[1], wind)
 
     return node_weight
 
 
-open_set_heap = []
-count = 0
-
-
-def push_node(node):
-    global count
-    # We push (f_score, tie_breaker, node)
-    heapq.heappush(open_set_heap, (node['f'], count, node))
-    count += 1
-
-# 3. Function to get the lowest f-score node
-def pop_lowest_f():
-    # Heappop always returns the smallest element
-    f_score, _, node = heapq.heappop(open_set_heap)
-    return node
-
-
 def reconstruct_path(current):
     path = []
     while current:
@@ -187,52 +181,37 @@ def reconstruct_path(current):
     return path
 
 
-def astar(start, finish, padding=5, resolution=50):
+def astar(start, finish, padding=5, resolution=50, *, polars, start_time, wind=None, implicit=False, heuristic="polar", land=None):
     """ Operates a* algorithm on grid of nodes
 
+    padding and resolution keep their original positions; everything added
+    since is keyword-only, so old positional calls fail loudly instead of
+    binding a padding to polars.
+
     Args:
         start: starting point
         finish: finishing point
         padding: amount of nodes past start and finish points for grid
         resolution: adjust density of nodes in grid
+        polars: pandas dataframe or Polars.Polar
+        start_time: departure datetime
+        wind: optional Weather.WindField, live API is used when None
+        implicit: search a lazy ImplicitGrid instead of building the Grid
+        heuristic: see astar_grid
+        land: optional LandMask.LandMask, not supported with implicit
 
     Returns:
-        optimal reconstructed path from start to finish
+        GridRoute from the nodes closest to start and finish
     """
-    nodes = create_grid(start, finish, padding, resolution)
-    start = nodes[padding][padding]
-    finish = nodes[-(padding+1)][-(padding+1)]
-    openList = [start]
-    closedList = []
-
-    start['g'] = 0
-    start['h'] = func.find_distance(start, finish)
-    start['f'] = start['g'] + start['h']
-
-    while len(openList) > 0:
-        current = pop_lowest_f(openList) # node with lowest f value
-    
-        if current == finish:
-            return reconstruct_path()
-
-        closedList += openList.pop(0)
-
-        for neighbor in current['neighbors']:
-            if neighbor in closedList:
-                continue
-            tentative_g = current['g'] + func.find_distance((current['position']), (nodes[neighbor[0]][neighbor[1]]['position']))
-
-            if neighbor not in openList:
-                openList.append(neighbor)
-            elif tentative_g >= nodes[neighbor[0]][neighbor[1]]['g']:
-                continue
-
-            nodes[neighbor[0]][neighbor[1]]['parent'] = current
-            nodes[neighbor[0]][neighbor[1]]['g'] = tentative_g
-            nodes[neighbor[0]][neighbor[1]]['h'] = func.find_distance((nodes[neighbor[0]][neighbor[1]]['position']), (finish['position']))
-            nodes[neighbor[0]][neighbor[1]]['f'] = nodes[neighbor[0]][neighbor[1]]['g'] + nodes[neighbor[0]][neighbor[1]]['h']
-
-    return print("No path exists")
+    if implicit:
+        if land is not None:
+            raise ValueError("an ImplicitGrid cannot drop land nodes, use implicit=False with land")
+        grid = implicit_grid(start, finish, padding, resolution)
+    else:
+        grid = build_grid(start, finish, padding, resolution, land)
+    start_idx = nearest_node(grid, *start)
+    finish_idx = nearest_node(grid, *finish)
+    return astar_grid(grid, start_idx, finish_idx, polars, start_time, wind, heuristic)
 
 
 def create_hexagonal_grid(start, finish, spacing_km):
@@ -316,7 +295,837 @@ def find_closest_node_hex(node_lookup, target_lat, target_lon):
 
 
 
+class Grid:
+    """ Grid nodes held as coordinate arrays with CSR adjacency
+
+    Node i sits at (lat[i], lon[i]) and its neighbors are
+    indices[indptr[i]:indptr[i + 1]]. Search state lives outside the grid
+    (see new_state) so one grid can serve many searches.
+
+    Args:
+        lat: node latitudes (n,)
+        lon: node longitudes (n,)
+        indptr: CSR row pointer (n + 1,)
+        indices: CSR neighbor node ids
+        shape: (rows, cols) of the lattice the nodes came from, None if irregular
+        kind: "rect", "hex" or None
+        layout: lattice parameters of the builder (origin and steps)
+    """
+
+    def __init__(self, lat, lon, indptr, indices, shape=None, kind=None, layout=None):
+        self.lat = np.ascontiguousarray(lat, dtype=np.float64)
+        self.lon = np.ascontiguousarray(lon, dtype=np.float64)
+        self.indptr = np.ascontiguousarray(indptr, dtype=np.int64)
+        self.indices = np.ascontiguousarray(indices, dtype=np.int32)
+        self.shape = shape
+        self.kind = kind
+        self.layout = layout or {}
+        self._bucket = None
+
+    def __len__(self):
+        return len(self.lat)
+
+    @property
+    def nbytes(self):
+        return self.lat.nbytes + self.lon.nbytes + self.indptr.nbytes + self.indices.nbytes
+
+    def position(self, i):
+        return float(self.lat[i]), float(self.lon[i])
+
+    def positions(self, ids):
+        return self.lat[ids], self.lon[ids]
+
+    def neighbors(self, i):
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def new_state(self):
+        return SearchState(len(self))
+
+    def subset(self, mask):
+        """ Grid of the nodes where mask is True, edges to dropped nodes removed
+
+        The lattice shape and layout are kept for reference; nearest lookups
+        on the result go through a BucketIndex since ids no longer follow the
+        lattice. source_ids maps new ids back to ids in this grid.
+
+        Args:
+            mask: bool array over nodes
+
+        Returns:
+            Grid
+        """
+        mask = np.asarray(mask, dtype=bool)
+        keep = np.flatnonzero(mask)
+        remap = np.full(len(self), -1, dtype=np.int64)
+        remap[keep] = np.arange(len(keep))
+
+        src = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        ok = mask[src] & mask[self.indices]
+        indptr = np.zeros(len(keep) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(remap[src[ok]], minlength=len(keep)), out=indptr[1:])
+
+        grid = Grid(self.lat[keep], self.lon[keep], indptr, remap[self.indices[ok]], self.shape, self.kind, self.layout)
+        grid.source_ids = keep
+        return grid
+
+    def keep_edges(self, keep):
+        """ Grid with the same nodes and only the CSR edges where keep is True
+
+        Args:
+            keep: bool array over edges, in indices order
+
+        Returns:
+            Grid
+        """
+        src = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        indptr = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src[keep], minlength=len(self)), out=indptr[1:])
+        grid = Grid(self.lat, self.lon, indptr, self.indices[keep], self.shape, self.kind, self.layout)
+        if hasattr(self, "source_ids"):
+            grid.source_ids = self.source_ids
+        return grid
+
+    def nearest(self, lat, lon):
+        """ Closest node ids to points, distance measured in plain degrees
+
+        Full rect/hex lattices are inverted directly from their layout, other
+        grids go through a BucketIndex built on first use.
+
+        Args:
+            lat: float or array
+            lon: float or array
+
+        Returns:
+            node id, or array of node ids
+        """
+        lat, lon = np.broadcast_arrays(np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64))
+        if self.shape is not None and len(self) == self.shape[0] * self.shape[1]:
+            idx = self._lattice_nearest(lat.ravel(), lon.ravel())
+        else:
+            if self._bucket is None:
+                self._bucket = BucketIndex(self.lat, self.lon)
+            idx = self._bucket.query(lat.ravel(), lon.ravel())
+        return idx.reshape(lat.shape)[()]
+
+    def _lattice_nearest(self, lat, lon):
+        rows, cols = self.shape
+        lay = self.layout
+        base = np.clip(np.floor((lat - lay["lat0"]) / lay["dlat"]), -1, rows - 1).astype(np.int64)
+
+        best = np.zeros(len(lat), dtype=np.int64)
+        best_d = np.full(len(lat), np.inf)
+        # for a rect lattice rows are independent of columns, for hex the
+        # nearest node can sit one row further away at high latitudes
+        for drow in (-1, 0, 1, 2):
+            row = np.clip(base + drow, 0, rows - 1)
+            offset = np.where(row % 2 == 1, lay["dlon"] / 2, 0.0) if self.kind == "hex" else 0.0
+            col = np.clip(np.rint((lon - lay["lon0"] - offset) / lay["dlon"]), 0, cols - 1).astype(np.int64)
+            idx = row * cols + col
+            d = (self.lat[idx] - lat) ** 2 + (self.lon[idx] - lon) ** 2
+            closer = d < best_d
+            best[closer], best_d[closer] = idx[closer], d[closer]
+        return best
+
+
+class BucketIndex:
+    """ Uniform-cell bucket index for nearest-point queries on irregular node sets
+
+    Nodes are sorted by cell, so the members of a cell are one contiguous
+    slice. A query looks at the 3x3 cells around it; a hit closer than one
+    cell width is exact, anything else falls back to a full scan.
+
+    Args:
+        lat: node latitudes
+        lon: node longitudes
+        per_cell: target average number of nodes per cell
+    """
+
+    def __init__(self, lat, lon, per_cell=4):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.lat0, self.lon0 = self.lat.min(), self.lon.min()
+        span = max(self.lat.max() - self.lat0, self.lon.max() - self.lon0, 1e-9)
+        self.cell = span * math.sqrt(per_cell / max(len(self.lat), 1))
+        self.ny = int((self.lat.max() - self.lat0) / self.cell) + 1
+        self.nx = int((self.lon.max() - self.lon0) / self.cell) + 1
+
+        cell_id = self._cells(self.lat, self.lon)
+        self.order = np.argsort(cell_id, kind="stable")
+        self.starts = np.zeros(self.ny * self.nx + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cell_id, minlength=self.ny * self.nx), out=self.starts[1:])
+
+    def _cells(self, lat, lon):
+        cy = np.clip(((lat - self.lat0) / self.cell).astype(np.int64), 0, self.ny - 1)
+        cx = np.clip(((lon - self.lon0) / self.cell).astype(np.int64), 0, self.nx - 1)
+        return cy * self.nx + cx
+
+    def query(self, lat, lon):
+        """ Nearest node ids for arrays of points """
+        cy = np.floor((lat - self.lat0) / self.cell).astype(np.int64)
+        cx = np.floor((lon - self.lon0) / self.cell).astype(np.int64)
+
+        best = np.full(len(lat), -1, dtype=np.int64)
+        best_d = np.full(len(lat), np.inf)
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                y, x = cy + dy, cx + dx
+                q = np.flatnonzero((y >= 0) & (y < self.ny) & (x >= 0) & (x < self.nx))
+                cell = y[q] * self.nx + x[q]
+                lo, counts = self.starts[cell], self.starts[cell + 1] - self.starts[cell]
+                q, lo, counts = q[counts > 0], lo[counts > 0], counts[counts > 0]
+                if len(q) == 0:
+                    continue
+
+                # candidates come out grouped by query, so per-query minima are reduceat calls
+                group_start = np.cumsum(counts) - counts
+                rep = np.repeat(np.arange(len(q)), counts)
+                cand = self.order[lo[rep] + np.arange(len(rep)) - group_start[rep]]
+                d = (self.lat[cand] - lat[q[rep]]) ** 2 + (self.lon[cand] - lon[q[rep]]) ** 2
+                group_min = np.minimum.reduceat(d, group_start)
+                hits = np.flatnonzero(d == group_min[rep])
+                hits = hits[np.r_[True, rep[hits][1:] != rep[hits][:-1]]]
+
+                closer = group_min < best_d[q]
+                best[q[closer]] = cand[hits][closer]
+                best_d[q[closer]] = group_min[closer]
+
+        for i in np.flatnonzero(best_d > self.cell ** 2):
+            best[i] = np.argmin((self.lat - lat[i]) ** 2 + (self.lon - lon[i]) ** 2)
+        return best
+
+
+class SearchState:
+    """ Per-search node state in typed arrays, indexed by node id
+
+    Args:
+        n: number of nodes
+    """
+
+    def __init__(self, n):
+        self.g = np.full(n, np.inf)
+        self.parent = np.full(n, -1, dtype=np.int32)
+        self.closed = np.zeros(n, dtype=bool)
+
+
+def _lattice_csr(rows, cols, even_offsets, odd_offsets):
+    """ CSR adjacency of a rows x cols lattice with node id row * cols + col
+
+    Args:
+        rows: number of rows
+        cols: number of columns
+        even_offsets: (drow, dcol) neighbor offsets for even rows
+        odd_offsets: (drow, dcol) neighbor offsets for odd rows
+
+    Returns:
+        indptr, indices
+    """
+    row, col = np.divmod(np.arange(rows * cols, dtype=np.int64), cols)
+    odd = row % 2 == 1
+
+    src, dst = [], []
+    for even_off, odd_off in zip(even_offsets, odd_offsets):
+        drow = np.where(odd, odd_off[0], even_off[0])
+        dcol = np.where(odd, odd_off[1], even_off[1])
+        nrow, ncol = row + drow, col + dcol
+        ok = (nrow >= 0) & (nrow < rows) & (ncol >= 0) & (ncol < cols)
+        src.append(np.flatnonzero(ok))
+        dst.append((nrow * cols + ncol)[ok])
+
+    src = np.concatenate(src)
+    dst = np.concatenate(dst)
+    order = np.argsort(src, kind="stable")
+    indptr = np.zeros(rows * cols + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=rows * cols), out=indptr[1:])
+    return indptr, dst[order]
+
+
+RECT_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+HEX_EVEN_OFFSETS = [(-1, -1), (-1, 0), (0, -1), (0, 1), (1, -1), (1, 0)]
+HEX_ODD_OFFSETS = [(-1, 0), (-1, 1), (0, -1), (0, 1), (1, 0), (1, 1)]
+
+
+def build_grid(start, finish, padding=5, resolution=50, land=None):
+    """ Array version of create_grid, same lattice with 8-connected CSR adjacency
+
+    Args:
+        start: starting point
+        finish: finishing point
+        padding: amount of nodes past start and finish points
+        resolution: adjust density of nodes
+        land: optional LandMask.LandMask, see without_land
+
+    Returns:
+        Grid, node id is lat_idx * grid_size + lon_idx unless land dropped nodes
+    """
+    lat_min, lat_max = sorted([start[0], finish[0]])
+    lon_min, lon_max = sorted([start[1], finish[1]])
+
+    lat_step = (lat_max - lat_min) / resolution
+    lon_step = (lon_max - lon_min) / resolution
+
+    grid_size = resolution + (padding * 2) + 1
+    lats = lat_min - lat_step * padding + lat_step * np.arange(grid_size)
+    lons = lon_min - lon_step * padding + lon_step * np.arange(grid_size)
+
+    lat, lon = np.meshgrid(lats, lons, indexing="ij")
+    indptr, indices = _lattice_csr(grid_size, grid_size, RECT_OFFSETS, RECT_OFFSETS)
+    layout = {"lat0": lats[0], "lon0": lons[0], "dlat": lat_step, "dlon": lon_step}
+    grid = Grid(lat.ravel(), lon.ravel(), indptr, indices, (grid_size, grid_size), "rect", layout)
+    return grid if land is None else without_land(grid, land)
+
+
+def build_hex_grid(start, finish, spacing_km, land=None):
+    """ Array version of create_hexagonal_grid, same layout and 6-neighbor adjacency
+
+    Args:
+        start: starting point
+        finish: finishing point
+        spacing_km: distance between neighboring nodes
+        land: optional LandMask.LandMask, see without_land
+
+    Returns:
+        Grid, node id is row * num_cols + col unless land dropped nodes
+    """
+    lat_min, lat_max = sorted([start[0], finish[0]])
+    lon_min, lon_max = sorted([start[1], finish[1]])
+
+    center_lat = (lat_min + lat_max) / 2
+    dlat = spacing_km / 111.0
+    dlon = spacing_km / (111.0 * math.cos(math.radians(center_lat)))
+
+    row_height = dlat * math.sqrt(3) / 2
+    col_width = dlon
+
+    num_rows = int(np.ceil((lat_max - lat_min) / row_height)) + 1
+    num_cols = int(np.ceil((lon_max - lon_min) / col_width)) + 1
+
+    row, col = np.divmod(np.arange(num_rows * num_cols), num_cols)
+    lat = lat_min + row * row_height
+    lon = lon_min + col * col_width + np.where(row % 2 == 1, col_width / 2, 0)
+
+    indptr, indices = _lattice_csr(num_rows, num_cols, HEX_EVEN_OFFSETS, HEX_ODD_OFFSETS)
+    layout = {"lat0": lat_min, "lon0": lon_min, "dlat": row_height, "dlon": col_width}
+    grid = Grid(lat, lon, indptr, indices, (num_rows, num_cols), "hex", layout)
+    return grid if land is None else without_land(grid, land)
+
+
+def without_land(grid, land, mask=None):
+    """ Grid without the nodes on land and the edges that cross it
+
+    Nodes are tested with one is_water call and the remaining edges with
+    one leg_clear call, so the cost is a few raster lookups per edge.
+
+    Args:
+        grid: Grid
+        land: LandMask.LandMask
+        mask: optional bool array over nodes, only these are kept at all
+
+    Returns:
+        Grid, source_ids maps its ids back to grid
+    """
+    with stats.stage("grid.land"):
+        water = land.is_water(grid.lat, grid.lon)
+        if mask is not None:
+            water &= mask
+        sea = grid.subset(water)
+        src = np.repeat(np.arange(len(sea)), np.diff(sea.indptr))
+        clear = land.leg_clear(sea.lat[src], sea.lon[src], sea.lat[sea.indices], sea.lon[sea.indices])
+        sea = sea.keep_edges(clear)
+    stats.count("grid.land_nodes", len(grid) - len(sea))
+    stats.count("grid.land_edges", len(clear) - int(clear.sum()))
+    return sea
+
+
+class ImplicitGrid:
+    """ Rectangular lattice whose nodes and neighbors are computed on demand
+
+    Node id row * cols + col sits at (lat0 + row * dlat, lon0 + col * dlon).
+    Nothing is stored per node: positions and the 8 neighbors come from
+    index arithmetic, and new_state hands out dict-backed search state, so
+    memory grows only with the nodes a search actually reaches. With
+    wrap_lon the columns close around the globe.
+
+    Args:
+        lat0, lon0: position of node 0
+        dlat, dlon: lattice steps in degrees
+        rows, cols: lattice size
+        wrap_lon: connect the last column back to the first
+    """
+
+    kind = "rect"
+
+    def __init__(self, lat0, lon0, dlat, dlon, rows, cols, wrap_lon=False):
+        self.lat0, self.lon0 = float(lat0), float(lon0)
+        self.dlat, self.dlon = float(dlat), float(dlon)
+        self.rows, self.cols = int(rows), int(cols)
+        self.wrap_lon = wrap_lon
+        self.shape = (self.rows, self.cols)
+        self.layout = {"lat0": self.lat0, "lon0": self.lon0, "dlat": self.dlat, "dlon": self.dlon}
+
+    @classmethod
+    def global_grid(cls, spacing_deg, lat_limit=80.0):
+        """ Whole-globe lattice between +-lat_limit, wrapping in longitude """
+        rows = int(round(2 * lat_limit / spacing_deg)) + 1
+        cols = int(round(360.0 / spacing_deg))
+        return cls(-lat_limit, -180.0, spacing_deg, 360.0 / cols, rows, cols, wrap_lon=True)
+
+    def __len__(self):
+        return self.rows * self.cols
+
+    def positions(self, ids):
+        row, col = np.divmod(np.asarray(ids, dtype=np.int64), self.cols)
+        lon = self.lon0 + col * self.dlon
+        if self.wrap_lon:
+            lon = geo.wrap_lon(lon)
+        return self.lat0 + row * self.dlat, lon
+
+    def position(self, i):
+        lat, lon = self.positions(i)
+        return float(lat), float(lon)
+
+    def neighbors(self, i):
+        row, col = divmod(int(i), self.cols)
+        out = []
+        for drow, dcol in RECT_OFFSETS:
+            nrow, ncol = row + drow, col + dcol
+            if self.wrap_lon:
+                ncol %= self.cols
+            if 0 <= nrow < self.rows and 0 <= ncol < self.cols:
+                out.append(nrow * self.cols + ncol)
+        return np.array(out, dtype=np.int64)
+
+    def nearest(self, lat, lon):
+        lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+        row = np.clip(np.rint((lat - self.lat0) / self.dlat), 0, self.rows - 1).astype(np.int64)
+        dlon = geo.wrap_lon(lon - self.lon0) % 360 if self.wrap_lon else lon - self.lon0
+        col = np.rint(dlon / self.dlon).astype(np.int64)
+        col = col % self.cols if self.wrap_lon else np.clip(col, 0, self.cols - 1)
+        return (row * self.cols + col)[()]
+
+    def new_state(self):
+        return SparseSearchState()
+
+
+class SparseArray:
+    """ Dict-backed stand-in for a 1-D array, unset entries read as default """
+
+    def __init__(self, default, dtype):
+        self.default = default
+        self.dtype = dtype
+        self.values = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, idx):
+        if np.ndim(idx) == 0:
+            return self.values.get(int(idx), self.default)
+        return np.array([self.values.get(i, self.default) for i in np.asarray(idx).tolist()], dtype=self.dtype)
+
+    def __setitem__(self, idx, value):
+        if np.ndim(idx) == 0:
+            self.values[int(idx)] = value
+            return
+        idx = np.asarray(idx).tolist()
+        for i, v in zip(idx, np.broadcast_to(value, (len(idx),)).tolist()):
+            self.values[i] = v
+
+
+class SparseSearchState:
+    """ SearchState for implicit grids, holding only the nodes a search touched """
+
+    def __init__(self):
+        self.g = SparseArray(np.inf, np.float64)
+        self.parent = SparseArray(-1, np.int64)
+        self.closed = SparseArray(False, bool)
+
+
+def implicit_grid(start, finish, padding=5, resolution=50):
+    """ Lazy ImplicitGrid with the same lattice as build_grid """
+    lat_min, lat_max = sorted([start[0], finish[0]])
+    lon_min, lon_max = sorted([start[1], finish[1]])
+    lat_step = (lat_max - lat_min) / resolution
+    lon_step = (lon_max - lon_min) / resolution
+    grid_size = resolution + (padding * 2) + 1
+    return ImplicitGrid(lat_min - lat_step * padding, lon_min - lon_step * padding,
+                        lat_step, lon_step, grid_size, grid_size)
+
+
+@dataclass
+class GridRoute:
+    """ Result of a grid search
+
+    path holds (lat, lon) from start to finish and nodes the matching node
+    ids; both are empty and eta is None when the finish is unreachable.
+    """
+    path: list
+    nodes: list
+    eta: object
+    hours: float
+    expanded: int
+    pushed: int
+
+
+def nearest_node(grid, lat, lon):
+    """ Node id closest to (lat, lon) in plain degrees """
+    return int(grid.nearest(lat, lon))
+
+
+def leg_hours(polar, lat, lon, time, to_lat, to_lon, wind=None):
+    """ Hours to sail from one point to several others
+
+    Like node_weight / find_time_to, the boatspeed on each leg is taken
+    from the wind at the departure point at the departure time.
+
+    Args:
+        polar: Polars.Polar
+        lat, lon: departure point
+        time: departure datetime
+        to_lat, to_lon: arrays of destinations
+        wind: optional Weather.WindField, live API is used when None
+
+    Returns:
+        hours: array, inf where the boat does not move
+    """
+    if wind is None:
+        tws, twd = Weather.tws_twd(lat, lon, time)
+    else:
+        tws, twd = wind.tws_twd(lat, lon, time)
+    hdg = geo.rhumb_bearing(lat, lon, to_lat, to_lon)
+    bsp = polar.speed(tws, twd - hdg)
+    dist = geo.distance(lat, lon, to_lat, to_lon)
+    return np.where(bsp > 0, dist / np.where(bsp > 0, bsp, 1), np.inf)
+
+
+def node_speed_bounds(grid, polar, wind=None, start_time=None):
+    """ Upper bound on the boatspeed when leaving each node of a Grid
+
+    With a wind field the bound is the polar's best speed in the strongest
+    wind the node sees at any field time from start_time on; interpolation
+    never exceeds the samples, so it holds at every time in between.
+
+    Args:
+        grid: Grid
+        polar: Polars.Polar
+        wind: optional Weather.WindField, the polar's top speed is used when None
+        start_time: first departure of interest, all field times when None
+
+    Returns:
+        bsp: array over nodes
+    """
+    if wind is None:
+        return np.full(len(grid), polar.max_speed)
+    times = wind.times
+    if start_time is not None:
+        first = max(int(np.searchsorted(times, Weather.to_epoch(start_time), side="right")) - 1, 0)
+        times = times[first:]
+
+    tws_max = np.zeros(len(grid))
+    for t in times:
+        u, v = wind.uv(grid.lat, grid.lon, t)
+        np.maximum(tws_max, np.hypot(u, v), out=tws_max)
+    return polar.speed_bound(tws_max)
+
+
+def edge_lower_bounds(grid, polar, wind=None, start_time=None):
+    """ Time-independent lower bound in hours on every CSR edge of a Grid
+
+    Args:
+        grid: Grid
+        polar: Polars.Polar
+        wind: optional Weather.WindField
+        start_time: first departure of interest
+
+    Returns:
+        hours: array aligned with grid.indices
+    """
+    src = np.repeat(np.arange(len(grid)), np.diff(grid.indptr))
+    dist = geo.distance(grid.lat[src], grid.lon[src], grid.lat[grid.indices], grid.lon[grid.indices])
+    bsp = node_speed_bounds(grid, polar, wind, start_time)[src]
+    return np.where(bsp > 0, dist / np.where(bsp > 0, bsp, 1), np.inf)
+
+
+def cost_to_go(grid, finish_idx, polars, wind=None, start_time=None):
+    """ Backward Dijkstra from the finish over edge_lower_bounds
+
+    The result is a lower bound on the hours left from every node whatever
+    the departure time, so it can be computed once per destination and
+    passed to astar_grid as heuristic for any number of searches.
+
+    Args:
+        grid: Grid, ImplicitGrid has no edge list to precompute over
+        finish_idx: finish node id
+        polars: pandas dataframe or Polars.Polar
+        wind: optional Weather.WindField
+        start_time: earliest departure the table has to hold for
+
+    Returns:
+        hours: array over nodes, inf where the finish cannot be reached
+    """
+    if not hasattr(grid, "indptr"):
+        raise ValueError("cost_to_go needs a Grid with an edge list, not an ImplicitGrid")
+    polar = polars if isinstance(polars, Polar) else Polar.from_dataframe(polars)
+
+    with stats.stage("astar.cost_to_go"):
+        cost = edge_lower_bounds(grid, polar, wind, start_time)
+        src = np.repeat(np.arange(len(grid)), np.diff(grid.indptr))
+        order = np.argsort(grid.indices, kind="stable")
+        into_src, into_cost = src[order], cost[order]
+        into_ptr = np.zeros(len(grid) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(grid.indices, minlength=len(grid)), out=into_ptr[1:])
+
+        hours = np.full(len(grid), np.inf)
+        done = np.zeros(len(grid), dtype=bool)
+        hours[finish_idx] = 0.0
+        heap = [(0.0, finish_idx)]
+        while heap:
+            h, current = heapq.heappop(heap)
+            if done[current]:
+                continue
+            done[current] = True
+            lo, hi = into_ptr[current], into_ptr[current + 1]
+            prev = into_src[lo:hi]
+            tentative = h + into_cost[lo:hi]
+            better = tentative < hours[prev]
+            prev, tentative = prev[better], tentative[better]
+            hours[prev] = tentative
+            for idx, t in zip(prev.tolist(), tentative.tolist()):
+                heapq.heappush(heap, (t, idx))
+    return hours
+
+
+HEURISTICS = ("zero", "polar", "wind", "table")
+
+
+def astar_grid(grid, start_idx, finish_idx, polars, start_time, wind=None, heuristic="polar"):
+    """ Time-dependent A* over a Grid
+
+    g is elapsed hours, and an edge costs the time to sail it when leaving
+    at the arrival time of the current node. Every heuristic is a lower
+    bound on the hours left, so the route stays optimal:
+
+        zero: plain Dijkstra
+        polar: distance to the finish at the polar's top speed
+        wind: distance at the best speed reachable in the wind field's strongest wind
+        table: cost_to_go over the grid, per-node speed bounds from the wind field
+
+    A cost_to_go array can be passed instead of a name to reuse a table
+    across searches to the same finish. All search state is local, so
+    concurrent or repeated calls do not interfere.
+
+    Args:
+        grid: Grid or ImplicitGrid
+        start_idx: start node id
+        finish_idx: finish node id
+        polars: pandas dataframe or Polars.Polar
+        start_time: departure datetime
+        wind: optional Weather.WindField, live API is used when None
+        heuristic: one of HEURISTICS or a cost_to_go array
+
+    Returns:
+        GridRoute
+    """
+    polar = polars if isinstance(polars, Polar) else Polar.from_dataframe(polars)
+    state = grid.new_state()
+    finish_lat, finish_lon = grid.position(finish_idx)
+
+    table = None
+    if not isinstance(heuristic, str):
+        table = np.asarray(heuristic, dtype=np.float64)
+    elif heuristic == "table":
+        table = cost_to_go(grid, finish_idx, polar, wind, start_time)
+    elif heuristic == "zero":
+        top_speed = np.inf
+    elif heuristic == "polar" or (heuristic == "wind" and wind is None):
+        top_speed = polar.max_speed
+    elif heuristic == "wind":
+        top_speed = float(polar.speed_bound(np.hypot(wind.u, wind.v).max()))
+    else:
+        raise ValueError(f"heuristic must be one of {HEURISTICS} or an array, got {heuristic!r}")
+
+    def h(idx):
+        if table is not None:
+            return table[idx]
+        lat, lon = grid.positions(idx)
+        return geo.distance(lat, lon, finish_lat, finish_lon) / top_speed
+
+    state.g[start_idx] = 0.0
+    open_heap = [(h(start_idx), 0, start_idx)]
+    pushed = 1
+    expanded = 0
+
+    with stats.stage("astar.search"):
+        while open_heap:
+            _, _, current = heapq.heappop(open_heap)
+            if state.closed[current]:
+                continue
+            state.closed[current] = True
+            expanded += 1
+
+            if current == finish_idx:
+                break
+
+            neighbors = grid.neighbors(current)
+            neighbors = neighbors[~state.closed[neighbors]]
+            if len(neighbors) == 0:
+                continue
+
+            g_cur = state.g[current]
+            lat, lon = grid.position(current)
+            with stats.stage("astar.edge_costs"):
+                cost = leg_hours(polar, lat, lon, start_time + timedelta(hours=float(g_cur)),
+                                 *grid.positions(neighbors), wind)
+            tentative = g_cur + cost
+            better = tentative < state.g[neighbors]
+            neighbors, tentative = neighbors[better], tentative[better]
+
+            state.g[neighbors] = tentative
+            state.parent[neighbors] = current
+            for idx, f in zip(neighbors.tolist(), (tentative + h(neighbors)).tolist()):
+                heapq.heappush(open_heap, (f, pushed, idx))
+                pushed += 1
+
+    stats.count("astar.expanded", expanded)
+    stats.count("astar.pushed", pushed)
+    if not state.closed[finish_idx]:
+        return GridRoute([], [], None, float("inf"), expanded, pushed)
+
+    route = [finish_idx]
+    while route[-1] != start_idx:
+        route.append(int(state.parent[route[-1]]))
+    route.reverse()
+
+    hours = float(state.g[finish_idx])
+    path = [grid.position(i) for i in route]
+    return GridRoute(path, route, start_time + timedelta(hours=hours), hours, expanded, pushed)
+
+
+@dataclass
+class HierarchicalRoute:
+    """ Result of route_hierarchical
+
+    levels has one dict per resolution (resolution, nodes, expanded, hours).
+    When a full fine-grid solve was requested, full holds its GridRoute and
+    quality compares it with the corridor solution.
+    """
+    route: object
+    levels: list
+    expanded: int
+    full: object = None
+    quality: dict = None
+
+
+def corridor_mask(grid, path, corridor_nm):
+    """ Nodes of a full rect Grid lying within corridor_nm (box distance) of a path
+
+    The path is densified to half the lattice step and each sample marks the
+    lattice window around it, so the cost is independent of the grid size.
+
+    Args:
+        grid: Grid from build_grid
+        path: list of (lat, lon)
+        corridor_nm: half width of the corridor in nautical miles
+
+    Returns:
+        mask: bool array over grid nodes
+    """
+    rows, cols = grid.shape
+    lay = grid.layout
+    path = np.asarray(path, dtype=np.float64)
+
+    samples = [path[:1]]
+    for a, b in zip(path[:-1], path[1:]):
+        n = int(np.ceil(max(abs(b[0] - a[0]) / lay["dlat"], abs(b[1] - a[1]) / lay["dlon"]) * 2)) + 1
+        samples.append(a + (b - a) * np.linspace(0, 1, n)[1:, None])
+    samples = np.concatenate(samples)
+
+    half_lat = corridor_nm / 60.0
+    half_lon = corridor_nm / (60.0 * np.cos(np.radians(samples[:, 0])))
+    r0 = np.clip(np.floor((samples[:, 0] - half_lat - lay["lat0"]) / lay["dlat"]), 0, rows - 1).astype(int)
+    r1 = np.clip(np.ceil((samples[:, 0] + half_lat - lay["lat0"]) / lay["dlat"]), 0, rows - 1).astype(int)
+    c0 = np.clip(np.floor((samples[:, 1] - half_lon - lay["lon0"]) / lay["dlon"]), 0, cols - 1).astype(int)
+    c1 = np.clip(np.ceil((samples[:, 1] + half_lon - lay["lon0"]) / lay["dlon"]), 0, cols - 1).astype(int)
+
+    mask = np.zeros((rows, cols), dtype=bool)
+    for a, b, c, d in zip(r0.tolist(), r1.tolist(), c0.tolist(), c1.tolist()):
+        mask[a:b + 1, c:d + 1] = True
+    return mask.ravel()
+
+
+def route_hierarchical(start, finish, polars, start_time, resolutions=(25, 50, 100, 200), padding=5, corridor_nm=None, wind=None, compare=False, heuristic="polar", land=None, corridor_cells=1.5):
+    """ Coarse-to-fine grid routing inside a corridor around the previous level's path
+
+    The first resolution is solved on the whole build_grid box. Every later
+    resolution only keeps the nodes near the path found one level up, so
+    the finer searches only touch a narrow band of the box. By default the
+    band is corridor_cells lattice steps of the previous level on each side
+    of its path, which is how far that path can be off the finer optimum,
+    so the band narrows as the levels get finer.
+
+    Args:
+        start: starting point
+        finish: finishing point
+        polars: pandas dataframe or Polars.Polar
+        start_time: departure datetime
+        resolutions: increasing build_grid resolutions
+        padding: build_grid padding at the coarsest level, scaled up with resolution
+        corridor_nm: fixed half width of the corridor, overrides corridor_cells
+        wind: optional Weather.WindField, live API is used when None
+        compare: also solve the finest resolution on the full grid and report the difference
+        heuristic: see astar_grid, a name since tables are per grid
+        land: optional LandMask.LandMask, see without_land
+        corridor_cells: half width of the corridor in previous-level lattice steps
+
+    Returns:
+        HierarchicalRoute
+    """
+    polar = polars if isinstance(polars, Polar) else Polar.from_dataframe(polars)
+    coslat = np.cos(np.radians(max(abs(start[0]), abs(finish[0]))))
+    levels = []
+    route = None
+    half_width = None
+
+    for resolution in resolutions:
+        level_padding = int(np.ceil(padding * resolution / resolutions[0]))
+        grid = build_grid(start, finish, level_padding, resolution)
+        mask = None if route is None else corridor_mask(grid, route.path, half_width)
+        step_nm = 60.0 * max(grid.layout["dlat"], grid.layout["dlon"] * coslat)
+        half_width = corridor_nm or corridor_cells * step_nm
+        if land is not None:
+            grid = without_land(grid, land, mask)
+        elif mask is not None:
+            grid = grid.subset(mask)
+
+        route = astar_grid(grid, nearest_node(grid, *start), nearest_node(grid, *finish), polar, start_time, wind, heuristic)
+        levels.append({"resolution": resolution, "nodes": len(grid), "expanded": route.expanded, "hours": route.hours})
+        if route.eta is None:
+            break
+
+    result = HierarchicalRoute(route, levels, sum(level["expanded"] for level in levels))
+    if compare:
+        resolution = levels[-1]["resolution"]
+        grid = build_grid(start, finish, int(np.ceil(padding * resolution / resolutions[0])), resolution, land)
+        full = astar_grid(grid, nearest_node(grid, *start), nearest_node(grid, *finish), polar, start_time, wind, heuristic)
+        result.full = full
+        result.quality = {
+            "hours": route.hours,
+            "full_hours": full.hours,
+            "extra_hours": route.hours - full.hours,
+            "extra_pct": 100.0 * (route.hours - full.hours) / full.hours,
+            "expanded": result.expanded,
+            "full_expanded": full.expanded,
+            "expansion_ratio": full.expanded / max(result.expanded, 1),
+        }
+    return result
+
+
 def grid_visualize_hex(start, finish, nodes):
+    with stats.stage("render"):
+        _grid_visualize_hex(start, finish, nodes)
+
+
+def _grid_visualize_hex(start, finish, nodes):
+    import folium
     m = folium.Map(location=start, zoom_start=6)
 
     for node in nodes:
@@ -335,13 +1144,16 @@ def grid_visualize_hex(start, finish, nodes):
 
 
 if __name__ == "__main__":
+    import sys
+    import Export
+    import LandMask
 
-    nodes, node_lookup = create_hexagonal_grid((5, 9), (15, 15), spacing_km=10)
+    # optional coastline file (e.g. Natural Earth land polygons), most of this box is Nigeria and Cameroon
+    land = LandMask.LandMask.read(sys.argv[1]) if len(sys.argv) > 1 else None
+    grid = build_hex_grid((5, 9), (15, 15), spacing_km=10, land=land)
 
     # Find start and finish nodes
-    start_node = find_closest_node_hex(node_lookup, 5, 9)
-    finish_node = find_closest_node_hex(node_lookup, 15, 15)
-
-
+    start_node = grid.nearest(5, 9)
+    finish_node = grid.nearest(15, 15)
 
-    grid_visualize_hex((5, 9), (15, 15), nodes)
\ No newline at end of file
+    Export.write_map('route_grid_hex.html', (5, 9), (15, 15), grid=grid)
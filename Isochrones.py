@@ -1,13 +1,18 @@
 import Functions as func
-import folium
+import Geodesy as geo
+import Weather
 import numpy as np
+from dataclasses import dataclass
+from datetime import timedelta
+from Polars import Polar, PolarStack
+from Stats import stats
 
 
-def find_isochrone_line(polars, cur_time, lat, lon, h_step, dt=1):
+def find_isochrone_line(polars, cur_time, lat, lon, h_step, dt=1, wind=None):
 
     isochrone = []
     for hdg in range(0, 360, h_step):
-        bsp = func.find_speed_at(polars, cur_time, lat, lon, hdg)
+        bsp = func.find_speed_at(polars, cur_time, lat, lon, hdg, wind)
 
         if bsp <= 0:
             continue
@@ -27,7 +32,7 @@ def find_isochrone_line(polars, cur_time, lat, lon, h_step, dt=1):
     return isochrone
 
 
-def find_limited_isochrone(polars, cur_time, lat, lon, dt, endlat, endlon, h_step, max_dev=60):
+def find_limited_isochrone(polars, cur_time, lat, lon, dt, endlat, endlon, h_step, max_dev=60, wind=None):
     isochrone = []
     end_bearing = func.rhumb_bearing(lat, lon, endlat, endlon)
 
@@ -35,7 +40,7 @@ def find_limited_isochrone(polars, cur_time, lat, lon, dt, endlat, endlon, h_ste
     min_hdg = int(end_bearing - max_dev)
 
     for hdg in range(min_hdg, max_hdg, h_step):
-        bsp = func.find_speed_at(polars, cur_time, lat, lon, hdg)
+        bsp = func.find_speed_at(polars, cur_time, lat, lon, hdg, wind)
         if bsp <= 0:
             continue
 
@@ -54,8 +59,8 @@ def find_limited_isochrone(polars, cur_time, lat, lon, dt, endlat, endlon, h_ste
     return isochrone
 
 
-def build_isochrones(polars, start_time, start_lat, start_lon,  endlat, endlon, dt_hours=6, h_step=30, max_dev=60, steps=5):
-    isochrones = [find_isochrone_line(polars, start_time, start_lat, start_lon, h_step, dt=1)]
+def build_isochrones(polars, start_time, start_lat, start_lon,  endlat, endlon, dt_hours=6, h_step=30, max_dev=60, steps=5, wind=None):
+    isochrones = [find_isochrone_line(polars, start_time, start_lat, start_lon, h_step, dt=1, wind=wind)]
     cur_points = [{'lat': start_lat,'lon': start_lon,'time': start_time}]
 
     for step in range(steps-1):
@@ -63,22 +68,18 @@ def build_isochrones(polars, start_time, start_lat, start_lon,  endlat, endlon,
         N_KEEP = 100
         keep_steps = int(len(cur_points) / N_KEEP) + 5
 
-        for point in cur_points[::keep_steps]:
-            lat, lon, time = point['lat'], point['lon'], point['time']
-            line = find_limited_isochrone(polars, time, lat, lon, dt_hours, endlat, endlon, h_step)
-        
-            next_points.extend(line)
-
-        dists = [
-        func.find_distance((start_lat, start_lon), (p['lat'], p['lon']))
-        for p in next_points]
+        stats.count("isochrones.steps")
+        with stats.stage("isochrones.expand"):
+            for point in cur_points[::keep_steps]:
+                lat, lon, time = point['lat'], point['lon'], point['time']
+                line = find_limited_isochrone(polars, time, lat, lon, dt_hours, endlat, endlon, h_step, wind=wind)
+            
+                next_points.extend(line)
 
-        keep_idx = func.indices_of_max_n(dists, N_KEEP)
+        lats = np.array([p['lat'] for p in next_points])
+        lons = np.array([p['lon'] for p in next_points])
+        keep_idx = sector_keep(start_lat, start_lon, lats, lons, N_KEEP)
         next_points = [next_points[i] for i in keep_idx]
-        angles = [func.rhumb_bearing(start_lat, start_lon, p['lat'], p['lon']) for p in next_points]
-        
-        sorted_indices = sorted(range(len(next_points)), key=lambda i: angles[i])
-        next_points = [next_points[i] for i in sorted_indices]
 
         isochrones.append(next_points)
         cur_points = next_points
@@ -86,12 +87,388 @@ def build_isochrones(polars, start_time, start_lat, start_lon,  endlat, endlon,
     return isochrones
 
 
+@dataclass
+class Front:
+    """ One isochrone kept as columnar arrays
+
+    parent indexes the point of the previous front each point was reached
+    from (-1 for the start), so routes can be walked back without copies.
+    boat is the PolarStack index of each point in fleet mode, else None.
+    """
+    time: object
+    lat: np.ndarray
+    lon: np.ndarray
+    hdg: np.ndarray
+    bsp: np.ndarray
+    parent: np.ndarray
+    boat: np.ndarray = None
+
+    def __len__(self):
+        return len(self.lat)
+
+    def take(self, idx):
+        """ Subset of the front in the order of idx """
+        boat = None if self.boat is None else self.boat[idx]
+        return Front(self.time, self.lat[idx], self.lon[idx], self.hdg[idx], self.bsp[idx], self.parent[idx], boat)
+
+
+@dataclass
+class IsochroneRoute:
+    """ Result of route_isochrones
+
+    route is a list of (lat, lon, time) from start to finish, eta is None
+    when the finish was not reached within max_steps.
+    """
+    fronts: list
+    route: list
+    eta: object
+
+
+def start_front(start_time, lat, lon, boats=None):
+    """ Front holding only the starting point, once per boat when boats is given """
+    one = np.zeros(1 if boats is None else boats)
+    boat = None if boats is None else np.arange(boats)
+    return Front(start_time, one + lat, one + lon, one * np.nan, one * np.nan, np.full(len(one), -1), boat)
+
+
+def front_wind(front, wind=None):
+    """ tws, twd at every point of a front, one live API call per point when wind is None
+
+    With a Weather.EnsembleWindField the front's boat column picks the
+    member, so route_fleet can run one lane per ensemble member.
+    """
+    if isinstance(wind, Weather.EnsembleWindField):
+        if front.boat is None:
+            raise ValueError("an EnsembleWindField needs a fleet front whose boat column is the member")
+        return wind.tws_twd(front.lat, front.lon, front.time, member=front.boat)
+    if wind is not None:
+        return wind.tws_twd(front.lat, front.lon, front.time)
+    with stats.stage("isochrones.wind"):
+        samples = [Weather.tws_twd(lat, lon, front.time) for lat, lon in zip(front.lat, front.lon)]
+    tws, twd = np.array(samples, dtype=np.float64).reshape(-1, 2).T
+    return tws, twd
+
+
+SAMPLING = ("fan", "vmg")
+
+
+def vmg_headings(polar, bearing, tws, twd, h_step=5, max_dev=60, boat=None):
+    """ Candidate headings that can be optimal, per front point
+
+    On each tack, true wind angles run from the polar's optimal upwind to
+    its optimal downwind angle about every h_step degrees; tighter or
+    deeper angles are beaten by tacking or gybing and are skipped. The
+    direct bearing is added when it is sailable in that range. Headings
+    further than max_dev from the bearing are masked out.
+
+    Args:
+        polar: Polars.Polar
+        bearing: rhumb bearing to the finish per point
+        tws, twd: wind per point
+        h_step: approximate angle step in degrees
+        max_dev: half width of the allowed heading window
+        boat: boat index per point when polar is a PolarStack
+
+    Returns:
+        hdg: headings (n_points, n_headings)
+        twa: signed true wind angles, twd - hdg
+        ok: mask of headings to evaluate
+    """
+    bearing, tws, twd = (np.reshape(a, (-1, 1)) for a in (bearing, tws, twd))
+    if boat is None:
+        up, _, down, _ = polar.optimal_angles(tws)
+        span = np.full(tws.shape, polar.down_twa.max() - polar.up_twa.min())
+    else:
+        boat = np.reshape(boat, (-1, 1))
+        up, _, down, _ = polar.optimal_angles(tws, boat)
+        span = (polar.down_twa.max(axis=1) - polar.up_twa.min(axis=1))[boat]
+    # fan size per boat, so a boat gets the same headings in a fleet as alone
+    k = np.ceil(span / h_step).astype(int) + 1
+    step = np.arange(k.max())
+    fan = up + (down - up) * np.minimum(step / (k - 1), 1.0)
+
+    direct = (twd - bearing + 180) % 360 - 180
+    twa = np.concatenate([fan, -fan, direct], axis=1)
+    hdg = (twd - twa) % 360
+
+    ok = np.abs((hdg - bearing + 180) % 360 - 180) <= max_dev
+    ok[:, :-1] &= np.tile(step < k, 2)
+    ok[:, -1] = (np.abs(direct[:, 0]) >= up[:, 0]) & (np.abs(direct[:, 0]) <= down[:, 0])
+    return hdg, twa, ok
+
+
+def expand_front(polar, front, tws, twd, dt_hours, endlat, endlon, h_step=5, max_dev=60, geo_mode="spherical", sampling="fan", land=None):
+    """ Advances every point of a front over a set of headings in one array pass
+
+    The default "fan" covers [-max_dev, max_dev) around each point's rhumb
+    bearing every h_step degrees. With sampling="vmg" headings come from
+    vmg_headings, so no speed is evaluated in the no-go zone or past the
+    best gybing angle. Either way a points x headings matrix of speeds and
+    destinations is computed.
+
+    Args:
+        polar: Polars.Polar, or Polars.PolarStack for a fleet front
+        front: Front to expand
+        tws, twd: wind at each front point
+        dt_hours: length of the step
+        endlat, endlon: finish
+        h_step: heading step in degrees
+        max_dev: half width of the heading fan in degrees
+        geo_mode: Geodesy mode
+        sampling: one of SAMPLING
+        land: optional LandMask.LandMask, candidates whose leg crosses land are dropped
+
+    Returns:
+        Front of all candidates with bsp > 0
+    """
+    stats.count("isochrones.steps")
+    bearing = geo.rhumb_bearing(front.lat, front.lon, endlat, endlon)
+    tws, twd = np.reshape(tws, (-1, 1)), np.reshape(twd, (-1, 1))
+    if sampling == "vmg":
+        hdg, twa, ok = vmg_headings(polar, bearing, tws, twd, h_step, max_dev, front.boat)
+    elif sampling == "fan":
+        offsets = np.arange(-max_dev, max_dev, h_step, dtype=np.float64)
+        hdg = (np.reshape(bearing, (-1, 1)) + offsets) % 360
+        twa, ok = twd - hdg, np.ones(hdg.shape, dtype=bool)
+    else:
+        raise ValueError(f"sampling must be one of {SAMPLING}, got {sampling!r}")
+
+    rows = np.broadcast_to(np.arange(len(front))[:, None], hdg.shape)[ok]
+    hdg = hdg[ok]
+    with stats.stage("isochrones.polar"):
+        if front.boat is None:
+            bsp = polar.speed(tws[rows, 0], twa[ok])
+        else:
+            bsp = polar.speed(tws[rows, 0], twa[ok], front.boat[rows])
+    moving = bsp > 0
+    rows, hdg, bsp = rows[moving], hdg[moving], bsp[moving]
+
+    with stats.stage("isochrones.geodesy"):
+        lat, lon = geo.destination(front.lat[rows], front.lon[rows], hdg, bsp * dt_hours, geo_mode)
+    if land is not None:
+        clear = land.leg_clear(front.lat[rows], front.lon[rows], lat, lon)
+        stats.count("isochrones.grounded", len(clear) - int(clear.sum()))
+        rows, hdg, bsp, lat, lon = rows[clear], hdg[clear], bsp[clear], lat[clear], lon[clear]
+    boat = None if front.boat is None else front.boat[rows]
+    return Front(front.time + timedelta(hours=dt_hours), lat, lon, hdg, bsp, rows, boat)
+
+
+def sector_keep(start_lat, start_lon, lats, lons, n_sectors=100, group=None):
+    """ Indices of the furthest point in each bearing sector around the start
+
+    Candidates are binned into n_sectors equal bearing sectors seen from the
+    start and the one furthest from the start wins its sector, in a single
+    linear pass. Empty sectors are skipped, so at most n_sectors indices come
+    back, ordered by bearing. With group, every group (boat) gets its own
+    n_sectors and results are ordered by group, then bearing.
+
+    Args:
+        start_lat, start_lon: start
+        lats, lons: candidate arrays
+        n_sectors: number of bearing sectors
+        group: optional non-negative int label per candidate
+
+    Returns:
+        keep: array of indices
+    """
+    n = len(lats)
+    if n == 0:
+        return np.zeros(0, dtype=np.intp)
+    with stats.stage("isochrones.prune"):
+        bearing = geo.rhumb_bearing(start_lat, start_lon, lats, lons)
+        dists = geo.distance(start_lat, start_lon, lats, lons)
+        sector = (np.asarray(bearing) * (n_sectors / 360.0)).astype(np.intp) % n_sectors
+        n_bins = n_sectors
+        if group is not None:
+            sector = sector + np.asarray(group, dtype=np.intp) * n_sectors
+            n_bins = n_sectors * (int(np.max(group)) + 1)
+
+        best = np.full(n_bins, -np.inf)
+        np.maximum.at(best, sector, dists)
+        winners = np.flatnonzero(dists == best[sector])
+
+        first = np.full(n_bins, n)
+        np.minimum.at(first, sector[winners], winners)
+        keep = first[first < n]
+    stats.count("isochrones.candidates", n)
+    stats.count("isochrones.pruned", n - len(keep))
+    stats.record("isochrones.candidates", n)
+    stats.record("isochrones.pruned", n - len(keep))
+    return keep
+
+
+def prune_sectors(front, start_lat, start_lon, n_sectors=100):
+    """ Front reduced to the furthest candidate per bearing sector, see sector_keep """
+    return front.take(sector_keep(start_lat, start_lon, front.lat, front.lon, n_sectors, front.boat))
+
+
+def build_isochrone_fronts(polars, start_time, start_lat, start_lon, endlat, endlon, dt_hours=6, h_step=5, max_dev=60, steps=5, n_sectors=100, wind=None, sampling="fan", land=None):
+    """ Array version of build_isochrones, every frontier point is expanded
+
+    Args:
+        polars: pandas dataframe or Polars.Polar
+        start_time: datetime
+        start_lat, start_lon: start
+        endlat, endlon: finish
+        dt_hours: hours per step
+        h_step: heading step in degrees
+        max_dev: half width of the heading fan in degrees
+        steps: number of fronts including the start
+        n_sectors: bearing sectors kept after each step, bounds the frontier size
+        wind: optional Weather.WindField, live API is used when None
+        sampling: heading sampling of expand_front
+        land: optional LandMask.LandMask, legs crossing land are discarded
+
+    Returns:
+        fronts: list of Front
+    """
+    polar = polars if isinstance(polars, Polar) else Polar.from_dataframe(polars)
+    _check_water(land, (start_lat, start_lon), (endlat, endlon))
+    fronts = [start_front(start_time, start_lat, start_lon)]
+
+    for step in range(steps - 1):
+        tws, twd = front_wind(fronts[-1], wind)
+        candidates = expand_front(polar, fronts[-1], tws, twd, dt_hours, endlat, endlon, h_step, max_dev, sampling=sampling, land=land)
+        if len(candidates) == 0:
+            break
+        fronts.append(prune_sectors(candidates, start_lat, start_lon, n_sectors))
+
+    return fronts
+
+
+def reconstruct_route(fronts, idx):
+    """ Walks parent indices back from point idx of the last front
+
+    Returns:
+        route: list of (lat, lon, time) from the start
+    """
+    route = []
+    for front in reversed(fronts):
+        route.append((float(front.lat[idx]), float(front.lon[idx]), front.time))
+        idx = front.parent[idx]
+    return route[::-1]
+
+
+def _check_water(land, *points):
+    """ Raises ValueError when a (lat, lon) lies on land, every leg from it would be dropped """
+    for lat, lon in points:
+        if land is not None and land.is_land(lat, lon):
+            raise ValueError(f"({lat}, {lon}) is on land in the mask, move it offshore or use a finer resolution")
+
+
+def _blocked(hours, front, endlat, endlon, dt_hours, land):
+    """ Arrival hours with legs to the finish that cross land set to inf, only those within dt_hours are checked """
+    if land is None:
+        return hours
+    near = np.flatnonzero(hours <= dt_hours)
+    if len(near):
+        hours = hours.copy()
+        hours[near[~land.leg_clear(front.lat[near], front.lon[near], endlat, endlon)]] = np.inf
+    return hours
+
+
+def route_isochrones(polars, start_time, start_lat, start_lon, endlat, endlon, dt_hours=6, h_step=5, max_dev=60, max_steps=100, n_sectors=100, wind=None, sampling="fan", land=None):
+    """ Runs isochrones until the finish can be reached within one step
+
+    Arrival is checked from every frontier point sailing straight at the
+    finish with the wind at that point. With land, neither the steps nor
+    that last leg may cross it.
+
+    Returns:
+        IsochroneRoute
+    """
+    polar = polars if isinstance(polars, Polar) else Polar.from_dataframe(polars)
+    _check_water(land, (start_lat, start_lon), (endlat, endlon))
+    fronts = [start_front(start_time, start_lat, start_lon)]
+
+    for step in range(max_steps):
+        front = fronts[-1]
+        tws, twd = front_wind(front, wind)
+
+        hdg = geo.rhumb_bearing(front.lat, front.lon, endlat, endlon)
+        bsp = polar.speed(tws, twd - hdg)
+        hours = np.where(bsp > 0, geo.rhumb_distance(front.lat, front.lon, endlat, endlon) / np.where(bsp > 0, bsp, 1), np.inf)
+        hours = _blocked(hours, front, endlat, endlon, dt_hours, land)
+        best = int(np.argmin(hours))
+        if hours[best] <= dt_hours:
+            eta = front.time + timedelta(hours=float(hours[best]))
+            route = reconstruct_route(fronts, best) + [(endlat, endlon, eta)]
+            return IsochroneRoute(fronts, route, eta)
+
+        candidates = expand_front(polar, front, tws, twd, dt_hours, endlat, endlon, h_step, max_dev, sampling=sampling, land=land)
+        if len(candidates) == 0:
+            break
+        fronts.append(prune_sectors(candidates, start_lat, start_lon, n_sectors))
+
+    return IsochroneRoute(fronts, [], None)
+
+
+def route_fleet(polars, start_time, start_lat, start_lon, endlat, endlon, dt_hours=6, h_step=5, max_dev=60, max_steps=100, n_sectors=100, wind=None, sampling="fan", land=None):
+    """ route_isochrones for several boats in one pass over shared fronts
+
+    Every front holds the points of all boats still racing, tagged with
+    their boat index, so wind lookups, polar evaluations, geodesy and sector
+    pruning run once per step over one array for the whole fleet. Each
+    boat keeps n_sectors points of its own and leaves the fronts when it
+    can reach the finish, giving the same route as routing it alone.
+
+    Args:
+        polars: Polars.PolarStack, or a list of Polar, dataframes or csv paths
+        other args: as route_isochrones
+
+    Returns:
+        routes: list of IsochroneRoute, one per boat in polars order
+    """
+    stack = polars if isinstance(polars, PolarStack) else PolarStack(polars)
+    _check_water(land, (start_lat, start_lon), (endlat, endlon))
+    n_boats = len(stack)
+    fronts = [start_front(start_time, start_lat, start_lon, n_boats)]
+    routes = [None] * n_boats
+    done = np.zeros(n_boats, dtype=bool)
+
+    for step in range(max_steps):
+        front = fronts[-1]
+        tws, twd = front_wind(front, wind)
+
+        hdg = geo.rhumb_bearing(front.lat, front.lon, endlat, endlon)
+        bsp = stack.speed(tws, twd - hdg, front.boat)
+        hours = np.where(bsp > 0, geo.rhumb_distance(front.lat, front.lon, endlat, endlon) / np.where(bsp > 0, bsp, 1), np.inf)
+        hours = _blocked(hours, front, endlat, endlon, dt_hours, land)
+        best = np.full(n_boats, np.inf)
+        np.minimum.at(best, front.boat, hours)
+        for boat in np.flatnonzero((best <= dt_hours) & ~done).tolist():
+            idx = int(np.flatnonzero((front.boat == boat) & (hours == best[boat]))[0])
+            eta = front.time + timedelta(hours=float(hours[idx]))
+            route = reconstruct_route(fronts, idx) + [(endlat, endlon, eta)]
+            routes[boat] = IsochroneRoute(list(fronts), route, eta)
+            done[boat] = True
+        if done.all():
+            break
+
+        candidates = expand_front(stack, front, tws, twd, dt_hours, endlat, endlon, h_step, max_dev, sampling=sampling, land=land)
+        candidates = candidates.take(np.flatnonzero(~done[candidates.boat]))
+        if len(candidates) == 0:
+            break
+        fronts.append(prune_sectors(candidates, start_lat, start_lon, n_sectors))
+
+    return [route or IsochroneRoute(list(fronts), [], None) for route in routes]
+
+
 def iso_visualize(start, end, isochrones):
+    with stats.stage("render"):
+        _iso_visualize(start, end, isochrones)
+
+
+def _iso_visualize(start, end, isochrones):
+    import folium
     m = folium.Map(location=start, zoom_start=6)
     
     for step_idx, isochrone in enumerate(isochrones):
         
-        coords = [(p['lat'], p['lon']) for p in isochrone]
+        if isinstance(isochrone, Front):
+            coords = list(zip(isochrone.lat.tolist(), isochrone.lon.tolist()))
+        else:
+            coords = [(p['lat'], p['lon']) for p in isochrone]
         folium.PolyLine(coords, color="blue", weight=3, opacity=0.7).add_to(m)
 
     folium.Marker(start, popup="Start", icon=folium.Icon(color="green")).add_to(m)
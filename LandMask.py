@@ -0,0 +1,325 @@
+""" Land and exclusion zones as a bit raster for O(1) water checks
+
+Coastline polygons (GeoJSON, or shapefiles through the optional pyshp
+package) are rasterized once onto a regular lat/lon lattice and stored
+packed eight cells to a byte, so a global mask at 0.01 degrees is about
+80 MB and loads memory-mapped. Lookups are index arithmetic on arrays of
+points:
+
+    land = LandMask.read("ne_10m_land.geojson", resolution=0.02)
+    land.is_water(lats, lons)                  # bool per point
+    land.leg_clear(lat1, lon1, lat2, lon2)     # bool per leg
+
+Points outside the raster count as water, so a regional mask can be used
+for routes that leave its box.
+"""
+import json
+import os
+import numpy as np
+from Stats import stats
+
+CHUNK = 1 << 16
+BLOCK = 16
+
+
+class LandMask:
+    """ Bit raster of land cells on a regular lat/lon lattice
+
+    Cell (row, col) covers lat0 + row * dlat to lat0 + (row + 1) * dlat and
+    likewise in longitude; it is land when its centre lies inside a polygon.
+
+    Args:
+        bits: packed land cells (rows, ceil(cols / 8)) uint8, see np.packbits
+        lat0, lon0: south-west corner of the raster
+        dlat, dlon: cell size in degrees
+        cols: number of cells per row
+    """
+
+    def __init__(self, bits, lat0, lon0, dlat, dlon, cols):
+        self.bits = bits
+        self.lat0 = float(lat0)
+        self.lon0 = float(lon0)
+        self.dlat = float(dlat)
+        self.dlon = float(dlon)
+        self.cols = int(cols)
+        self._blocks = None
+
+    @property
+    def shape(self):
+        return self.bits.shape[0], self.cols
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    @classmethod
+    def from_array(cls, land, lat0, lon0, dlat, dlon):
+        """ Mask from a (rows, cols) bool array, row 0 in the south """
+        land = np.asarray(land, dtype=bool)
+        return cls(np.packbits(land, axis=1), lat0, lon0, dlat, dlon, land.shape[1])
+
+    @classmethod
+    def from_polygons(cls, polygons, resolution=0.05, bounds=None):
+        """ Rasterizes polygons, cells whose centre is inside become land
+
+        Each polygon is filled with the even-odd rule over its own rings, so
+        holes (lakes, lagoons) stay water while overlapping polygons still
+        add up to land.
+
+        Args:
+            polygons: list of polygons, each a list of rings of (lon, lat) points
+            resolution: cell size in degrees
+            bounds: (lat_min, lat_max, lon_min, lon_max) of the raster, the
+                extent of the polygons when None
+
+        Returns:
+            LandMask
+        """
+        polygons = [[np.asarray(ring, dtype=np.float64).reshape(len(ring), -1)[:, :2] for ring in rings if len(ring)]
+                    for rings in polygons]
+        if bounds is None:
+            points = np.concatenate([ring for rings in polygons for ring in rings]) if polygons else np.zeros((1, 2))
+            bounds = (points[:, 1].min(), points[:, 1].max(), points[:, 0].min(), points[:, 0].max())
+        lat_min, lat_max, lon_min, lon_max = bounds
+        rows = max(int(np.ceil((lat_max - lat_min) / resolution)), 1)
+        cols = max(int(np.ceil((lon_max - lon_min) / resolution)), 1)
+
+        land = np.zeros((rows, cols), dtype=bool)
+        with stats.stage("land.rasterize"):
+            for rings in polygons:
+                _fill(land, rings, lat_min, lon_min, resolution)
+        return cls.from_array(land, lat_min, lon_min, resolution, resolution)
+
+    @classmethod
+    def from_geojson(cls, path, resolution=0.05, bounds=None):
+        """ Rasterizes the Polygon and MultiPolygon geometries of a GeoJSON file, see from_polygons """
+        with open(path) as f:
+            data = json.load(f)
+        return cls.from_polygons(_geojson_polygons(data), resolution, bounds)
+
+    @classmethod
+    def from_shapefile(cls, path, resolution=0.05, bounds=None):
+        """ Rasterizes the polygon shapes of a shapefile, needs pyshp
+
+        Rings of one shape are filled together, so holes stay water.
+        """
+        import shapefile
+        polygons = []
+        with shapefile.Reader(path) as reader:
+            for shape in reader.iterShapes():
+                if not shape.points:
+                    continue
+                ends = list(shape.parts[1:]) + [len(shape.points)]
+                polygons.append([shape.points[a:b] for a, b in zip(shape.parts, ends)])
+        return cls.from_polygons(polygons, resolution, bounds)
+
+    def save(self, directory):
+        """ Writes the mask as .npy arrays so it can be memory-mapped on load
+
+        Args:
+            directory: folder to write into, created if missing
+        """
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "bits.npy"), np.asarray(self.bits))
+        layout = np.array([self.lat0, self.lon0, self.dlat, self.dlon, self.cols], dtype=np.float64)
+        np.save(os.path.join(directory, "layout.npy"), layout)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        """ Reads a mask written by save
+
+        Args:
+            directory: folder written by save
+            mmap_mode: np.load mmap mode, None reads into memory
+
+        Returns:
+            LandMask
+        """
+        bits = np.load(os.path.join(directory, "bits.npy"), mmap_mode=mmap_mode)
+        lat0, lon0, dlat, dlon, cols = np.load(os.path.join(directory, "layout.npy"))
+        return cls(bits, lat0, lon0, dlat, dlon, int(cols))
+
+    @classmethod
+    def read(cls, path, resolution=0.05, bounds=None, cache=True):
+        """ Mask from a saved folder, a .shp file or a GeoJSON file
+
+        Vector files are rasterized once and the result is kept in
+        <path>.land next to them, reused while the file's size and mtime
+        and the requested resolution and bounds still match. A cache that
+        cannot be written is silently skipped.
+
+        Args:
+            path: folder written by save, shapefile or GeoJSON
+            resolution: cell size in degrees for vector files
+            bounds: (lat_min, lat_max, lon_min, lon_max), polygon extent when None
+            cache: use and refresh the rasterized copy
+
+        Returns:
+            LandMask
+        """
+        if os.path.isdir(path):
+            return cls.load(path)
+
+        cached = path + ".land"
+        source = os.stat(path)
+        key = json.dumps([source.st_size, source.st_mtime_ns, resolution, None if bounds is None else list(bounds)])
+        if cache and os.path.exists(os.path.join(cached, "key.json")):
+            try:
+                with open(os.path.join(cached, "key.json")) as f:
+                    if f.read() == key:
+                        return cls.load(cached)
+            except (OSError, ValueError):
+                pass
+
+        if path.lower().endswith(".shp"):
+            mask = cls.from_shapefile(path, resolution, bounds)
+        else:
+            mask = cls.from_geojson(path, resolution, bounds)
+        if cache:
+            try:
+                mask.save(cached)
+                with open(os.path.join(cached, "key.json"), "w") as f:
+                    f.write(key)
+            except OSError:
+                pass
+        return mask
+
+    def _cells(self, lat, lon):
+        """ row, col of every point and whether it falls inside the raster """
+        row = np.floor((lat - self.lat0) / self.dlat).astype(np.int64)
+        col = np.floor(((lon - self.lon0) % 360) / self.dlon).astype(np.int64)
+        inside = (row >= 0) & (row < self.bits.shape[0]) & (col < self.cols)
+        return np.where(inside, row, 0), np.where(inside, col, 0), inside
+
+    def is_land(self, lat, lon):
+        """ True where a point falls in a land cell
+
+        Args:
+            lat: float or array
+            lon: float or array, any wrapping
+
+        Returns:
+            bool or bool array
+        """
+        lat, lon = np.broadcast_arrays(np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64))
+        row, col, inside = self._cells(lat, lon)
+        bit = (self.bits[row, col >> 3] >> (7 - (col & 7)).astype(np.uint8)) & 1
+        return (inside & (bit == 1))[()]
+
+    def is_water(self, lat, lon):
+        """ Negation of is_land """
+        return ~self.is_land(lat, lon)
+
+    def blocks(self):
+        """ Coarse mask of BLOCK x BLOCK cell blocks, land where any cell of the block or a neighboring block is """
+        if self._blocks is None:
+            rows, width = self.bits.shape
+            step = BLOCK // 8
+            coarse = np.logical_or.reduceat(np.asarray(self.bits) != 0, np.arange(0, rows, BLOCK), axis=0)
+            coarse = np.logical_or.reduceat(coarse, np.arange(0, width, step), axis=1)
+            padded = np.pad(coarse, 1)
+            near = np.zeros_like(coarse)
+            for dr in range(3):
+                for dc in range(3):
+                    near |= padded[dr:dr + coarse.shape[0], dc:dc + coarse.shape[1]]
+            self._blocks = LandMask.from_array(near, self.lat0, self.lon0, self.dlat * BLOCK, self.dlon * BLOCK)
+        return self._blocks
+
+    def _grounded(self, lat1, lon1, dlat, dlon, legs):
+        """ Legs of legs with a sample on land, sampled at half a cell of this mask """
+        n = np.ceil(2 * np.maximum(np.abs(dlat[legs]) / self.dlat, np.abs(dlon[legs]) / self.dlon)).astype(np.int64) + 1
+        grounded = []
+        for a in range(0, len(legs), CHUNK):
+            b = min(a + CHUNK, len(legs))
+            k = np.repeat(np.arange(a, b), n[a:b])
+            first = np.cumsum(n[a:b]) - n[a:b]
+            frac = (np.arange(len(k)) - first[k - a]) / np.maximum(n - 1, 1)[k]
+            leg = legs[k]
+            land = self.is_land(lat1[leg] + frac * dlat[leg], lon1[leg] + frac * dlon[leg])
+            grounded.append(np.unique(leg[land]))
+        stats.count("land.samples", int(n.sum()))
+        return np.concatenate(grounded) if grounded else legs[:0]
+
+    def leg_clear(self, lat1, lon1, lat2, lon2):
+        """ True where a straight leg stays on water cells
+
+        Each leg is sampled on a straight lat/lon line at most half a cell
+        apart, both ends included. Legs are first sampled on blocks(), and
+        only those passing near land are sampled at full resolution, so
+        open-water legs cost a few lookups whatever their length. For legs
+        of a few cells the line is within a cell of the great circle or
+        rhumb line actually sailed; a leg that only clips the corner of a
+        land cell can be missed.
+
+        Args:
+            lat1, lon1: leg starts, float or array
+            lat2, lon2: leg ends, float or array
+
+        Returns:
+            bool or bool array
+        """
+        lat1, lon1, lat2, lon2 = np.broadcast_arrays(*(np.asarray(a, dtype=np.float64) for a in (lat1, lon1, lat2, lon2)))
+        shape = lat1.shape
+        lat1, lon1 = lat1.ravel(), lon1.ravel()
+        dlat = lat2.ravel() - lat1
+        dlon = (lon2.ravel() - lon1 + 180) % 360 - 180
+
+        clear = np.ones(len(lat1), dtype=bool)
+        with stats.stage("land.legs"):
+            legs = np.arange(len(lat1))
+            if min(self.shape) > BLOCK:
+                legs = self.blocks()._grounded(lat1, lon1, dlat, dlon, legs)
+            clear[self._grounded(lat1, lon1, dlat, dlon, legs)] = False
+        stats.count("land.legs", len(clear))
+        stats.count("land.fine_legs", len(legs))
+        return clear.reshape(shape)[()]
+
+
+def _fill(land, rings, lat0, lon0, step):
+    """ Toggles cells right of every ring crossing on each row, in the polygon's bounding window """
+    if not rings:
+        return
+    points = np.concatenate(rings)
+    rows, cols = land.shape
+    r0 = max(int(np.floor((points[:, 1].min() - lat0) / step)), 0)
+    r1 = min(int(np.ceil((points[:, 1].max() - lat0) / step)) + 1, rows)
+    c0 = max(int(np.floor((points[:, 0].min() - lon0) / step)), 0)
+    c1 = min(int(np.ceil((points[:, 0].max() - lon0) / step)) + 1, cols)
+    if r0 >= r1 or c0 >= c1:
+        return
+
+    x1 = np.concatenate([ring[:, 0] for ring in rings])
+    y1 = np.concatenate([ring[:, 1] for ring in rings])
+    x2 = np.concatenate([np.roll(ring[:, 0], -1) for ring in rings])
+    y2 = np.concatenate([np.roll(ring[:, 1], -1) for ring in rings])
+
+    # rows whose centre lies in [min(y1, y2), max(y1, y2)), horizontal edges cross none
+    lo = np.clip(np.ceil((np.minimum(y1, y2) - lat0) / step - 0.5), r0, r1).astype(np.int64)
+    hi = np.clip(np.ceil((np.maximum(y1, y2) - lat0) / step - 0.5), r0, r1).astype(np.int64)
+    n = hi - lo
+    edge = np.repeat(np.arange(len(n)), n)
+    row = lo[edge] + np.arange(len(edge)) - (np.cumsum(n) - n)[edge]
+
+    yc = lat0 + (row + 0.5) * step
+    x = x1[edge] + (yc - y1[edge]) * (x2[edge] - x1[edge]) / (y2[edge] - y1[edge])
+    col = np.clip(np.ceil((x - lon0) / step - 0.5), c0, c1).astype(np.int64)
+
+    width = c1 - c0 + 1
+    crossings = np.bincount((row - r0) * width + (col - c0), minlength=(r1 - r0) * width).reshape(r1 - r0, width)
+    land[r0:r1, c0:c1] |= (np.cumsum(crossings, axis=1)[:, :-1] % 2).astype(bool)
+
+
+def _geojson_polygons(data):
+    """ Polygons of a GeoJSON object as lists of rings """
+    kind = data.get("type")
+    if kind == "FeatureCollection":
+        return [p for feature in data["features"] for p in _geojson_polygons(feature)]
+    if kind == "Feature":
+        return _geojson_polygons(data["geometry"]) if data.get("geometry") else []
+    if kind == "GeometryCollection":
+        return [p for geometry in data["geometries"] for p in _geojson_polygons(geometry)]
+    if kind == "Polygon":
+        return [data["coordinates"]]
+    if kind == "MultiPolygon":
+        return list(data["coordinates"])
+    return []
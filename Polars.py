@@ -0,0 +1,264 @@
+import csv
+import os
+import numpy as np
+from Stats import stats
+
+
+class Polar:
+    """ Polar table compiled into contiguous arrays for vectorized lookups
+
+    VMG tables are built once per table column: up_twa / up_vmg is the
+    angle and speed made good straight upwind, down_twa / down_vmg the same
+    dead downwind (as a positive speed). Angles tighter than up_twa or
+    deeper than down_twa are never faster than tacking or gybing on them.
+    no_go marks the table cells inside the no-go zone, the rows of each
+    column before its first non-zero speed.
+
+    Args:
+        twa: ascending true wind angles of the table rows
+        tws: ascending true wind speeds of the table columns
+        bsp: boatspeeds (n_twa, n_tws)
+    """
+
+    def __init__(self, twa, tws, bsp):
+        self.twa = np.ascontiguousarray(twa, dtype=np.float64)
+        self.tws = np.ascontiguousarray(tws, dtype=np.float64)
+        self.bsp = np.ascontiguousarray(bsp, dtype=np.float64)
+        self.max_speed = float(self.bsp.max())
+        self.no_go = ~np.logical_or.accumulate(self.bsp > 0, axis=0)
+        self.up_twa, self.up_vmg, self.down_twa, self.down_vmg = self._vmg_tables()
+
+    def _vmg_tables(self, resolution=0.5):
+        """ Optimal upwind/downwind angles and VMG per table column, on a resolution degree sweep
+
+        Only angles the column can actually sail are searched: from its
+        first row with a non-zero speed (rows before it are the no-go zone)
+        to the last row of the table, so no optimum comes from the ramp into
+        the no-go zone or from angles past the table's end.
+        """
+        sailable = ~self.no_go
+        angles = np.arange(0.0, 180.0 + resolution / 2, resolution)
+        bsp = np.stack([np.interp(angles, self.twa, column) for column in self.bsp.T])
+        vmg = bsp * np.cos(np.radians(angles))
+
+        first = np.where(sailable.any(axis=0), self.twa[np.argmax(sailable, axis=0)], self.twa[-1])
+        covered = (angles[None, :] >= first[:, None]) & (angles[None, :] <= self.twa[-1])
+        up = np.argmax(np.where(covered, vmg, -np.inf), axis=1)
+        down = np.argmin(np.where(covered, vmg, np.inf), axis=1)
+        cols = np.arange(len(self.tws))
+        return angles[up], vmg[cols, up], angles[down], -vmg[cols, down]
+
+    @classmethod
+    def from_dataframe(cls, polars):
+        """ Builds a Polar from Functions.polarpandas output
+
+        Args:
+            polars: pandas dataframe, twa index and tws columns
+
+        Returns:
+            Polar
+        """
+        polars = polars.sort_index().sort_index(axis=1)
+        return cls(polars.index.values, polars.columns.values, polars.values)
+
+    @classmethod
+    def from_csv(cls, polar_csv):
+        """ Reads a ';' separated polar csv without going through pandas
+
+        Args:
+            polar_csv: csv file of a set of polars
+
+        Returns:
+            Polar
+        """
+        with open(polar_csv, newline="") as f:
+            rows = [row for row in csv.reader(f, delimiter=";") if row]
+        tws = [float(c) for c in rows[0][1:]]
+        twa = [float(r[0]) for r in rows[1:]]
+        bsp = [[float(c) for c in r[1:]] for r in rows[1:]]
+        return cls(twa, tws, bsp)
+
+    @classmethod
+    def load(cls, polar_csv, cache=True):
+        """ Polar from a csv, through a binary copy kept next to it
+
+        The parsed arrays are stored in <polar_csv>.npz together with the
+        csv's size and mtime, and reused while those still match. A cache
+        that cannot be written (read-only folder) is silently skipped.
+
+        Args:
+            polar_csv: csv file of a set of polars
+            cache: use and refresh the .npz copy
+
+        Returns:
+            Polar
+        """
+        cached = polar_csv + ".npz"
+        source = os.stat(polar_csv)
+        key = np.array([source.st_size, source.st_mtime_ns], dtype=np.int64)
+        if cache and os.path.exists(cached):
+            try:
+                with np.load(cached) as data:
+                    if np.array_equal(data["key"], key):
+                        return cls(data["twa"], data["tws"], data["bsp"])
+            except (OSError, ValueError, KeyError):
+                pass
+
+        polar = cls.from_csv(polar_csv)
+        if cache:
+            try:
+                with open(cached, "wb") as f:
+                    np.savez(f, key=key, twa=polar.twa, tws=polar.tws, bsp=polar.bsp)
+            except OSError:
+                pass
+        return polar
+
+    def speed(self, tws, twa):
+        """ Bilinear boatspeed for arrays of tws/twa
+
+        twa is folded onto [0,180] so port and starboard share the table,
+        then both axes are clamped to the table range like Functions.find_speed.
+
+        Args:
+            tws: float or array of wind speeds
+            twa: float or array of wind angles, any range
+
+        Returns:
+            bsp: boatspeed with the broadcast shape of tws and twa
+        """
+        twa = np.abs((np.asarray(twa, dtype=np.float64) + 180) % 360 - 180)
+        tws = np.asarray(tws, dtype=np.float64)
+
+        i, wa = _cell(self.twa, twa)
+        j, ws = _cell(self.tws, tws)
+
+        v1 = self.bsp[i, j] + (self.bsp[i + 1, j] - self.bsp[i, j]) * wa
+        v2 = self.bsp[i, j + 1] + (self.bsp[i + 1, j + 1] - self.bsp[i, j + 1]) * wa
+        bsp = v1 + (v2 - v1) * ws
+        stats.count("polar.evaluations", bsp.size)
+        return bsp[()]
+
+    def speed_bound(self, tws):
+        """ Highest boatspeed at any wind angle for any wind speed up to tws
+
+        Used to bound edge times from below: a leg sailed in at most tws
+        knots of wind can never be faster than this.
+
+        Args:
+            tws: float or array of wind speeds
+
+        Returns:
+            bsp: upper bound with the shape of tws
+        """
+        tws = np.asarray(tws, dtype=np.float64)
+        below = np.maximum.accumulate(self.bsp.max(axis=0))
+        j = np.clip(np.searchsorted(self.tws, tws, side="right") - 1, 0, len(self.tws) - 1)
+        at = self.speed(tws[..., None], self.twa).max(axis=-1)
+        return np.maximum(below[j], at)[()]
+
+    def optimal_angles(self, tws):
+        """ Best upwind and downwind angles and VMG, interpolated between table columns
+
+        Args:
+            tws: float or array of wind speeds
+
+        Returns:
+            up_twa, up_vmg, down_twa, down_vmg: with the shape of tws
+        """
+        tws = np.asarray(tws, dtype=np.float64)
+        return tuple(np.interp(tws, self.tws, table)[()] for table in
+                     (self.up_twa, self.up_vmg, self.down_twa, self.down_vmg))
+
+    def hull_speed(self, tws, twa):
+        """ Speed along a direction when tacking or gybing is allowed
+
+        This is the convex hull of the polar: inside the optimal upwind
+        angle the boat tacks at up_twa and makes good up_vmg / cos(twa), past
+        the optimal downwind angle it gybes at down_twa, in between it sails
+        the polar.
+
+        Args:
+            tws: float or array of wind speeds
+            twa: float or array of wind angles, any range
+
+        Returns:
+            speed along twa with the broadcast shape of tws and twa
+        """
+        twa = np.abs((np.asarray(twa, dtype=np.float64) + 180) % 360 - 180)
+        up_twa, up_vmg, down_twa, down_vmg = self.optimal_angles(tws)
+        cos = np.cos(np.radians(twa))
+        with np.errstate(divide="ignore"):
+            tack = up_vmg / cos
+            gybe = down_vmg / -cos
+        return np.where(twa < up_twa, tack, np.where(twa > down_twa, gybe, self.speed(tws, twa)))[()]
+
+
+def _cell(axis, x):
+    """ Lower cell index and clamped fractional weight of x along an ascending axis """
+    i = np.clip(np.searchsorted(axis, x, side="right") - 1, 0, len(axis) - 2)
+    w = np.clip((x - axis[i]) / (axis[i + 1] - axis[i]), 0.0, 1.0)
+    return i, w
+
+
+class PolarStack:
+    """ Several polars resampled onto shared axes for one batched lookup
+
+    The union of all twa and tws values becomes the common grid and every
+    polar is sampled on it. A bilinear table sampled at a superset of its
+    own nodes interpolates to exactly the same speeds, so each boat keeps
+    its own polar. bsp is (n_boats, n_twa, n_tws) and the VMG tables are
+    (n_boats, n_tws).
+
+    Args:
+        polars: list of Polar, pandas dataframes or polar csv paths
+    """
+
+    def __init__(self, polars):
+        self.polars = [p if isinstance(p, Polar) else Polar.load(p) if isinstance(p, str) else Polar.from_dataframe(p)
+                       for p in polars]
+        self.twa = np.unique(np.concatenate([p.twa for p in self.polars]))
+        self.tws = np.unique(np.concatenate([p.tws for p in self.polars]))
+        self.bsp = np.stack([p.speed(self.tws[None, :], self.twa[:, None]) for p in self.polars])
+        self.max_speed = self.bsp.max(axis=(1, 2))
+        self.up_twa, self.up_vmg, self.down_twa, self.down_vmg = (
+            np.stack([np.interp(self.tws, p.tws, getattr(p, name)) for p in self.polars])
+            for name in ("up_twa", "up_vmg", "down_twa", "down_vmg"))
+
+    def __len__(self):
+        return len(self.polars)
+
+    def speed(self, tws, twa, boat=None):
+        """ Bilinear boatspeed, for every boat or for one boat per sample
+
+        Args:
+            tws: float or array of wind speeds
+            twa: float or array of wind angles, any range
+            boat: boat index per sample, None evaluates all boats
+
+        Returns:
+            bsp: (n_boats,) + broadcast shape when boat is None,
+                otherwise the broadcast shape of tws, twa and boat
+        """
+        twa = np.abs((np.asarray(twa, dtype=np.float64) + 180) % 360 - 180)
+        tws = np.asarray(tws, dtype=np.float64)
+        i, wa = _cell(self.twa, twa)
+        j, ws = _cell(self.tws, tws)
+        if boat is None:
+            b = np.arange(len(self)).reshape((-1,) + (1,) * np.broadcast(i, j).ndim)
+        else:
+            b = np.asarray(boat)
+
+        t = self.bsp
+        v1 = t[b, i, j] + (t[b, i + 1, j] - t[b, i, j]) * wa
+        v2 = t[b, i, j + 1] + (t[b, i + 1, j + 1] - t[b, i, j + 1]) * wa
+        bsp = v1 + (v2 - v1) * ws
+        stats.count("polar.evaluations", bsp.size)
+        return bsp[()]
+
+    def optimal_angles(self, tws, boat):
+        """ Best upwind/downwind angles and VMG of each sample's boat, see Polar.optimal_angles """
+        tws = np.asarray(tws, dtype=np.float64)
+        j, w = _cell(self.tws, tws)
+        boat = np.asarray(boat)
+        return tuple((table[boat, j] + (table[boat, j + 1] - table[boat, j]) * w)[()] for table in
+                     (self.up_twa, self.up_vmg, self.down_twa, self.down_vmg))
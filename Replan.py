@@ -0,0 +1,238 @@
+""" Incremental re-planning on a Grid when a new forecast arrives (D* Lite)
+
+The search runs backward from the finish, so g is hours to go and the
+boat's position can move without invalidating anything. Edge costs are a
+snapshot of the time-dependent leg times: each node gets a fixed
+estimated passage time from the first plan, and every edge is priced
+with the wind at its start node at that time. A new forecast re-prices
+all edges in one vectorized pass, and only edges whose cost moved by more
+than tol are handed to the search, which then repairs just the vertices
+those edges affect.
+
+    planner = Replanner(grid, start_idx, finish_idx, polar, wind, start_time)
+    plan = planner.plan()
+    ...
+    plan = planner.update(wind=new_wind, position=(lat, lon))
+"""
+import heapq
+import numpy as np
+from dataclasses import dataclass
+from datetime import timedelta
+import Geodesy as geo
+import Weather
+from Polars import Polar
+from Stats import stats
+
+
+@dataclass
+class Replan:
+    """ Route from one plan or update
+
+    hours is the sum of the snapshot edge costs along the route, expanded
+    counts vertices whose g changed in this call and changed the edges
+    whose cost was updated.
+    """
+    path: list
+    nodes: list
+    hours: float
+    eta: object
+    expanded: int
+    changed: int
+
+
+class Replanner:
+    """ D* Lite over a Grid with wind-dependent edge costs
+
+    Args:
+        grid: Grid, needs an edge list
+        start_idx: node id of the boat
+        finish_idx: finish node id
+        polars: pandas dataframe or Polars.Polar
+        wind: Weather.WindField
+        start_time: departure datetime
+        tol: relative cost change below which an edge keeps its old cost
+        cruise_speed: knots used to estimate when each node is passed,
+            the mean of the polar table when None
+    """
+
+    def __init__(self, grid, start_idx, finish_idx, polars, wind, start_time, tol=0.02, cruise_speed=None):
+        if not hasattr(grid, "indptr"):
+            raise ValueError("Replanner needs a Grid with an edge list, not an ImplicitGrid")
+        self.grid = grid
+        self.polar = polars if isinstance(polars, Polar) else Polar.from_dataframe(polars)
+        self.start = int(start_idx)
+        self.finish = int(finish_idx)
+        self.now = start_time
+        self.tol = tol
+        n = len(grid)
+
+        self.src = np.repeat(np.arange(n), np.diff(grid.indptr))
+        dst = grid.indices
+        self.dist = geo.distance(grid.lat[self.src], grid.lon[self.src], grid.lat[dst], grid.lon[dst])
+        self.hdg = geo.rhumb_bearing(grid.lat[self.src], grid.lon[self.src], grid.lat[dst], grid.lon[dst])
+
+        order = np.argsort(dst, kind="stable")
+        self.into_edge = order
+        self.into_ptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(dst, minlength=n), out=self.into_ptr[1:])
+
+        if cruise_speed is None:
+            cruise_speed = float(self.polar.bsp[self.polar.bsp > 0].mean())
+        lat0, lon0 = grid.position(self.start)
+        hours = geo.distance(grid.lat, grid.lon, lat0, lon0) / cruise_speed
+        self.node_time = Weather.to_epoch(start_time) + hours * 3600.0
+
+        self.cost = self.edge_costs(wind)
+        self.g = np.full(n, np.inf)
+        self.rhs = np.full(n, np.inf)
+        self.rhs[self.finish] = 0.0
+        self.key = np.full((n, 2), np.inf)
+        self.queued = np.zeros(n, dtype=bool)
+        self.heap = []
+        self.km = 0.0
+        self.last = self.start
+        self._push(self.finish)
+
+    def edge_costs(self, wind):
+        """ Hours on every CSR edge, wind taken at the start node at its estimated time """
+        with stats.stage("replan.edge_costs"):
+            grid = self.grid
+            tws, twd = wind.tws_twd(grid.lat[self.src], grid.lon[self.src], self.node_time[self.src])
+            bsp = self.polar.speed(tws, twd - self.hdg)
+        return np.where(bsp > 0, self.dist / np.where(bsp > 0, bsp, 1), np.inf)
+
+    def _h(self, idx):
+        """ Hours from the boat's node at the polar's top speed, a bound on any path """
+        lat, lon = self.grid.position(self.start)
+        return geo.distance(self.grid.lat[idx], self.grid.lon[idx], lat, lon) / self.polar.max_speed
+
+    def _push(self, idx):
+        k2 = min(self.g[idx], self.rhs[idx])
+        k1 = k2 + self._h(idx) + self.km
+        self.key[idx] = (k1, k2)
+        self.queued[idx] = True
+        heapq.heappush(self.heap, (float(k1), float(k2), int(idx)))
+
+    def _best_rhs(self, idx):
+        lo, hi = self.grid.indptr[idx], self.grid.indptr[idx + 1]
+        return float((self.cost[lo:hi] + self.g[self.grid.indices[lo:hi]]).min()) if hi > lo else np.inf
+
+    def _update_vertex(self, idx):
+        if self.g[idx] != self.rhs[idx]:
+            self._push(idx)
+        else:
+            self.queued[idx] = False
+
+    def _start_key(self):
+        k2 = min(self.g[self.start], self.rhs[self.start])
+        return (k2 + self.km, k2)
+
+    def _compute(self):
+        expanded = 0
+        g, rhs = self.g, self.rhs
+        with stats.stage("replan.search"):
+            while self.heap:
+                k1, k2, u = self.heap[0]
+                if not self.queued[u] or (k1, k2) != tuple(self.key[u]):
+                    heapq.heappop(self.heap)
+                    continue
+                if (k1, k2) >= self._start_key() and rhs[self.start] == g[self.start]:
+                    break
+                heapq.heappop(self.heap)
+
+                k_new = min(g[u], rhs[u])
+                if (k1, k2) < (k_new + self._h(u) + self.km, k_new):
+                    self._push(u)
+                    continue
+                self.queued[u] = False
+                expanded += 1
+
+                edges = self.into_edge[self.into_ptr[u]:self.into_ptr[u + 1]]
+                preds = self.src[edges]
+                if g[u] > rhs[u]:
+                    g[u] = rhs[u]
+                    better = self.cost[edges] + g[u] < rhs[preds]
+                    better &= preds != self.finish
+                    rhs[preds[better]] = self.cost[edges[better]] + g[u]
+                    for p in preds[better].tolist():
+                        self._update_vertex(p)
+                else:
+                    g_old = g[u]
+                    g[u] = np.inf
+                    via = (rhs[preds] == self.cost[edges] + g_old) & (preds != self.finish)
+                    for p in preds[via].tolist():
+                        rhs[p] = self._best_rhs(p)
+                        self._update_vertex(p)
+                    if u != self.finish:
+                        rhs[u] = self._best_rhs(u)
+                    self._update_vertex(u)
+        stats.count("replan.expanded", expanded)
+        return expanded
+
+    def _apply(self, new_cost):
+        """ Hands edges whose cost moved by more than tol to the search """
+        old = self.cost
+        with np.errstate(invalid="ignore"):
+            moved = np.abs(new_cost - old) > self.tol * np.minimum(old, new_cost)
+        moved |= np.isinf(old) != np.isinf(new_cost)
+        edges = np.flatnonzero(moved)
+        if len(edges) == 0:
+            return 0
+
+        src, dst = self.src[edges], self.grid.indices[edges]
+        c_old, c_new = old[edges], new_cost[edges]
+        self.cost[edges] = c_new
+        rhs, g = self.rhs, self.g
+
+        touched = src[src != self.finish]
+        down = (c_new < c_old) & (src != self.finish)
+        np.minimum.at(rhs, src[down], c_new[down] + g[dst[down]])
+        up = (c_new > c_old) & (src != self.finish) & (rhs[src] == c_old + g[dst])
+        for idx in np.unique(src[up]).tolist():
+            rhs[idx] = self._best_rhs(idx)
+        for idx in np.unique(touched).tolist():
+            self._update_vertex(idx)
+        stats.count("replan.changed_edges", len(edges))
+        return len(edges)
+
+    def _route(self, expanded, changed):
+        if not np.isfinite(self.g[self.start]):
+            return Replan([], [], float("inf"), None, expanded, changed)
+        indptr, indices = self.grid.indptr, self.grid.indices
+        nodes = [self.start]
+        hours = 0.0
+        while nodes[-1] != self.finish and len(nodes) <= len(self.grid):
+            lo, hi = indptr[nodes[-1]], indptr[nodes[-1] + 1]
+            k = int(np.argmin(self.cost[lo:hi] + self.g[indices[lo:hi]]))
+            hours += float(self.cost[lo + k])
+            nodes.append(int(indices[lo + k]))
+        path = [self.grid.position(i) for i in nodes]
+        return Replan(path, nodes, hours, self.now + timedelta(hours=hours), expanded, changed)
+
+    def plan(self):
+        """ Cold solve from the current state
+
+        Returns:
+            Replan
+        """
+        return self._route(self._compute(), 0)
+
+    def update(self, wind=None, position=None, time=None):
+        """ Repairs the plan for a new forecast and/or a new boat position
+
+        Args:
+            wind: new Weather.WindField, keeps the current costs when None
+            position: (lat, lon) or node id of the boat, unchanged when None
+            time: current datetime the ETA counts from, unchanged when None
+
+        Returns:
+            Replan
+        """
+        if time is not None:
+            self.now = time
+        if position is not None:
+            self.start = int(position) if np.isscalar(position) else int(self.grid.nearest(*position))
+            self.km += float(self._h(self.last))
+            self.last = self.start
+        changed = self._apply(self.edge_costs(wind)) if wind is not None else 0
+        return self._route(self._compute(), changed)
@@ -0,0 +1,360 @@
+""" Long-running routing service keeping polars, wind and grids warm
+
+One RoutingService answers route and isochrone queries on a thread pool.
+The polar and wind field are loaded once, grids and cost-to-go tables are
+kept in small LRUs, and identical queries share one result: the query
+cache holds futures, so a repeat that arrives while the first is still
+running waits on it instead of routing again.
+
+Two front ends share the service:
+
+    serve(service, port=8080)     HTTP, POST /route and /isochrones with a
+                                  JSON query, GET /health and /info
+    serve_stdio(service)          one JSON request per line on stdin, one
+                                  JSON response per line on stdout
+
+Every response carries a "timing" object (queued, compute and total
+seconds, and whether it came from the cache). `request` is a small client
+for tests and scripts.
+"""
+import json
+import sys
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import GridNavigation as GN
+import Isochrones as iso
+from Polars import Polar
+
+KINDS = ("route", "isochrones")
+# query options: type and allowed range, anything else is a 400
+OPTIONS = {
+    "dt_hours": (float, 0.1, 48.0),
+    "h_step": (float, 1.0, 90.0),
+    "max_dev": (float, 1.0, 180.0),
+    "max_steps": (int, 1, 1000),
+    "steps": (int, 1, 1000),
+    "n_sectors": (int, 1, 3600),
+    "padding": (int, 0, None),
+    "resolution": (int, 1, None),
+}
+CHOICES = {"sampling": iso.SAMPLING, "heuristic": GN.HEURISTICS, "method": ("isochrones", "grid")}
+
+
+class _LRU:
+    """ Thread-safe bounded mapping with get-or-create """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_create(self, key, create):
+        """ Cached value for key, create() stored under it on a miss
+
+        Returns:
+            value, hit
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key], True
+            self.misses += 1
+            value = self._entries[key] = create()
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return value, False
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
+
+
+class _Once:
+    """ Value computed on first get(), outside the LRU lock so other keys are not blocked """
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.done = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if not self.done:
+                self.value = self.fn()
+                self.done = True
+            return self.value
+
+
+class RoutingService:
+    """ Route and isochrone queries against one polar and wind field
+
+    Args:
+        polars: pandas dataframe, Polars.Polar or path to a polar csv
+        wind: Weather.WindField, live API is used when None
+        workers: size of the routing thread pool
+        cache_size: identical queries remembered
+        grid_cache: grids (and their cost-to-go tables) kept built
+        land: optional LandMask.LandMask applied to every query
+        max_resolution, max_padding: grid queries asking for more are clamped
+    """
+
+    def __init__(self, polars, wind=None, workers=4, cache_size=256, grid_cache=16, land=None,
+                 max_resolution=400, max_padding=50):
+        if isinstance(polars, str):
+            polars = Polar.load(polars)
+        self.polar = polars if isinstance(polars, Polar) else Polar.from_dataframe(polars)
+        self.wind = wind
+        self.land = land
+        self.max_resolution = max_resolution
+        self.max_padding = max_padding
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="route")
+        self.queries = _LRU(cache_size)
+        self.grids = _LRU(grid_cache)
+        self.tables = _LRU(grid_cache)
+        self.started = time.time()
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+    def info(self):
+        return {"uptime": time.time() - self.started, "queries": self.queries.info(),
+                "grids": self.grids.info(), "tables": self.tables.info()}
+
+    def handle(self, kind, query):
+        """ Answers one query, from the cache when an identical one was seen
+
+        Args:
+            kind: one of KINDS
+            query: dict of parameters, see route and isochrones
+
+        Returns:
+            result dict with a "timing" entry
+        """
+        if kind not in KINDS:
+            raise ValueError(f"kind must be one of {KINDS}, got {kind!r}")
+        t0 = time.perf_counter()
+        key = (kind, json.dumps(query, sort_keys=True))
+        future, hit = self.queries.get_or_create(key, lambda: self.pool.submit(self._run, kind, query, t0))
+        try:
+            result, queued, compute = future.result()
+        except Exception:
+            self.queries.discard(key)
+            raise
+        timing = {"cached": hit, "queued": 0.0 if hit else queued, "compute": 0.0 if hit else compute,
+                  "total": time.perf_counter() - t0}
+        return {**result, "timing": timing}
+
+    def _run(self, kind, query, submitted):
+        started = time.perf_counter()
+        result = self.route(query) if kind == "route" else self.isochrones(query)
+        return result, started - submitted, time.perf_counter() - started
+
+    def _grid(self, start, finish, padding, resolution):
+        once, _ = self.grids.get_or_create((start, finish, padding, resolution),
+                                           lambda: _Once(lambda: GN.build_grid(start, finish, padding, resolution, self.land)))
+        return once.get()
+
+    def route(self, query):
+        """ Routes one query without caching
+
+        Query keys: start, finish as [lat, lon], time (ISO, required),
+        method ("isochrones" or "grid"), and the options of
+        Isochrones.route_isochrones (dt_hours, h_step, max_dev, n_sectors,
+        sampling) or GridNavigation.astar_grid (padding, resolution,
+        heuristic). Values are checked against OPTIONS and CHOICES;
+        padding and resolution are clamped to the service's maximums.
+        """
+        start, finish, departure = _points(query)
+        method = _options(query, ("method",)).get("method", "isochrones")
+        if method == "isochrones":
+            result = iso.route_isochrones(self.polar, departure, *start, *finish, wind=self.wind, land=self.land, **_options(query, (
+                "dt_hours", "h_step", "max_dev", "max_steps", "n_sectors", "sampling")))
+            route, eta, extra = [(lat, lon) for lat, lon, _ in result.route], result.eta, {"fronts": len(result.fronts)}
+        elif method == "grid":
+            options = _options(query, ("padding", "resolution", "heuristic"))
+            padding = min(options.get("padding", 5), self.max_padding)
+            resolution = min(options.get("resolution", 50), self.max_resolution)
+            grid = self._grid(start, finish, padding, resolution)
+            start_idx, finish_idx = GN.nearest_node(grid, *start), GN.nearest_node(grid, *finish)
+            heuristic = options.get("heuristic", "polar")
+            if heuristic == "table":
+                once, _ = self.tables.get_or_create(
+                    (start, finish, padding, resolution, finish_idx),
+                    lambda: _Once(lambda: GN.cost_to_go(grid, finish_idx, self.polar, self.wind)))
+                heuristic = once.get()
+            result = GN.astar_grid(grid, start_idx, finish_idx, self.polar, departure, self.wind, heuristic)
+            route, eta, extra = result.path, result.eta, {"expanded": result.expanded, "nodes": len(grid)}
+
+        hours = (eta - departure).total_seconds() / 3600 if eta else None
+        return {"method": method, "departure": departure, "eta": eta, "hours": hours,
+                "route": [[round(float(lat), 5), round(float(lon), 5)] for lat, lon in route], **extra}
+
+    def isochrones(self, query):
+        """ Builds isochrone fronts for one query without caching
+
+        Query keys: start, finish, time as for route, steps and the options
+        of Isochrones.build_isochrone_fronts. Fronts come back as lists of
+        [lat, lon].
+        """
+        start, finish, departure = _points(query)
+        fronts = iso.build_isochrone_fronts(self.polar, departure, *start, *finish, wind=self.wind, land=self.land, **_options(query, (
+            "dt_hours", "h_step", "max_dev", "steps", "n_sectors", "sampling")))
+        return {"fronts": [{"time": front.time, "points": [[round(float(lat), 5), round(float(lon), 5)]
+                                                           for lat, lon in zip(front.lat, front.lon)]}
+                           for front in fronts]}
+
+
+def _points(query):
+    try:
+        start = tuple(float(x) for x in query["start"])
+        finish = tuple(float(x) for x in query["finish"])
+        departure = datetime.fromisoformat(query["time"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"query needs start, finish as [lat, lon] and an ISO time: {e}") from e
+    if len(start) != 2 or len(finish) != 2:
+        raise ValueError("start and finish must be [lat, lon]")
+    return start, finish, departure
+
+
+def _options(query, names):
+    """ Options of query among names, coerced to their OPTIONS type and checked
+
+    Raises:
+        ValueError: on a value of the wrong type, out of range or not one of CHOICES
+    """
+    out = {}
+    for name in names:
+        if name not in query:
+            continue
+        value = query[name]
+        if name in CHOICES:
+            if value not in CHOICES[name]:
+                raise ValueError(f"{name} must be one of {CHOICES[name]}, got {value!r}")
+            out[name] = value
+            continue
+        kind, lo, hi = OPTIONS[name]
+        try:
+            if isinstance(value, bool):
+                raise TypeError
+            number = float(value)
+            if kind is int and number != int(number):
+                raise ValueError
+            value = kind(number)
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f"{name} must be a{'n integer' if kind is int else ' number'}, got {value!r}") from None
+        if not (lo <= value and (hi is None or value <= hi)):
+            raise ValueError(f"{name} must be in [{lo}, {'inf' if hi is None else hi}], got {value}")
+        out[name] = value
+    return out
+
+
+def _dumps(obj):
+    return json.dumps(obj, default=str)
+
+
+class Handler(BaseHTTPRequestHandler):
+    """ JSON over HTTP for the RoutingService on self.server.service """
+
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status, body):
+        data = _dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, {"ok": True})
+        elif self.path == "/info":
+            self._send(200, self.server.service.info())
+        else:
+            self._send(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        kind = self.path.strip("/")
+        if kind not in KINDS:
+            self._send(404, {"error": f"unknown path {self.path}"})
+            return
+        try:
+            query = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            self._send(200, self.server.service.handle(kind, query))
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(service, host="127.0.0.1", port=8080):
+    """ HTTP server for a service, call serve_forever() on it or run it in a thread
+
+    Args:
+        service: RoutingService
+        host: interface to bind
+        port: port, 0 picks a free one (see server.server_address)
+
+    Returns:
+        ThreadingHTTPServer
+    """
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def serve_stdio(service, infile=None, outfile=None):
+    """ JSON-lines loop: {"id": .., "kind": "route", "query": {..}} in, one response line out
+
+    Requests are answered in order; the id is echoed back when present.
+    """
+    infile = infile or sys.stdin
+    outfile = outfile or sys.stdout
+    for line in infile:
+        if not line.strip():
+            continue
+        request = {}
+        try:
+            request = json.loads(line)
+            response = service.handle(request.get("kind", "route"), request.get("query", {}))
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+        if isinstance(request, dict) and "id" in request:
+            response["id"] = request["id"]
+        outfile.write(_dumps(response) + "\n")
+        outfile.flush()
+
+
+def request(url, kind, query, timeout=60):
+    """ Posts one query to a running server
+
+    Args:
+        url: server root, e.g. http://127.0.0.1:8080
+        kind: one of KINDS
+        query: dict of parameters
+
+    Returns:
+        decoded JSON response
+    """
+    data = json.dumps(query, default=str).encode()
+    req = urllib.request.Request(f"{url.rstrip('/')}/{kind}", data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        return json.loads(response.read())
@@ -0,0 +1,130 @@
+""" Routing instrumentation: counters, per-step series and per-stage wall time
+
+Modules report into the shared `stats` object, which forwards to the Stats
+collection active in the current context (thread or asyncio task). Outside
+of a collection every call is a single context variable lookup, so
+instrumentation can stay in the hot paths, and concurrent collections
+never see each other's counts. Typical use:
+
+    with Stats.collect() as s:
+        Isochrones.route_isochrones(...)
+    print(s.to_json())
+
+New threads start outside any collection; submit work with
+Stats.propagate(fn) to report into the caller's.
+"""
+import contextvars
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+_NULL = nullcontext()
+_active = contextvars.ContextVar("stats", default=None)
+
+
+class _Stage:
+    __slots__ = ("stats", "name", "t0")
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.t0
+        with self.stats.lock:
+            self.stats.seconds[self.name] += elapsed
+            self.stats.calls[self.name] += 1
+        return False
+
+
+class Stats:
+    """ Named counters, series and stage timers of one collection """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(int)
+        self.series = defaultdict(list)
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += int(n)
+
+    def record(self, name, value):
+        """ Appends one value, e.g. per isochrone step, to series name """
+        with self.lock:
+            self.series[name].append(value)
+
+    def stage(self, name):
+        """ Context manager adding the wall time of its block to stage name """
+        return _Stage(self, name)
+
+    def to_dict(self):
+        return {
+            "counters": dict(sorted(self.counters.items())),
+            "series": {name: list(values) for name, values in sorted(self.series.items())},
+            "stages": {name: {"seconds": self.seconds[name], "calls": self.calls[name]}
+                       for name in sorted(self.seconds)},
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+
+class _Active:
+    """ Forwards to the collection of the current context, inert outside one """
+
+    @property
+    def enabled(self):
+        return _active.get() is not None
+
+    def count(self, name, n=1):
+        s = _active.get()
+        if s is not None:
+            s.count(name, n)
+
+    def record(self, name, value):
+        s = _active.get()
+        if s is not None:
+            s.record(name, value)
+
+    def stage(self, name):
+        s = _active.get()
+        return _NULL if s is None else _Stage(s, name)
+
+
+stats = _Active()
+
+
+@contextmanager
+def collect():
+    """ Starts a fresh collection for the duration of the block in this context
+
+    Collections nest: the inner block reports only into its own Stats.
+
+    Yields:
+        Stats, still readable after the block ends
+    """
+    collected = Stats()
+    token = _active.set(collected)
+    try:
+        yield collected
+    finally:
+        _active.reset(token)
+
+
+def propagate(fn):
+    """ fn wrapped to run in a copy of the caller's context, for thread pools
+
+    Call it in the submitting thread, once per task: a copied context can
+    only be entered by one thread at a time.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
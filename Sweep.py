@@ -0,0 +1,123 @@
+import argparse
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import Isochrones as iso
+import Weather
+from Polars import Polar
+
+
+@dataclass
+class SweepResult:
+    """ One departure of a sweep, eta is None when the finish was not reached """
+    departure: datetime
+    eta: object
+    hours: float
+    route: list
+
+
+_worker = {}
+
+
+def _init_worker(wind_dir, polar_arrays, start, finish, route_kwargs):
+    """ Runs once per worker process: memory-maps the shared wind field """
+    _worker["wind"] = Weather.WindField.load(wind_dir, mmap_mode="r")
+    _worker["polar"] = Polar(*polar_arrays)
+    _worker["start"] = start
+    _worker["finish"] = finish
+    _worker["kwargs"] = route_kwargs
+
+
+def _route_departure(departure):
+    start, finish = _worker["start"], _worker["finish"]
+    result = iso.route_isochrones(_worker["polar"], departure, start[0], start[1], finish[0], finish[1],
+                                  wind=_worker["wind"], **_worker["kwargs"])
+    hours = (result.eta - departure).total_seconds() / 3600 if result.eta else float("inf")
+    return SweepResult(departure, result.eta, hours, result.route)
+
+
+def departures(window_start, window_end, step):
+    """ Departure times from window_start to window_end inclusive """
+    times = []
+    t = window_start
+    while t <= window_end:
+        times.append(t)
+        t += step
+    return times
+
+
+def sweep_departures(polars, wind, start, finish, window_start, window_end, step=timedelta(hours=6), workers=None, **route_kwargs):
+    """ Routes every departure in a window on a process pool, yielding results as they finish
+
+    The wind field is written once to a temporary folder and every worker
+    memory-maps it, so all processes share the same read-only pages and
+    nothing is fetched again.
+
+    Args:
+        polars: pandas dataframe or Polars.Polar
+        wind: Weather.WindField covering the whole window
+        start: (lat, lon)
+        finish: (lat, lon)
+        window_start: first departure datetime
+        window_end: last departure datetime
+        step: timedelta between departures
+        workers: number of processes, os.cpu_count() when None
+        route_kwargs: passed to Isochrones.route_isochrones
+
+    Yields:
+        SweepResult, in completion order
+    """
+    polar = polars if isinstance(polars, Polar) else Polar.from_dataframe(polars)
+    wind_dir = tempfile.mkdtemp(prefix="sailingnav-wind-")
+    try:
+        wind.save(wind_dir)
+        initargs = (wind_dir, (polar.twa, polar.tws, polar.bsp), start, finish, route_kwargs)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+            futures = [pool.submit(_route_departure, t) for t in departures(window_start, window_end, step)]
+            for future in as_completed(futures):
+                yield future.result()
+    finally:
+        shutil.rmtree(wind_dir, ignore_errors=True)
+
+
+def sweep_table(results):
+    """ Sweep results as a dataframe ordered by departure """
+    import pandas as pd
+    rows = [{"departure": r.departure, "eta": r.eta, "hours": r.hours, "route": r.route} for r in results]
+    return pd.DataFrame(rows, columns=["departure", "eta", "hours", "route"]).sort_values("departure", ignore_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep departure times and report the ETA of each")
+    parser.add_argument("--start", nargs=2, type=float, required=True, metavar=("LAT", "LON"))
+    parser.add_argument("--finish", nargs=2, type=float, required=True, metavar=("LAT", "LON"))
+    parser.add_argument("--window-start", type=datetime.fromisoformat, required=True)
+    parser.add_argument("--window-end", type=datetime.fromisoformat, required=True)
+    parser.add_argument("--step-hours", type=float, default=6)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--polars", default="j99polars.csv")
+    parser.add_argument("--wind", help="folder written by WindField.save, fetched when omitted")
+    parser.add_argument("--dt-hours", type=float, default=6)
+    parser.add_argument("--h-step", type=float, default=5)
+    args = parser.parse_args(argv)
+
+    polar = Polar.from_csv(args.polars)
+    if args.wind:
+        wind = Weather.WindField.load(args.wind)
+    else:
+        wind = Weather.WindField.fetch(args.start, args.finish, args.window_start, args.window_end + timedelta(days=10))
+
+    results = []
+    print("departure,eta,hours")
+    for result in sweep_departures(polar, wind, tuple(args.start), tuple(args.finish), args.window_start, args.window_end,
+                                   timedelta(hours=args.step_hours), args.workers,
+                                   dt_hours=args.dt_hours, h_step=args.h_step):
+        print(f"{result.departure.isoformat()},{result.eta.isoformat() if result.eta else ''},{result.hours:.2f}", flush=True)
+        results.append(result)
+    return sweep_table(results)
+
+
+if __name__ == "__main__":
+    main()
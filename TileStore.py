@@ -0,0 +1,289 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from datetime import datetime, timedelta, timezone
+import Weather
+
+
+def run_key(time, cycle_hours=6):
+    """ Name of the forecast run in effect at a time, e.g. "2026101712"
+
+    Args:
+        time: datetime, naive means UTC
+        cycle_hours: hours between model runs
+
+    Returns:
+        run: str YYYYMMDDHH of the latest cycle at or before time
+    """
+    t = datetime.fromtimestamp(Weather.to_epoch(time), tz=timezone.utc)
+    t = t.replace(minute=0, second=0, microsecond=0, hour=t.hour - t.hour % cycle_hours)
+    return t.strftime("%Y%m%d%H")
+
+
+def _window(field, start_time=None, end_time=None):
+    """ field with its time axis cut to the steps bracketing [start_time, end_time], slices only """
+    times = field.times
+    i0, i1 = 0, len(times)
+    if start_time is not None:
+        i0 = max(int(np.searchsorted(times, Weather.to_epoch(start_time), side="right")) - 1, 0)
+    if end_time is not None:
+        i1 = min(int(np.searchsorted(times, Weather.to_epoch(end_time), side="left")) + 1, len(times))
+    if i0 == 0 and i1 == len(times):
+        return field
+    return Weather.WindField(field.lats, field.lons, times[i0:i1], field.u[i0:i1], field.v[i0:i1])
+
+
+def _stitch(parts, axis):
+    """ Concatenates neighboring tiles along axis, dropping the row or column each shares with the next """
+    cut = [slice(None)] * np.ndim(parts[0])
+    cut[axis] = slice(None, -1)
+    return np.concatenate([part[tuple(cut)] for part in parts[:-1]] + [parts[-1]], axis=axis)
+
+
+class TileStore:
+    """ On-disk wind tiles stored as .npy arrays, one folder per (run, tile)
+
+    Layout is root/<run>/<tile>/{lats,lons,times,u,v}.npy. Tiles are
+    tile_deg x tile_deg blocks of a global lattice with the given spacing,
+    edges included: each tile stores the first row and column of its
+    north and east neighbors, so any point inside a tile interpolates
+    from that tile alone, and neighboring tiles stitch into one regular
+    box by dropping the shared edge. Reads memory-map
+    the arrays; a box inside one tile comes back with no copies at all,
+    a box over several tiles is stitched into in-memory arrays. Each tile
+    records the [start, end] window it was fetched for, and a tile only
+    counts as present for windows inside that span.
+
+    Args:
+        root: store folder, created if missing
+        tile_deg: tile size in degrees
+        spacing: lattice spacing in degrees, must divide tile_deg
+    """
+
+    def __init__(self, root, tile_deg=5.0, spacing=0.25):
+        self.root = root
+        self.tile_deg = float(tile_deg)
+        self.spacing = float(spacing)
+        self.per_tile = int(round(self.tile_deg / self.spacing))
+        self.samples = self.per_tile + 1
+        os.makedirs(root, exist_ok=True)
+
+    def tile_name(self, lat0, lon0):
+        return f"{lat0:+08.3f}_{lon0:+09.3f}"
+
+    def tiles_for(self, lat_min, lat_max, lon_min, lon_max):
+        """ South-west corners of the tiles covering a box, in row order
+
+        Returns:
+            rows: list of rows, each a list of (lat0, lon0)
+        """
+        lat0s = np.arange(np.floor(lat_min / self.tile_deg), np.floor(lat_max / self.tile_deg) + 1) * self.tile_deg
+        lon0s = np.arange(np.floor(lon_min / self.tile_deg), np.floor(lon_max / self.tile_deg) + 1) * self.tile_deg
+        return [[(float(la), float(lo)) for lo in lon0s] for la in lat0s]
+
+    def path(self, run, lat0, lon0):
+        return os.path.join(self.root, run, self.tile_name(lat0, lon0))
+
+    def has(self, run, lat0, lon0, start_time=None, end_time=None):
+        """ Whether a tile is stored, and when a window is given, fetched for a span covering it
+
+        Tiles written without a span only count when no window is asked for,
+        and tiles without the shared edge row and column never count.
+        """
+        path = self.path(run, lat0, lon0)
+        if not os.path.exists(os.path.join(path, "v.npy")):
+            return False
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if meta.get("samples") != self.samples:
+            return False
+        if start_time is None and end_time is None:
+            return True
+        if meta.get("start") is None or meta.get("end") is None:
+            return False
+        start = Weather.to_epoch(start_time if start_time is not None else end_time)
+        end = Weather.to_epoch(end_time if end_time is not None else start_time)
+        return meta["start"] <= start and end <= meta["end"]
+
+    def write_tile(self, run, lat0, lon0, times, u, v, span=None):
+        """ Writes one tile into a temp folder, then swaps it in by renames
+
+        A tile already stored is renamed aside before the new one takes its
+        path and deleted after, so readers see the old or the new tile
+        except between two renames. Fields already memory-mapped from the
+        old tile stay readable.
+
+        Args:
+            run: forecast run key
+            lat0, lon0: south-west corner of the tile
+            times: unix seconds (n_time,)
+            u, v: wind components in knots (n_time, samples, samples)
+            span: (start_time, end_time) the tile was fetched for, see has
+        """
+        final = self.path(run, lat0, lon0)
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=os.path.dirname(final))
+
+        axis = np.arange(self.samples) * self.spacing
+        arrays = {"lats": lat0 + axis, "lons": lon0 + axis, "times": np.asarray(times, dtype=np.float64),
+                  "u": np.asarray(u, dtype=np.float32), "v": np.asarray(v, dtype=np.float32)}
+        for name, arr in arrays.items():
+            np.save(os.path.join(tmp, name + ".npy"), arr)
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            start, end = (None, None) if span is None else (float(Weather.to_epoch(t)) for t in span)
+            json.dump({"run": run, "lat0": lat0, "lon0": lon0, "spacing": self.spacing, "samples": self.samples,
+                       "written": time.time(), "start": start, "end": end}, f)
+
+        old = None
+        if os.path.exists(final):
+            old = tempfile.mkdtemp(dir=os.path.dirname(final))
+            os.replace(final, os.path.join(old, "tile"))
+        os.replace(tmp, final)
+        if old is not None:
+            shutil.rmtree(old)
+
+    def fetch_tiles(self, run, corners, start_time, end_time, **fetch_kwargs):
+        """ Downloads tiles in one Weather.fetch_hourly call and stores each
+
+        Args:
+            run: forecast run key
+            corners: list of (lat0, lon0)
+            start_time: first time needed
+            end_time: last time needed
+            fetch_kwargs: passed to Weather.fetch_hourly
+        """
+        axis = np.arange(self.samples) * self.spacing
+        offset_lat, offset_lon = (a.ravel() for a in np.meshgrid(axis, axis, indexing="ij"))
+        lats = np.concatenate([lat0 + offset_lat for lat0, _ in corners])
+        lons = np.concatenate([lon0 + offset_lon for _, lon0 in corners])
+        tws, twd, times = Weather.fetch_hourly(lats, lons, start_time, end_time, **fetch_kwargs)
+
+        n = self.samples ** 2
+        shape = (len(times), self.samples, self.samples)
+        for k, (lat0, lon0) in enumerate(corners):
+            field = Weather.WindField.from_speed_direction(
+                axis, axis, times, tws[k * n:(k + 1) * n].T.reshape(shape), twd[k * n:(k + 1) * n].T.reshape(shape))
+            self.write_tile(run, lat0, lon0, times, field.u, field.v, (start_time, end_time))
+
+    def load_tile(self, run, lat0, lon0):
+        """ Tile as a memory-mapped Weather.WindField """
+        return Weather.WindField.load(self.path(run, lat0, lon0), mmap_mode="r")
+
+    def load_field(self, run, lat_min, lat_max, lon_min, lon_max, start_time=None, end_time=None):
+        """ WindField covering a box from stored tiles
+
+        With a window, every tile's time axis is cut to the steps bracketing
+        it (a memory-mapped slice), so tiles fetched for different but
+        covering spans still line up. One tile is returned memory-mapped
+        without copies; several tiles are stitched into a single in-memory
+        box, which copies their u/v.
+
+        Raises:
+            ValueError: when the tiles' time axes differ
+
+        Returns:
+            Weather.WindField
+        """
+        rows = [[_window(self.load_tile(run, *corner), start_time, end_time) for corner in row]
+                for row in self.tiles_for(lat_min, lat_max, lon_min, lon_max)]
+        times = rows[0][0].times
+        for row in rows:
+            for tile in row:
+                if len(tile.times) != len(times) or not np.array_equal(tile.times, times):
+                    raise ValueError(f"tiles of run {run} have different time axes, they were fetched for different "
+                                     "windows; refetch them for one window (see corridor)")
+        if len(rows) == 1 and len(rows[0]) == 1:
+            return rows[0][0]
+
+        lats = _stitch([row[0].lats for row in rows], 0)
+        lons = _stitch([tile.lons for tile in rows[0]], 0)
+        u = _stitch([_stitch([tile.u for tile in row], 2) for row in rows], 1)
+        v = _stitch([_stitch([tile.v for tile in row], 2) for row in rows], 1)
+        return Weather.WindField(lats, lons, times, u, v)
+
+    def corridor(self, run, start, finish, start_time, end_time, padding=1.0, **fetch_kwargs):
+        """ WindField around start and finish, fetching only the tiles not yet stored
+
+        A stored tile whose fetch span does not cover [start_time, end_time]
+        counts as missing and is fetched again.
+
+        Args:
+            run: forecast run key, see run_key
+            start: (lat, lon)
+            finish: (lat, lon)
+            start_time: first time needed
+            end_time: last time needed
+            padding: degrees added around the start/finish box
+            fetch_kwargs: passed to Weather.fetch_hourly
+
+        Returns:
+            Weather.WindField
+        """
+        lat_min, lat_max = sorted([start[0], finish[0]])
+        lon_min, lon_max = sorted([start[1], finish[1]])
+        box = (lat_min - padding, lat_max + padding, lon_min - padding, lon_max + padding)
+
+        missing = [corner for row in self.tiles_for(*box) for corner in row
+                   if not self.has(run, *corner, start_time, end_time)]
+        if missing:
+            self.fetch_tiles(run, missing, start_time, end_time, **fetch_kwargs)
+        return self.load_field(run, *box, start_time, end_time)
+
+    def _tiles(self):
+        """ (path, written, bytes) of every stored tile """
+        tiles = []
+        for run in os.listdir(self.root):
+            run_dir = os.path.join(self.root, run)
+            if not os.path.isdir(run_dir):
+                continue
+            for tile in os.listdir(run_dir):
+                path = os.path.join(run_dir, tile)
+                meta = os.path.join(path, "meta.json")
+                if not os.path.exists(meta):
+                    continue
+                size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+                tiles.append((path, os.path.getmtime(meta), size))
+        return tiles
+
+    def size(self):
+        """ Total bytes held by stored tiles """
+        return sum(size for _, _, size in self._tiles())
+
+    def evict(self, max_age=None, max_bytes=None):
+        """ Deletes tiles older than max_age, then oldest tiles until under max_bytes
+
+        Args:
+            max_age: timedelta or seconds, None keeps tiles of any age
+            max_bytes: size limit for the whole store, None for no limit
+
+        Returns:
+            removed: list of deleted tile folders
+        """
+        if isinstance(max_age, timedelta):
+            max_age = max_age.total_seconds()
+
+        tiles = sorted(self._tiles(), key=lambda t: t[1])
+        total = sum(size for _, _, size in tiles)
+        now = time.time()
+
+        removed = []
+        for path, written, size in tiles:
+            too_old = max_age is not None and now - written > max_age
+            too_big = max_bytes is not None and total > max_bytes
+            if not (too_old or too_big):
+                continue
+            shutil.rmtree(path)
+            total -= size
+            removed.append(path)
+
+        for run in os.listdir(self.root):
+            run_dir = os.path.join(self.root, run)
+            if os.path.isdir(run_dir) and not os.listdir(run_dir):
+                os.rmdir(run_dir)
+        return removed
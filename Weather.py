@@ -1,58 +1,552 @@
-import openmeteo_requests
-import pandas as pd
-import requests_cache
-from retry_requests import retry
-from datetime import datetime
+import numpy as np
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time as _time
+from Stats import stats, propagate
+from collections import OrderedDict
 
 
-cache_session = requests_cache.CachedSession(".cache", expire_after=3600)
-retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-openmeteo = openmeteo_requests.Client(session=retry_session)
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _client(name):
+    """ Lazily opens the cached session, its retrying wrapper and the Open-Meteo client
+
+    Nothing touches the network stack or the .cache SQLite file until the
+    first live request, so importing Weather stays cheap for offline use.
+    """
+    with _clients_lock:
+        if not _clients:
+            import openmeteo_requests
+            import requests_cache
+            from retry_requests import retry
+            _clients["cache_session"] = requests_cache.CachedSession(".cache", expire_after=3600)
+            _clients["retry_session"] = retry(_clients["cache_session"], retries=5, backoff_factor=0.2)
+            _clients["openmeteo"] = openmeteo_requests.Client(session=_clients["retry_session"])
+    return _clients[name]
+
+
+def __getattr__(name):
+    if name in ("cache_session", "retry_session", "openmeteo"):
+        return _client(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def tws_twd(lat, lon, datetime):
     """ Access Open Meteo public weather API
 
+    Decoded days are memoized in forecast_cache, so repeated queries at the
+    same point and day cost one dict lookup. The wind is sampled at the
+    point itself unless forecast_cache was built with a cell_deg, in which
+    case it comes from the centre of the point's cell.
+
     Args:
         lat: float
         lon: float
-        datetime: datetime
+        datetime: datetime, pandas Timestamp or ISO 8601 string, naive is UTC
 
     Returns:
         wind_speed_10m: float
         wind_direction_10m: float
     """
-    time = pd.Timestamp(datetime).tz_convert("UTC") if pd.Timestamp(datetime).tzinfo else pd.Timestamp(datetime, tz="UTC")
+    return forecast_cache.get(lat, lon, datetime)
 
+
+def fetch_day(lat, lon, day):
+    """ Hourly wind for one location and UTC day
+
+    Args:
+        lat: float
+        lon: float
+        day: str YYYY-MM-DD
+
+    Returns:
+        t0: unix seconds of the first hour
+        interval: seconds between samples
+        wind_speed_10m: array
+        wind_direction_10m: array
+    """
     params = {
         "latitude": lat,
         "longitude": lon,
         "hourly": ["wind_speed_10m", "wind_direction_10m"],
-        "start_date": time.strftime("%Y-%m-%d"),
-        "end_date": time.strftime("%Y-%m-%d"),
+        "start_date": day,
+        "end_date": day,
         "wind_speed_unit": "kn",
         "timezone": "UTC",
     }
 
-    responses = openmeteo.weather_api(
-        "https://api.open-meteo.com/v1/forecast",
-        params=params
-    )
-    response = responses[0]
-
-    hourly = response.Hourly()
-    times = pd.to_datetime(hourly.Time(), unit="s", utc=True)
-
+    stats.count("weather.requests")
+    with stats.stage("weather.request"):
+        responses = _client("openmeteo").weather_api(
+            FORECAST_URL,
+            params=params
+        )
+    hourly = responses[0].Hourly()
     wind_speed = hourly.Variables(0).ValuesAsNumpy()
     wind_dir = hourly.Variables(1).ValuesAsNumpy()
+    return float(hourly.Time()), float(hourly.Interval()), wind_speed, wind_dir
+
+
+class _Fetch:
+    """ One fetch shared by every caller of get(), run outside the cache lock """
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.done = False
+        self.fetched_at = None
+        self._lock = threading.Lock()
+
+    def get(self, clock):
+        with self._lock:
+            if not self.done:
+                self.value = self.fn()
+                self.fetched_at = clock()
+                self.done = True
+            return self.value
+
+
+class ForecastCache:
+    """ Bounded LRU of decoded hourly forecasts keyed by (location, UTC day)
+
+    By default a query is fetched at its own location, rounded to the 4
+    decimals (about 10 m) the API is asked for. With cell_deg set, queries
+    are snapped to the centre of a cell_deg cell instead, so neighboring
+    points share one entry and one request at the cost of sampling the
+    wind up to half a cell away; a cell at or below the model's grid
+    spacing keeps that within the model's own resolution. Picking the hour
+    is index arithmetic on the stored arrays: nearest hour by default, or
+    u/v interpolation between the surrounding hours.
+
+    Entries older than ttl seconds are fetched again, so a long-running
+    process picks up new model runs. Concurrent misses on one key wait
+    for a single fetch.
+
+    Args:
+        maxsize: number of (cell, day) entries kept
+        cell_deg: snapping cell size in degrees, None to query exact locations
+        interpolate: interpolate between hours instead of taking the nearest
+        fetch: function(lat, lon, day) returning what fetch_day returns
+        ttl: seconds an entry is served, None keeps entries until evicted
+        clock: function returning seconds, time.monotonic by default
+    """
+
+    def __init__(self, maxsize=4096, cell_deg=None, interpolate=False, fetch=None, ttl=3600.0, clock=None):
+        self.maxsize = maxsize
+        self.cell_deg = cell_deg
+        self.interpolate = interpolate
+        self.fetch = fetch or fetch_day
+        self.ttl = ttl
+        self.clock = clock or _time.monotonic
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize,
+                "ttl": self.ttl}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def resize(self, maxsize):
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._entries) > maxsize:
+                self._entries.popitem(last=False)
+
+    def day(self, lat, lon, day):
+        """ Decoded (t0, interval, speed, direction) for a cell and day, fetched on a miss or once expired """
+        if self.cell_deg is None:
+            lat0, lon0 = round(float(lat), 4), round(float(lon), 4)
+        else:
+            lat0, lon0 = round(lat / self.cell_deg) * self.cell_deg, round(lon / self.cell_deg) * self.cell_deg
+        key = (lat0, lon0, day)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.done and self.ttl is not None and self.clock() - entry.fetched_at > self.ttl:
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                hit = True
+            else:
+                self.misses += 1
+                hit = False
+                entry = self._entries[key] = _Fetch(lambda: self.fetch(lat0, lon0, day))
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        stats.count("weather.cache_hits" if hit else "weather.cache_misses")
+
+        try:
+            return entry.get(self.clock)
+        except Exception:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            raise
+
+    def get(self, lat, lon, time):
+        """ tws, twd at a point and time """
+        t = to_epoch(time)
+        day = datetime.fromtimestamp(t, tz=timezone.utc).strftime("%Y-%m-%d")
+        t0, interval, speed, direction = self.day(lat, lon, day)
+
+        k = (t - t0) / interval
+        if not self.interpolate:
+            i = min(max(int(round(k)), 0), len(speed) - 1)
+            return float(speed[i]), float(direction[i])
+
+        i = min(max(int(np.floor(k)), 0), len(speed) - 1)
+        j = min(i + 1, len(speed) - 1)
+        w = min(max(k - i, 0.0), 1.0)
+        rad_i, rad_j = np.radians(direction[i]), np.radians(direction[j])
+        u = -(speed[i] * np.sin(rad_i) * (1 - w) + speed[j] * np.sin(rad_j) * w)
+        v = -(speed[i] * np.cos(rad_i) * (1 - w) + speed[j] * np.cos(rad_j) * w)
+        return float(np.hypot(u, v)), float(np.degrees(np.arctan2(-u, -v)) % 360)
+
+
+forecast_cache = ForecastCache()
+
+
+def to_epoch(time):
+    """ Converts times to unix seconds, naive datetimes are taken as UTC
+
+    Args:
+        time: datetime, np.datetime64, ISO 8601 string, array of any of
+            these or unix seconds
+
+    Returns:
+        seconds: float or array of floats
+    """
+    if isinstance(time, str):
+        time = datetime.fromisoformat(time)
+    if isinstance(time, datetime):
+        if time.tzinfo is None:
+            time = time.replace(tzinfo=timezone.utc)
+        return time.timestamp()
+
+    time = np.asarray(time)
+    if np.issubdtype(time.dtype, np.datetime64):
+        return (time.astype("datetime64[ms]").astype(np.float64) / 1000.0)[()]
+    if time.dtype == object or time.dtype.kind == "U":
+        return np.vectorize(to_epoch, otypes=[np.float64])(time)[()]
+    return time.astype(np.float64)[()]
+
+
+def _axis_index(axis, x):
+    """ Lower index and fractional weight of x along an ascending axis, clamped to the ends """
+    x = np.clip(x, axis[0], axis[-1])
+    i0 = np.clip(np.searchsorted(axis, x, side="right") - 1, 0, len(axis) - 1)
+    i1 = np.minimum(i0 + 1, len(axis) - 1)
+    span = axis[i1] - axis[i0]
+    w = np.divide(x - axis[i0], span, out=np.zeros(np.shape(x)), where=span > 0)
+    return i0, i1, w
+
+
+class WindField:
+    """ Wind on a regular lat/lon/time box, stored as u/v components
+
+    Args:
+        lats: ascending latitudes (n_lat,)
+        lons: ascending longitudes (n_lon,)
+        times: ascending unix seconds (n_time,)
+        u: eastward wind in knots (n_time, n_lat, n_lon)
+        v: northward wind in knots (n_time, n_lat, n_lon)
+    """
+
+    def __init__(self, lats, lons, times, u, v):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.times = np.asarray(times, dtype=np.float64)
+        self.u = u
+        self.v = v
+
+    @classmethod
+    def from_speed_direction(cls, lats, lons, times, tws, twd):
+        """ Builds a field from wind speed and meteorological direction (wind coming from)
+
+        Args:
+            lats: ascending latitudes
+            lons: ascending longitudes
+            times: ascending times, anything to_epoch accepts
+            tws: wind speed in knots (n_time, n_lat, n_lon)
+            twd: wind direction in degrees (n_time, n_lat, n_lon)
+
+        Returns:
+            WindField
+        """
+        rad = np.radians(twd)
+        u = -np.asarray(tws) * np.sin(rad)
+        v = -np.asarray(tws) * np.cos(rad)
+        return cls(lats, lons, to_epoch(times), u, v)
+
+    @classmethod
+    def fetch(cls, start, finish, start_time, end_time, spacing=0.25, padding=1.0, chunk=100, workers=8):
+        """ Downloads hourly wind for a lat/lon box around start and finish
+
+        Args:
+            start: (lat, lon)
+            finish: (lat, lon)
+            start_time: first time needed
+            end_time: last time needed
+            spacing: grid spacing in degrees
+            padding: degrees added around the start/finish box
+            chunk: locations per Open-Meteo request
+            workers: concurrent requests
+
+        Returns:
+            WindField
+        """
+        lat_min, lat_max = sorted([start[0], finish[0]])
+        lon_min, lon_max = sorted([start[1], finish[1]])
+        lats = np.arange(lat_min - padding, lat_max + padding + spacing / 2, spacing)
+        lons = np.arange(lon_min - padding, lon_max + padding + spacing / 2, spacing)
+
+        grid_lat, grid_lon = np.meshgrid(lats, lons, indexing="ij")
+        tws, twd, times = fetch_hourly(grid_lat.ravel(), grid_lon.ravel(), start_time, end_time, chunk, workers)
+
+        shape = (len(times), len(lats), len(lons))
+        return cls.from_speed_direction(lats, lons, times, tws.T.reshape(shape), twd.T.reshape(shape))
+
+    def save(self, directory):
+        """ Writes the field as .npy arrays so it can be memory-mapped on load
+
+        Args:
+            directory: folder to write into, created if missing
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in ("lats", "lons", "times", "u", "v"):
+            np.save(os.path.join(directory, name + ".npy"), np.asarray(getattr(self, name)))
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        """ Reads a field written by save
+
+        Args:
+            directory: folder written by save
+            mmap_mode: np.load mmap mode, None reads into memory
+
+        Returns:
+            WindField
+        """
+        arrays = {
+            name: np.load(os.path.join(directory, name + ".npy"), mmap_mode=mmap_mode)
+            for name in ("lats", "lons", "times", "u", "v")
+        }
+        return cls(**arrays)
+
+    def uv(self, lat, lon, time):
+        """ Trilinear interpolation of u/v, queries outside the box are clamped to its edge
+
+        Args:
+            lat: float or array
+            lon: float or array
+            time: datetime, np.datetime64 or unix seconds, scalar or array
+
+        Returns:
+            u: eastward wind in knots
+            v: northward wind in knots
+        """
+        lat, lon, t = np.broadcast_arrays(
+            np.asarray(lat, dtype=np.float64),
+            np.asarray(lon, dtype=np.float64),
+            np.asarray(to_epoch(time), dtype=np.float64))
+        return self._interpolate(lat, lon, t, ())
+
+    def _interpolate(self, lat, lon, t, lead):
+        """ Trilinear u/v with lead prepended to every (time, lat, lon) index of the arrays """
+        t0, t1, wt = _axis_index(self.times, t)
+        y0, y1, wy = _axis_index(self.lats, lat)
+        x0, x1, wx = _axis_index(self.lons, lon)
+
+        out = []
+        for comp in (self.u, self.v):
+            c00 = comp[lead + (t0, y0, x0)] * (1 - wx) + comp[lead + (t0, y0, x1)] * wx
+            c01 = comp[lead + (t0, y1, x0)] * (1 - wx) + comp[lead + (t0, y1, x1)] * wx
+            c10 = comp[lead + (t1, y0, x0)] * (1 - wx) + comp[lead + (t1, y0, x1)] * wx
+            c11 = comp[lead + (t1, y1, x0)] * (1 - wx) + comp[lead + (t1, y1, x1)] * wx
+            c0 = c00 * (1 - wy) + c01 * wy
+            c1 = c10 * (1 - wy) + c11 * wy
+            out.append(c0 * (1 - wt) + c1 * wt)
+        return out[0], out[1]
+
+    def tws_twd(self, lat, lon, time):
+        """ Wind speed and direction at points, same contract as Weather.tws_twd
+
+        Args:
+            lat: float or array
+            lon: float or array
+            time: datetime, np.datetime64 or unix seconds, scalar or array
+
+        Returns:
+            tws: wind speed in knots
+            twd: direction the wind comes from in degrees [0,360)
+        """
+        with stats.stage("weather.field"):
+            u, v = self.uv(lat, lon, time)
+        stats.count("weather.field_samples", np.size(u))
+        tws = np.hypot(u, v)
+        twd = np.degrees(np.arctan2(-u, -v)) % 360
+        return tws[()], twd[()]
+
+
+class EnsembleWindField(WindField):
+    """ Ensemble forecast: WindField with a leading member axis on u/v
+
+    Every member shares the lat/lon/time axes, so the interpolation indices
+    are computed once per query and reused for all members.
+
+    Args:
+        lats, lons, times: as WindField
+        u: eastward wind in knots (n_members, n_time, n_lat, n_lon)
+        v: northward wind in knots (n_members, n_time, n_lat, n_lon)
+    """
+
+    @classmethod
+    def from_members(cls, fields):
+        """ Stacks WindFields that share their axes into one ensemble """
+        first = fields[0]
+        for field in fields[1:]:
+            if not (np.array_equal(field.lats, first.lats) and np.array_equal(field.lons, first.lons)
+                    and np.array_equal(field.times, first.times)):
+                raise ValueError("ensemble members must share lats, lons and times")
+        return cls(first.lats, first.lons, first.times,
+                   np.stack([f.u for f in fields]), np.stack([f.v for f in fields]))
+
+    @property
+    def members(self):
+        return self.u.shape[0]
+
+    def member(self, k):
+        """ Member k as a plain WindField (views, no copy) """
+        return WindField(self.lats, self.lons, self.times, self.u[k], self.v[k])
+
+    def mean(self):
+        """ Ensemble mean of u/v as a WindField """
+        return WindField(self.lats, self.lons, self.times, np.mean(self.u, axis=0), np.mean(self.v, axis=0))
+
+    def uv(self, lat, lon, time, member=None):
+        """ u/v in every member, or in one member per sample
+
+        Args:
+            lat, lon, time: as WindField.uv
+            member: member index per sample, None evaluates all members
+
+        Returns:
+            u, v: (n_members,) + broadcast shape when member is None,
+                otherwise the broadcast shape including member
+        """
+        arrays = [np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64),
+                  np.asarray(to_epoch(time), dtype=np.float64)]
+        if member is None:
+            lat, lon, t = np.broadcast_arrays(*arrays)
+            return self._interpolate(lat, lon, t, (slice(None),))
+        lat, lon, t, member = np.broadcast_arrays(*arrays, np.asarray(member))
+        return self._interpolate(lat, lon, t, (member,))
+
+    def tws_twd(self, lat, lon, time, member=None):
+        """ Wind speed and direction, in every member or one member per sample, see uv """
+        with stats.stage("weather.field"):
+            u, v = self.uv(lat, lon, time, member)
+        stats.count("weather.field_samples", np.size(u))
+        tws = np.hypot(u, v)
+        twd = np.degrees(np.arctan2(-u, -v)) % 360
+        return tws[()], twd[()]
+
+
+def pooled_session(workers=8, session=None):
+    """ The cached retry session with a connection pool sized for workers threads
+
+    Args:
+        workers: number of threads that will share the session
+        session: retrying session to re-mount, retry_session when None
+
+    Returns:
+        session: the session with its adapters re-mounted
+    """
+    from requests.adapters import HTTPAdapter
+    session = session or _client("retry_session")
+    adapter = session.get_adapter("https://")
+    if getattr(adapter, "_pool_maxsize", 0) < workers:
+        pooled = HTTPAdapter(max_retries=adapter.max_retries, pool_connections=workers, pool_maxsize=workers)
+        for prefix in ("http://", "https://"):
+            session.mount(prefix, pooled)
+    return session
+
+
+def _fetch_chunk(session, url, lats, lons, start_day, end_day):
+    """ One multi-coordinate JSON request, returns (tws, twd, times) for its locations """
+    params = {
+        "latitude": ",".join(f"{x:.4f}" for x in lats),
+        "longitude": ",".join(f"{x:.4f}" for x in lons),
+        "hourly": "wind_speed_10m,wind_direction_10m",
+        "start_date": start_day,
+        "end_date": end_day,
+        "wind_speed_unit": "kn",
+        "timezone": "UTC",
+        "timeformat": "unixtime",
+    }
+    stats.count("weather.requests")
+    with stats.stage("weather.request"):
+        response = session.get(url, params=params, timeout=60)
+    response.raise_for_status()
+    body = response.json()
+    locations = body if isinstance(body, list) else [body]
+
+    tws = np.array([loc["hourly"]["wind_speed_10m"] for loc in locations], dtype=np.float64)
+    twd = np.array([loc["hourly"]["wind_direction_10m"] for loc in locations], dtype=np.float64)
+    times = np.array(locations[0]["hourly"]["time"], dtype=np.float64)
+    return tws, twd, times
+
+
+def fetch_hourly(lats, lons, start_time, end_time, chunk=100, workers=8, url=FORECAST_URL, session=None):
+    """ Hourly wind for many locations using concurrent multi-coordinate requests
+
+    Locations are grouped chunk at a time into one Open-Meteo request each,
+    and the requests run on a bounded thread pool over one pooled, cached
+    and retrying session. Responses are JSON so any stand-in server can
+    answer them.
+
+    Args:
+        lats: array of latitudes
+        lons: array of longitudes
+        start_time: first time needed
+        end_time: last time needed
+        chunk: locations per request
+        workers: concurrent requests
+        url: forecast endpoint
+        session: requests session, pooled_session(workers) when None
+
+    Returns:
+        tws: wind speed in knots (n_points, n_time)
+        twd: wind direction in degrees (n_points, n_time)
+        times: unix seconds (n_time,)
+    """
+    session = session or pooled_session(workers)
+    start_day = datetime.fromtimestamp(to_epoch(start_time), tz=timezone.utc).strftime("%Y-%m-%d")
+    end_day = datetime.fromtimestamp(to_epoch(end_time), tz=timezone.utc).strftime("%Y-%m-%d")
+    lats, lons = np.ravel(lats), np.ravel(lons)
 
-    df = pd.DataFrame({
-        "time": times,
-        "wind_speed_10m": wind_speed,
-        "wind_direction_10m": wind_dir,
-    })
+    def fetch(i):
+        return _fetch_chunk(session, url, lats[i:i + chunk], lons[i:i + chunk], start_day, end_day)
 
-    idx = (df["time"] - time).abs().idxmin()
-    row = df.loc[idx]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(propagate(fetch), i) for i in range(0, len(lats), chunk)]
+        results = [future.result() for future in futures]
 
-    return row["wind_speed_10m"], row["wind_direction_10m"]
+    tws = np.concatenate([r[0] for r in results])
+    twd = np.concatenate([r[1] for r in results])
+    return tws, twd, results[0][2]
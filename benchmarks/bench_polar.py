@@ -0,0 +1,39 @@
+""" Compares the scalar Functions.find_speed path with the vectorized Polar
+
+Run from the repo root:
+    python -m benchmarks.bench_polar
+"""
+import time
+import numpy as np
+import Functions as func
+from Polars import Polar
+
+
+def bench(polar_csv="j99polars.csv", n_scalar=2000, n_vector=1_000_000, seed=0):
+    polars = func.polarpandas(polar_csv)
+    polar = Polar.from_dataframe(polars)
+
+    rng = np.random.default_rng(seed)
+    tws = rng.uniform(0, 25, n_vector)
+    twa = rng.uniform(0, 180, n_vector)
+
+    t = time.perf_counter()
+    scalar = [func.find_speed(polars, tws[i], twa[i]) for i in range(n_scalar)]
+    scalar_s = (time.perf_counter() - t) / n_scalar
+
+    t = time.perf_counter()
+    vector = polar.speed(tws, twa)
+    vector_s = (time.perf_counter() - t) / n_vector
+
+    max_err = float(np.max(np.abs(vector[:n_scalar] - np.array(scalar))))
+    return {
+        "scalar_us_per_sample": scalar_s * 1e6,
+        "vector_us_per_sample": vector_s * 1e6,
+        "speedup": scalar_s / vector_s,
+        "max_abs_diff": max_err,
+    }
+
+
+if __name__ == "__main__":
+    for key, value in bench().items():
+        print(f"{key:>22}: {value:.4g}")
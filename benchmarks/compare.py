@@ -0,0 +1,37 @@
+""" Compares two benchmark runs written by benchmarks.run
+
+    python -m benchmarks.compare base.jsonl new.jsonl --threshold 1.2
+
+Cases are matched on (name, params). Prints the time ratio of each case
+and exits with status 1 if any case got slower than the threshold.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return {(r["name"], json.dumps(r["params"], sort_keys=True)): r["seconds"] for r in records}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark runs")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=1.25, help="new/base ratio counted as a regression")
+    args = parser.parse_args(argv)
+
+    base, new = load(args.base), load(args.new)
+    regressions = 0
+    for key in sorted(base.keys() & new.keys()):
+        ratio = new[key] / base[key] if base[key] > 0 else float("inf")
+        flag = "REGRESSION" if ratio > args.threshold else ""
+        regressions += bool(flag)
+        print(f"{ratio:7.2f}x  {key[0]:<24} {key[1]}  {flag}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
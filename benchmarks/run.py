@@ -0,0 +1,256 @@
+""" Offline benchmark suite for the core routing paths
+
+Wind comes from benchmarks.synthetic, so nothing touches the network and
+results are comparable between commits. Each case is written as one JSON
+object per line (name, params, seconds, per-call figures).
+
+Run from the repo root:
+    python -m benchmarks.run                 # full sweep to stdout
+    python -m benchmarks.run --quick --out bench.jsonl
+    python -m benchmarks.run --only isochrones grid
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+from datetime import datetime
+import Ensemble
+import Functions as func
+import Geodesy as geo
+import GridNavigation as GN
+import Isochrones as iso
+import LandMask
+import Stats
+from Polars import Polar
+from Replan import Replanner
+from benchmarks import synthetic
+
+START = (41.4918, -71.3119)
+FINISH = (32.3078, -64.7505)
+START_TIME = datetime(2026, 10, 17)
+
+
+def timed(fn, repeat=3):
+    """ Best wall time of fn() over repeat runs, and its last result """
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t)
+    return best, result
+
+
+def bench_speed(ctx, quick):
+    polars, polar = ctx["polars"], ctx["polar"]
+    rng = np.random.default_rng(0)
+    n = 1000 if quick else 5000
+    tws, twa = rng.uniform(0, 25, n), rng.uniform(0, 180, n)
+
+    seconds, _ = timed(lambda: [func.find_speed(polars, tws[i], twa[i]) for i in range(n)], repeat=1)
+    yield "find_speed", {"impl": "scalar", "n": n}, seconds, {"us_per_call": seconds / n * 1e6}
+
+    for n in ([10_000, 1_000_000] if quick else [10_000, 1_000_000, 10_000_000]):
+        tws, twa = rng.uniform(0, 25, n), rng.uniform(0, 180, n)
+        seconds, _ = timed(lambda: polar.speed(tws, twa))
+        yield "find_speed", {"impl": "polar", "n": n}, seconds, {"us_per_call": seconds / n * 1e6}
+
+
+def bench_new_pos(ctx, quick):
+    rng = np.random.default_rng(1)
+    n = 500 if quick else 2000
+    lat, lon = rng.uniform(-60, 60, n), rng.uniform(-180, 180, n)
+    hdg, dist = rng.uniform(0, 360, n), rng.uniform(1, 100, n)
+
+    seconds, _ = timed(lambda: [func.find_new_pos(lat[i], lon[i], hdg[i], dist[i]) for i in range(n)], repeat=1)
+    yield "find_new_pos", {"impl": "geopy", "n": n}, seconds, {"us_per_call": seconds / n * 1e6}
+
+    for mode in geo.MODES:
+        for n in ([10_000, 1_000_000] if quick else [10_000, 1_000_000, 5_000_000]):
+            lat, lon = rng.uniform(-60, 60, n), rng.uniform(-180, 180, n)
+            hdg, dist = rng.uniform(0, 360, n), rng.uniform(1, 100, n)
+            seconds, _ = timed(lambda: geo.destination(lat, lon, hdg, dist, mode))
+            yield "find_new_pos", {"impl": mode, "n": n}, seconds, {"us_per_call": seconds / n * 1e6}
+
+
+def bench_isochrones(ctx, quick):
+    for name, wind in ctx["winds"].items():
+        steps = 3 if quick else 4
+        seconds, fronts = timed(lambda: iso.build_isochrones(
+            ctx["polars"], START_TIME, *START, *FINISH, h_step=10, steps=steps, wind=wind), repeat=1)
+        yield "build_isochrones", {"impl": "legacy", "wind": name, "h_step": 10, "steps": steps}, seconds, \
+            {"frontier": len(fronts[-1])}
+
+        for h_step in ([5, 2] if quick else [10, 5, 2, 1]):
+            for n_sectors in ([100] if quick else [50, 100, 400]):
+                for sampling in iso.SAMPLING:
+                    seconds, fronts = timed(lambda: iso.build_isochrone_fronts(
+                        ctx["polar"], START_TIME, *START, *FINISH, h_step=h_step, steps=8, n_sectors=n_sectors,
+                        wind=wind, sampling=sampling))
+                    yield "build_isochrones", {"impl": "fronts", "wind": name, "h_step": h_step, "steps": 8,
+                                               "n_sectors": n_sectors, "sampling": sampling}, seconds, \
+                        {"frontier": len(fronts[-1])}
+
+            for sampling in iso.SAMPLING:
+                with Stats.collect() as counts:
+                    seconds, result = timed(lambda: iso.route_isochrones(
+                        ctx["polar"], START_TIME, *START, *FINISH, dt_hours=3, h_step=h_step, wind=wind,
+                        sampling=sampling), repeat=1)
+                hours = (result.eta - START_TIME).total_seconds() / 3600 if result.eta else float("inf")
+                yield "route_isochrones", {"wind": name, "h_step": h_step, "sampling": sampling}, seconds, \
+                    {"hours": hours, "evaluations": counts.counters["polar.evaluations"]}
+
+
+def bench_fleet(ctx, quick):
+    polar = ctx["polar"]
+    for n_boats in ([4, 16] if quick else [4, 16, 64]):
+        boats = [Polar(polar.twa, polar.tws * (0.9 + 0.2 * k / n_boats), polar.bsp * (0.85 + 0.3 * k / n_boats))
+                 for k in range(n_boats)]
+        for name, wind in ctx["winds"].items():
+            seconds, _ = timed(lambda: [iso.route_isochrones(b, START_TIME, *START, *FINISH, dt_hours=3, wind=wind)
+                                        for b in boats], repeat=1)
+            yield "route_fleet", {"impl": "separate", "wind": name, "boats": n_boats}, seconds, {}
+            seconds, _ = timed(lambda: iso.route_fleet(boats, START_TIME, *START, *FINISH, dt_hours=3, wind=wind), repeat=1)
+            yield "route_fleet", {"impl": "stacked", "wind": name, "boats": n_boats}, seconds, {}
+
+
+def bench_ensemble(ctx, quick):
+    polar = ctx["polar"]
+    for members in ([10, 30] if quick else [10, 30, 50]):
+        ens = synthetic.ensemble(START, FINISH, START_TIME, members=members)
+        seconds, _ = timed(lambda: iso.route_isochrones(polar, START_TIME, *START, *FINISH, dt_hours=3, wind=ens.member(0)))
+        yield "route_ensemble", {"impl": "deterministic", "members": members}, seconds, {}
+        for member_routes in (False, True):
+            seconds, result = timed(lambda: Ensemble.route_ensemble(
+                polar, ens, START_TIME, *START, *FINISH, objective=90, member_routes=member_routes, dt_hours=3), repeat=1)
+            yield "route_ensemble", {"impl": "members" if member_routes else "mean", "members": members}, seconds, \
+                {"candidates": len(result.candidates), **result.summary}
+
+
+def bench_land(ctx, quick):
+    polygons = synthetic.islands(START, FINISH, count=12, radius=0.4)
+    for resolution in ([0.05, 0.01] if quick else [0.05, 0.01, 0.005]):
+        seconds, land = timed(lambda: LandMask.LandMask.from_polygons(polygons, resolution), repeat=1)
+        yield "land_rasterize", {"resolution": resolution}, seconds, {"bytes": land.nbytes}
+
+    rng = np.random.default_rng(0)
+    n = 100_000 if quick else 1_000_000
+    lat, lon = rng.uniform(FINISH[0], START[0], n), rng.uniform(START[1], FINISH[1], n)
+    seconds, _ = timed(lambda: land.is_water(lat, lon))
+    yield "land_is_water", {"points": n}, seconds, {"per_point": seconds / n}
+    seconds, _ = timed(lambda: land.leg_clear(lat[:-1], lon[:-1], lat[:-1] + 0.5, lon[:-1] + 0.5))
+    yield "land_leg_clear", {"legs": n - 1, "leg_deg": 0.5}, seconds, {"per_leg": seconds / (n - 1)}
+
+    for resolution in ([50, 200] if quick else [50, 200, 500]):
+        for mask in (None, land):
+            seconds, grid = timed(lambda: GN.build_grid(START, FINISH, 5, resolution, mask))
+            yield "land_grid", {"resolution": resolution, "land": mask is not None}, seconds, {"nodes": len(grid)}
+
+    for name, wind in ctx["winds"].items():
+        for mask in (None, land):
+            seconds, route = timed(lambda: iso.route_isochrones(ctx["polar"], START_TIME, *START, *FINISH, dt_hours=3,
+                                                                wind=wind, land=mask))
+            hours = (route.eta - START_TIME).total_seconds() / 3600 if route.eta else None
+            yield "land_isochrones", {"wind": name, "land": mask is not None}, seconds, {"hours": hours}
+
+
+def bench_grid(ctx, quick):
+    for resolution in ([20, 50] if quick else [20, 50, 100]):
+        seconds, _ = timed(lambda: GN.create_grid(START, FINISH, 5, resolution), repeat=1)
+        yield "create_grid", {"impl": "dict", "resolution": resolution}, seconds, {}
+    for resolution in ([50, 200] if quick else [50, 200, 1000]):
+        seconds, grid = timed(lambda: GN.build_grid(START, FINISH, 5, resolution))
+        yield "create_grid", {"impl": "csr", "resolution": resolution}, seconds, {"nodes": len(grid), "bytes": grid.nbytes}
+
+    for spacing in ([40, 20] if quick else [40, 20, 10]):
+        seconds, _ = timed(lambda: GN.create_hexagonal_grid(START, FINISH, spacing), repeat=1)
+        yield "create_hexagonal_grid", {"impl": "dict", "spacing_km": spacing}, seconds, {}
+    for spacing in ([20, 5] if quick else [20, 5, 2]):
+        seconds, grid = timed(lambda: GN.build_hex_grid(START, FINISH, spacing))
+        yield "create_hexagonal_grid", {"impl": "csr", "spacing_km": spacing}, seconds, {"nodes": len(grid), "bytes": grid.nbytes}
+
+
+def bench_routing(ctx, quick):
+    for name, wind in ctx["winds"].items():
+        for resolution in ([20, 40] if quick else [20, 40, 80]):
+            grid = GN.build_grid(START, FINISH, 5, resolution)
+            start, finish = GN.nearest_node(grid, *START), GN.nearest_node(grid, *FINISH)
+            for heuristic in GN.HEURISTICS:
+                seconds, route = timed(lambda: GN.astar_grid(
+                    grid, start, finish, ctx["polar"], START_TIME, wind, heuristic), repeat=1)
+                yield "astar", {"wind": name, "resolution": resolution, "heuristic": heuristic}, seconds, \
+                    {"nodes": len(grid), "expanded": route.expanded, "hours": route.hours}
+
+        grid = GN.build_grid(START, FINISH, 5, 40 if quick else 100)
+        start, finish = GN.nearest_node(grid, *START), GN.nearest_node(grid, *FINISH)
+        planner = Replanner(grid, start, finish, ctx["polar"], wind, START_TIME)
+        seconds, plan = timed(planner.plan, repeat=1)
+        yield "replan", {"wind": name, "nodes": len(grid), "update": "cold"}, seconds, \
+            {"expanded": plan.expanded, "hours": plan.hours}
+        boat = plan.nodes[len(plan.nodes) // 4]
+        planner.update(position=boat)
+        lat, lon = grid.position(boat)
+        update = synthetic.revised(wind, lat - 1, lat + 1, lon - 1, lon + 1)
+        seconds, plan = timed(lambda: planner.update(wind=update), repeat=1)
+        yield "replan", {"wind": name, "nodes": len(grid), "update": "near boat"}, seconds, \
+            {"expanded": plan.expanded, "changed": plan.changed, "hours": plan.hours}
+
+        resolutions = (20, 40, 80) if quick else (25, 50, 100, 200)
+        seconds, result = timed(lambda: GN.route_hierarchical(
+            START, FINISH, ctx["polar"], START_TIME, resolutions, wind=wind, compare=True), repeat=1)
+        yield "astar_hierarchical", {"wind": name, "resolutions": list(resolutions)}, seconds, result.quality
+
+
+BENCHES = {
+    "speed": bench_speed,
+    "new_pos": bench_new_pos,
+    "isochrones": bench_isochrones,
+    "fleet": bench_fleet,
+    "ensemble": bench_ensemble,
+    "land": bench_land,
+    "grid": bench_grid,
+    "routing": bench_routing,
+}
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks on synthetic wind")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes for a fast smoke run")
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHES), help="benchmarks to run")
+    parser.add_argument("--winds", nargs="*", choices=sorted(synthetic.FIELDS), default=sorted(synthetic.FIELDS))
+    parser.add_argument("--polars", default="j99polars.csv")
+    parser.add_argument("--out", help="write JSON lines here instead of stdout")
+    args = parser.parse_args(argv)
+
+    polars = func.polarpandas(args.polars)
+    ctx = {
+        "polars": polars,
+        "polar": Polar.from_dataframe(polars),
+        "winds": {name: synthetic.FIELDS[name](START, FINISH, START_TIME) for name in args.winds},
+    }
+    meta = {"commit": _commit(), "python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "quick": args.quick}
+
+    out = open(args.out, "w") if args.out else sys.stdout
+    try:
+        for bench in args.only or BENCHES:
+            for name, params, seconds, extra in BENCHES[bench](ctx, args.quick):
+                record = {"bench": bench, "name": name, "params": params, "seconds": seconds, **extra, **meta}
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+""" Deterministic synthetic wind fields and land for offline benchmarks
+
+Every wind generator returns a Weather.WindField on a regular box, so the
+routing code runs exactly as with downloaded wind but without network.
+islands gives polygons for LandMask.LandMask.from_polygons.
+"""
+import numpy as np
+import Weather
+
+
+def _axes(start, finish, start_time, hours, spacing, padding, step_hours):
+    lat_min, lat_max = sorted([start[0], finish[0]])
+    lon_min, lon_max = sorted([start[1], finish[1]])
+    lats = np.arange(lat_min - padding, lat_max + padding + spacing / 2, spacing)
+    lons = np.arange(lon_min - padding, lon_max + padding + spacing / 2, spacing)
+    times = Weather.to_epoch(start_time) + 3600.0 * np.arange(0, hours + step_hours, step_hours)
+    t, lat, lon = np.meshgrid((times - times[0]) / 3600.0, lats, lons, indexing="ij")
+    return lats, lons, times, t, lat, lon
+
+
+def uniform(start, finish, start_time, hours=240, tws=12.0, twd=225.0, spacing=0.5, padding=2.0, step_hours=3):
+    """ Same wind everywhere at all times """
+    lats, lons, times, t, lat, lon = _axes(start, finish, start_time, hours, spacing, padding, step_hours)
+    return Weather.WindField.from_speed_direction(lats, lons, times, np.full(t.shape, tws), np.full(t.shape, twd))
+
+
+def rotating(start, finish, start_time, hours=240, tws=12.0, period_hours=48, spacing=0.5, padding=2.0, step_hours=3):
+    """ Wind veering steadily through 360 degrees every period_hours, strongest in the middle of the box """
+    lats, lons, times, t, lat, lon = _axes(start, finish, start_time, hours, spacing, padding, step_hours)
+    mid_lat, mid_lon = lats.mean(), lons.mean()
+    sigma = 0.25 * (np.ptp(lats) + np.ptp(lons))
+    falloff = np.exp(-((lat - mid_lat) ** 2 + (lon - mid_lon) ** 2) / (2 * sigma ** 2))
+    return Weather.WindField.from_speed_direction(
+        lats, lons, times, tws * (0.6 + 0.4 * falloff), (360.0 * t / period_hours) % 360)
+
+
+def frontal(start, finish, start_time, hours=240, speed_kn=15.0, spacing=0.5, padding=2.0, step_hours=3):
+    """ A cold front sweeping west to east: south-westerly 14 kt ahead, north-westerly 20 kt behind """
+    lats, lons, times, t, lat, lon = _axes(start, finish, start_time, hours, spacing, padding, step_hours)
+    deg_per_hour = speed_kn / 60.0
+    front_lon = lons[0] + deg_per_hour * t + 0.3 * (lat - lats.mean())
+    behind = 1 / (1 + np.exp(-(front_lon - lon) / 0.5))
+    tws = 14 + 6 * behind
+    twd = 225 + 90 * behind
+    return Weather.WindField.from_speed_direction(lats, lons, times, tws, twd % 360)
+
+
+FIELDS = {"uniform": uniform, "rotating": rotating, "frontal": frontal}
+
+
+def revised(field, lat_min, lat_max, lon_min, lon_max, scale=0.6):
+    """ Copy of a field with the wind inside a box scaled, a stand-in for a forecast update """
+    u, v = np.array(field.u), np.array(field.v)
+    inside = ((field.lats >= lat_min) & (field.lats <= lat_max))[:, None] & \
+             ((field.lons >= lon_min) & (field.lons <= lon_max))[None, :]
+    u[:, inside] *= scale
+    v[:, inside] *= scale
+    return Weather.WindField(field.lats, field.lons, field.times, u, v)
+
+
+def ensemble(start, finish, start_time, members=30, seed=0, **kwargs):
+    """ Ensemble of frontal fields, members differ in front speed and wind strength """
+    rng = np.random.default_rng(seed)
+    fields = []
+    for _ in range(members):
+        field = frontal(start, finish, start_time, speed_kn=15.0 * rng.uniform(0.7, 1.3), **kwargs)
+        scale = rng.uniform(0.85, 1.15)
+        fields.append(Weather.WindField(field.lats, field.lons, field.times, field.u * scale, field.v * scale))
+    return Weather.EnsembleWindField.from_members(fields)
+
+
+def islands(start, finish, count=40, radius=0.6, vertices=24, seed=0):
+    """ Irregular island polygons scattered between start and finish, as lists of (lon, lat) rings """
+    rng = np.random.default_rng(seed)
+    lat_min, lat_max = sorted([start[0], finish[0]])
+    lon_min, lon_max = sorted([start[1], finish[1]])
+    polygons = []
+    for _ in range(count):
+        lat, lon = rng.uniform(lat_min, lat_max), rng.uniform(lon_min, lon_max)
+        angle = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+        r = radius * rng.uniform(0.3, 1.0) * rng.uniform(0.6, 1.0, vertices)
+        ring = np.column_stack([lon + r * np.cos(angle) / np.cos(np.radians(lat)), lat + r * np.sin(angle)])
+        polygons.append([ring.tolist()])
+    return polygons
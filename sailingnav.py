@@ -0,0 +1,248 @@
+""" Headless command line entry point
+
+    python sailingnav.py route --wind wind/ --method isochrones
+    python sailingnav.py isochrones --steps 8 --out fronts.geojson
+    python sailingnav.py grid --kind hex --spacing-km 20 --out grid.html
+    python sailingnav.py route --land ne_10m_land.geojson --land-resolution 0.02
+    python sailingnav.py fleet --boats j99polars.csv other.csv --wind wind/
+    python sailingnav.py benchmark --quick
+    python sailingnav.py sweep --window-start ... (see Sweep.main)
+    python sailingnav.py serve --wind wind/ --port 8080
+
+Results go to stdout as JSON and nothing is rendered unless --out is
+given. Only numpy and the routing modules are imported up front; the
+weather client, pandas, geopy and folium load on first use, and polars
+come from Polar.load's binary cache, so an offline route starts in well
+under a second.
+"""
+import argparse
+import json
+import sys
+from datetime import datetime, timezone
+
+START = (41.4918, -71.3119)
+FINISH = (32.3078, -64.7505)
+
+
+def _wind(args):
+    """ WindField saved with WindField.save, or None for the live API """
+    if not args.wind:
+        return None
+    import Weather
+    return Weather.WindField.load(args.wind, mmap_mode="r")
+
+
+def _land(args):
+    """ LandMask from --land, a saved mask folder or a GeoJSON/shapefile rasterized once and cached """
+    if not args.land:
+        return None
+    import LandMask
+    return LandMask.LandMask.read(args.land, args.land_resolution)
+
+
+def _export(path, start, finish, **layers):
+    """ Writes layers to path, GeoJSON or a Leaflet page depending on the extension """
+    import Export
+    if path.endswith(".html"):
+        Export.write_map(path, start, finish, **layers)
+    else:
+        Export.write_geojson(path, start, finish, **layers)
+
+
+def _emit(result, collected):
+    if collected is not None:
+        result["stats"] = collected.to_dict()
+    json.dump(result, sys.stdout, default=str)
+    sys.stdout.write("\n")
+
+
+def cmd_route(args, polar):
+    wind = _wind(args)
+    start, finish = tuple(args.start), tuple(args.finish)
+    if args.method == "isochrones":
+        import Isochrones as iso
+        result = iso.route_isochrones(polar, args.time, *start, *finish, dt_hours=args.dt_hours, h_step=args.h_step,
+                                      max_dev=args.max_dev, n_sectors=args.n_sectors, wind=wind, sampling=args.sampling,
+                                      land=_land(args))
+        route, eta = [(lat, lon) for lat, lon, _ in result.route], result.eta
+        layers = {"isochrones": result.fronts}
+    else:
+        import GridNavigation as GN
+        grid = GN.build_grid(start, finish, args.padding, args.resolution, _land(args))
+        result = GN.astar_grid(grid, GN.nearest_node(grid, *start), GN.nearest_node(grid, *finish), polar, args.time,
+                               wind, args.heuristic)
+        route, eta = result.path, result.eta
+        layers = {}
+
+    if args.out:
+        _export(args.out, start, finish, route=route, **layers)
+    hours = (eta - args.time).total_seconds() / 3600 if eta else None
+    return {"method": args.method, "departure": args.time, "eta": eta, "hours": hours,
+            "route": [[round(float(lat), 5), round(float(lon), 5)] for lat, lon in route]}
+
+
+def cmd_fleet(args, polar):
+    import Isochrones as iso
+    from Polars import Polar
+    start, finish = tuple(args.start), tuple(args.finish)
+    boats = [polar] + [Polar.load(path) for path in args.boats]
+    names = [args.polars] + args.boats
+    routes = iso.route_fleet(boats, args.time, *start, *finish, dt_hours=args.dt_hours, h_step=args.h_step,
+                             max_dev=args.max_dev, n_sectors=args.n_sectors, wind=_wind(args), sampling=args.sampling,
+                             land=_land(args))
+    return {"boats": [{"polars": name, "eta": r.eta,
+                       "hours": (r.eta - args.time).total_seconds() / 3600 if r.eta else None,
+                       "route": [[round(float(lat), 5), round(float(lon), 5)] for lat, lon, _ in r.route]}
+                      for name, r in zip(names, routes)]}
+
+
+def cmd_isochrones(args, polar):
+    import Isochrones as iso
+    start, finish = tuple(args.start), tuple(args.finish)
+    fronts = iso.build_isochrone_fronts(polar, args.time, *start, *finish, dt_hours=args.dt_hours, h_step=args.h_step,
+                                        max_dev=args.max_dev, steps=args.steps, n_sectors=args.n_sectors,
+                                        wind=_wind(args), sampling=args.sampling, land=_land(args))
+    if args.out:
+        _export(args.out, start, finish, isochrones=fronts)
+    return {"fronts": [{"time": front.time, "points": len(front)} for front in fronts]}
+
+
+def cmd_grid(args, polar):
+    import GridNavigation as GN
+    start, finish = tuple(args.start), tuple(args.finish)
+    if args.kind == "hex":
+        grid = GN.build_hex_grid(start, finish, args.spacing_km, _land(args))
+    else:
+        grid = GN.build_grid(start, finish, args.padding, args.resolution, _land(args))
+    if args.out:
+        _export(args.out, start, finish, grid=grid, stride=args.stride, max_points=args.max_points)
+    return {"kind": grid.kind, "nodes": len(grid), "edges": len(grid.indices), "bytes": grid.nbytes}
+
+
+def cmd_serve(args):
+    import Server
+    service = Server.RoutingService(args.polars, _wind(args), args.workers, args.cache_size, land=_land(args),
+                                    max_resolution=args.max_resolution)
+    try:
+        if args.stdio:
+            Server.serve_stdio(service)
+        else:
+            server = Server.serve(service, args.host, args.port)
+            sys.stderr.write("serving on http://%s:%d\n" % server.server_address[:2])
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            server.server_close()
+    finally:
+        service.close()
+    return 0
+
+
+def _common(parser):
+    parser.add_argument("--start", nargs=2, type=float, default=START, metavar=("LAT", "LON"))
+    parser.add_argument("--finish", nargs=2, type=float, default=FINISH, metavar=("LAT", "LON"))
+    parser.add_argument("--time", type=datetime.fromisoformat, default=None, help="departure, ISO format, UTC; now when omitted")
+    parser.add_argument("--polars", default="j99polars.csv")
+    parser.add_argument("--wind", help="folder written by WindField.save, live API when omitted")
+    _land_options(parser)
+    parser.add_argument("--out", help="write a .geojson or .html export here")
+    parser.add_argument("--stats", action="store_true", help="include counters and stage timings in the output")
+
+
+def _land_options(parser):
+    parser.add_argument("--land", help="land mask folder, GeoJSON or shapefile; legs and nodes on land are dropped")
+    parser.add_argument("--land-resolution", type=float, default=0.05, help="raster cell in degrees for vector files")
+
+
+def _isochrone_options(parser):
+    parser.add_argument("--dt-hours", type=float, default=3)
+    parser.add_argument("--h-step", type=float, default=5)
+    parser.add_argument("--max-dev", type=float, default=60)
+    parser.add_argument("--n-sectors", type=int, default=100)
+    parser.add_argument("--sampling", default="fan", choices=["fan", "vmg"])
+
+
+def _grid_options(parser):
+    parser.add_argument("--resolution", type=int, default=50)
+    parser.add_argument("--padding", type=int, default=5)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="sailingnav", description="Weather routing from the command line")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    route = sub.add_parser("route", help="route from start to finish")
+    _common(route)
+    _isochrone_options(route)
+    _grid_options(route)
+    route.add_argument("--method", default="isochrones", choices=["isochrones", "grid"])
+    route.add_argument("--heuristic", default="polar", choices=["zero", "polar", "wind", "table"])
+    route.set_defaults(run=cmd_route)
+
+    isochrones = sub.add_parser("isochrones", help="build a fixed number of isochrone fronts")
+    _common(isochrones)
+    _isochrone_options(isochrones)
+    isochrones.add_argument("--steps", type=int, default=8)
+    isochrones.set_defaults(run=cmd_isochrones)
+
+    fleet = sub.add_parser("fleet", help="route several boats in one pass, --polars is the first boat")
+    _common(fleet)
+    _isochrone_options(fleet)
+    fleet.add_argument("--boats", nargs="+", default=[], help="polar csv files of the other boats")
+    fleet.set_defaults(run=cmd_fleet)
+
+    grid = sub.add_parser("grid", help="build and export a routing grid")
+    _common(grid)
+    _grid_options(grid)
+    grid.add_argument("--kind", default="rect", choices=["rect", "hex"])
+    grid.add_argument("--spacing-km", type=float, default=20)
+    grid.add_argument("--stride", type=int, default=1)
+    grid.add_argument("--max-points", type=int, default=None)
+    grid.set_defaults(run=cmd_grid)
+
+    serve = sub.add_parser("serve", help="routing service over HTTP or JSON lines on stdin")
+    serve.add_argument("--polars", default="j99polars.csv")
+    serve.add_argument("--wind", help="folder written by WindField.save, live API when omitted")
+    _land_options(serve)
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.add_argument("--stdio", action="store_true", help="JSON lines on stdin/stdout instead of HTTP")
+    serve.add_argument("--workers", type=int, default=4)
+    serve.add_argument("--cache-size", type=int, default=256)
+    serve.add_argument("--max-resolution", type=int, default=400, help="grid queries asking for more are clamped")
+
+    sub.add_parser("benchmark", help="offline benchmarks, arguments go to benchmarks.run", add_help=False)
+    sub.add_parser("sweep", help="departure sweep, arguments go to Sweep", add_help=False)
+
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] == "benchmark":
+        from benchmarks import run
+        run.main(argv[1:])
+        return 0
+    if argv and argv[0] == "sweep":
+        import Sweep
+        Sweep.main(argv[1:])
+        return 0
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        return cmd_serve(args)
+    if args.time is None:
+        args.time = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+    from Polars import Polar
+    import Stats
+    polar = Polar.load(args.polars)
+    if args.stats:
+        with Stats.collect() as collected:
+            result = args.run(args, polar)
+    else:
+        collected = None
+        result = args.run(args, polar)
+    _emit(result, collected)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
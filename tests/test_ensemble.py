@@ -0,0 +1,54 @@
+import json
+from datetime import datetime
+import numpy as np
+import Ensemble
+import Weather
+from Polars import Polar
+from benchmarks import synthetic
+
+START = (41.4918, -71.3119)
+FINISH = (32.3078, -64.7505)
+START_TIME = datetime(2026, 10, 17)
+
+
+def test_percentile_matches_numpy_on_finite_hours():
+    hours = np.random.default_rng(0).uniform(50, 150, (5, 7))
+    for q in (10, 50, 90):
+        assert np.allclose(Ensemble.percentile(hours, q, axis=1), np.percentile(hours, q, axis=1))
+
+
+def test_percentile_objective_skips_candidate_failing_in_two_members():
+    hours = np.array([[10.0, 10.0, 10.0, 10.0, np.inf, np.inf],
+                      [20.0, 20.0, 20.0, 20.0, 20.0, 20.0]])
+    scores = Ensemble.score(hours, 90)
+
+    assert not np.isnan(scores).any()
+    assert scores[0] == np.inf
+    assert int(np.argmin(scores)) == 1
+
+
+def test_summarize_reports_inf_not_nan():
+    summary = Ensemble.summarize([1.0, 2.0, np.inf, np.inf], (0, 10, 50, 90))
+
+    assert summary["p0"] == 1.0
+    assert np.isclose(summary["p10"], 1.3)
+    assert summary["p50"] == np.inf and summary["p90"] == np.inf
+    assert summary["arrived"] == 0.5
+    assert "NaN" not in json.dumps(summary)
+
+
+def test_route_ensemble_with_unreachable_members():
+    ens = synthetic.ensemble(START, FINISH, START_TIME, members=6)
+    u, v = np.array(ens.u), np.array(ens.v)
+    # members without usable wind give no boat speed, so no route reaches the finish in them
+    u[:2] = np.nan
+    v[:2] = np.nan
+    broken = Weather.EnsembleWindField(ens.lats, ens.lons, ens.times, u, v)
+
+    result = Ensemble.route_ensemble(Polar.load("j99polars.csv"), broken, START_TIME, *START, *FINISH,
+                                     objective=50, dt_hours=6)
+
+    assert result.candidates
+    assert np.isinf(result.hours[:2]).all() and np.isfinite(result.hours[2:]).all()
+    assert np.isfinite(result.summary["p50"]) and result.summary["p90"] == np.inf
+    assert not any(np.isnan(v) for c in result.candidates for v in c["summary"].values())
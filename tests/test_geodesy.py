@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+import Geodesy as geo
+
+geopy = pytest.importorskip("geopy.distance")
+
+rng = np.random.default_rng(3)
+LAT1, LON1 = rng.uniform(-70, 70, 200), rng.uniform(-180, 180, 200)
+LAT2, LON2 = rng.uniform(-70, 70, 200), rng.uniform(-180, 180, 200)
+HDG, DIST = rng.uniform(0, 360, 200), rng.uniform(0.1, 3000, 200)
+
+
+def test_ellipsoidal_distance_matches_geopy():
+    expected = [geopy.geodesic(a, b).nm for a, b in zip(zip(LAT1, LON1), zip(LAT2, LON2))]
+    assert np.allclose(geo.distance(LAT1, LON1, LAT2, LON2, mode="ellipsoidal"), expected, rtol=0, atol=1e-6)
+
+
+def test_ellipsoidal_destination_matches_geopy():
+    lat, lon = geo.destination(LAT1, LON1, HDG, DIST, mode="ellipsoidal")
+    for i in range(len(lat)):
+        point = geopy.geodesic(nautical=DIST[i]).destination((LAT1[i], LON1[i]), HDG[i])
+        assert geopy.geodesic((lat[i], lon[i]), point).nm < 1e-6
+
+
+def test_ellipsoidal_across_the_antimeridian():
+    assert abs(geo.distance(10.0, 179.9, 10.5, -179.6, mode="ellipsoidal")
+               - geopy.geodesic((10.0, 179.9), (10.5, -179.6)).nm) < 1e-6
+
+    lat, lon = geo.destination(-20.0, 179.5, 80.0, 120.0, mode="ellipsoidal")
+    point = geopy.geodesic(nautical=120.0).destination((-20.0, 179.5), 80.0)
+    assert -180.0 <= lon < -177.0
+    assert abs(lat - point.latitude) < 1e-9 and abs(lon - point.longitude) < 1e-9
+
+
+def test_spherical_within_stated_tolerance_of_geopy():
+    expected = np.array([geopy.geodesic(a, b).nm for a, b in zip(zip(LAT1, LON1), zip(LAT2, LON2))])
+    assert np.allclose(geo.distance(LAT1, LON1, LAT2, LON2), expected, rtol=0.006)
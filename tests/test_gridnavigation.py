@@ -0,0 +1,60 @@
+import heapq
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+import GridNavigation as GN
+from Polars import Polar
+from benchmarks import synthetic
+
+START = (41.4918, -71.3119)
+FINISH = (32.3078, -64.7505)
+START_TIME = datetime(2026, 10, 17)
+
+
+def dijkstra_hours(grid, start, finish, polar, wind):
+    """ Reference time-dependent Dijkstra, one leg_hours call per edge """
+    hours = np.full(len(grid), np.inf)
+    hours[start] = 0.0
+    heap = [(0.0, start)]
+    done = set()
+    while heap:
+        g, node = heapq.heappop(heap)
+        if node in done:
+            continue
+        done.add(node)
+        if node == finish:
+            return g
+        lat, lon = grid.position(node)
+        for nb in grid.neighbors(node).tolist():
+            t = g + float(GN.leg_hours(polar, lat, lon, START_TIME + timedelta(hours=g), *grid.position(nb), wind))
+            if t < hours[nb]:
+                hours[nb] = t
+                heapq.heappush(heap, (t, nb))
+    return np.inf
+
+
+@pytest.mark.parametrize("field", ["frontal", "rotating"])
+def test_every_heuristic_finds_the_dijkstra_optimum(field):
+    wind = synthetic.FIELDS[field](START, FINISH, START_TIME)
+    polar = Polar.load("j99polars.csv")
+    grid = GN.build_grid(START, FINISH, 2, 12)
+    start, finish = GN.nearest_node(grid, *START), GN.nearest_node(grid, *FINISH)
+    expected = dijkstra_hours(grid, start, finish, polar, wind)
+
+    expanded = {}
+    for heuristic in GN.HEURISTICS:
+        route = GN.astar_grid(grid, start, finish, polar, START_TIME, wind, heuristic)
+        assert route.hours == pytest.approx(expected, abs=1e-9), heuristic
+        expanded[heuristic] = route.expanded
+    assert expanded["table"] <= expanded["zero"]
+
+
+def test_astar_keeps_padding_and_resolution_positions():
+    wind = synthetic.FIELDS["uniform"](START, FINISH, START_TIME)
+    polar = Polar.load("j99polars.csv")
+    route = GN.astar(START, FINISH, 2, 12, polars=polar, start_time=START_TIME, wind=wind)
+
+    grid = GN.build_grid(START, FINISH, 2, 12)
+    assert route.nodes[0] == GN.nearest_node(grid, *START)
+    with pytest.raises(TypeError):
+        GN.astar(START, FINISH, polar, START_TIME)
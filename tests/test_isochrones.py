@@ -0,0 +1,32 @@
+from datetime import datetime
+import numpy as np
+import pytest
+import Isochrones as iso
+from Polars import Polar
+from benchmarks import synthetic
+
+START = (41.4918, -71.3119)
+FINISH = (32.3078, -64.7505)
+START_TIME = datetime(2026, 10, 17)
+
+
+def mixed_polars():
+    j99 = Polar.load("j99polars.csv")
+    # every other TWA row and faster light air: a different VMG span and table grid
+    rows = np.unique(np.r_[0:len(j99.twa):2, len(j99.twa) - 1])
+    light = Polar(j99.twa[rows], j99.tws * 0.8, j99.bsp[rows] * 1.1)
+    return [j99, light]
+
+
+@pytest.mark.parametrize("sampling", iso.SAMPLING)
+@pytest.mark.parametrize("field", ["frontal", "rotating"])
+def test_fleet_matches_boats_routed_alone(sampling, field):
+    wind = synthetic.FIELDS[field](START, FINISH, START_TIME)
+    polars = mixed_polars()
+
+    fleet = iso.route_fleet(polars, START_TIME, *START, *FINISH, dt_hours=6, wind=wind, sampling=sampling)
+
+    for polar, route in zip(polars, fleet):
+        alone = iso.route_isochrones(polar, START_TIME, *START, *FINISH, dt_hours=6, wind=wind, sampling=sampling)
+        assert route.eta == alone.eta
+        assert np.allclose([p[:2] for p in route.route], [p[:2] for p in alone.route])
@@ -0,0 +1,67 @@
+import numpy as np
+import LandMask
+from LandMask import BLOCK
+
+# an irregular island with an off-centre lagoon, rings of (lon, lat)
+OUTER = [(-70.03, 40.11), (-69.12, 40.02), (-68.71, 40.63), (-69.27, 41.38), (-69.94, 41.07), (-70.03, 40.11)]
+LAGOON = [(-69.61, 40.37), (-69.13, 40.41), (-69.21, 40.93), (-69.58, 40.81)]
+BOUNDS = (39.5, 42.0, -70.5, -68.2)
+
+
+def even_odd(lat, lon, rings):
+    """ Reference point-in-polygon, one ray cast per ring edge """
+    inside = np.zeros(np.shape(lat), dtype=bool)
+    for ring in rings:
+        ring = np.asarray(ring, dtype=np.float64)
+        for (x1, y1), (x2, y2) in zip(ring, np.roll(ring, -1, axis=0)):
+            if y1 == y2:
+                continue
+            crosses = (np.minimum(y1, y2) <= lat) & (lat < np.maximum(y1, y2))
+            x = x1 + (lat - y1) * (x2 - x1) / (y2 - y1)
+            inside ^= crosses & (lon < x)
+    return inside
+
+
+def island(resolution=0.01):
+    return LandMask.LandMask.from_polygons([[OUTER, LAGOON]], resolution, BOUNDS)
+
+
+def test_raster_matches_point_in_polygon_at_cell_centres():
+    land = island()
+    rows, cols = land.shape
+    lat = land.lat0 + (np.arange(rows)[:, None] + 0.5) * land.dlat + np.zeros((1, cols))
+    lon = land.lon0 + (np.arange(cols)[None, :] + 0.5) * land.dlon + np.zeros((rows, 1))
+
+    assert rows > 4 * BLOCK and cols > 4 * BLOCK
+    assert np.array_equal(land.is_land(lat, lon), even_odd(lat, lon, [OUTER, LAGOON]))
+
+
+def test_lagoon_stays_water():
+    land = island()
+    assert land.is_water(40.65, -69.38)
+    assert land.is_land(40.3, -69.9) and land.is_land(41.0, -69.3)
+    assert land.is_water(39.7, -70.4) and land.is_water(42.5, -69.0)
+    assert land.leg_clear(40.5, -69.45, 40.8, -69.3)
+    assert not land.leg_clear(40.65, -69.38, 40.65, -70.2)
+
+
+def test_block_prefilter_agrees_with_full_sampling():
+    land = island()
+    rng = np.random.default_rng(7)
+    n = 3000
+    lat1, lat2 = rng.uniform(*BOUNDS[:2], (2, n))
+    lon1, lon2 = rng.uniform(*BOUNDS[2:], (2, n))
+    # short legs as well, many of them far from the coast
+    lat2[::2] = lat1[::2] + rng.uniform(-0.05, 0.05, n // 2)
+    lon2[::2] = lon1[::2] + rng.uniform(-0.05, 0.05, n // 2)
+
+    samples = np.ceil(2 * np.maximum(np.abs(lat2 - lat1) / land.dlat, np.abs(lon2 - lon1) / land.dlon)).astype(int) + 1
+    expected = np.array([not land.is_land(np.linspace(a, b, k), np.linspace(c, d, k)).any()
+                         for a, b, c, d, k in zip(lat1, lat2, lon1, lon2, samples)])
+
+    clear = land.leg_clear(lat1, lon1, lat2, lon2)
+    assert expected.any() and not expected.all()
+    # some legs are settled by the blocks alone, the rest go to full resolution
+    coarse = land.blocks().leg_clear(lat1, lon1, lat2, lon2)
+    assert coarse.any() and not coarse.all()
+    assert np.array_equal(clear, expected)
@@ -0,0 +1,54 @@
+import heapq
+from datetime import datetime
+import numpy as np
+import pytest
+import GridNavigation as GN
+from Polars import Polar
+from Replan import Replanner
+from benchmarks import synthetic
+
+START = (41.4918, -71.3119)
+FINISH = (32.3078, -64.7505)
+START_TIME = datetime(2026, 10, 17)
+
+
+def cold_hours(grid, cost, start, finish):
+    """ Plain Dijkstra over fixed CSR edge costs """
+    hours = np.full(len(grid), np.inf)
+    hours[start] = 0.0
+    heap = [(0.0, start)]
+    while heap:
+        g, node = heapq.heappop(heap)
+        if node == finish:
+            return g
+        if g > hours[node]:
+            continue
+        lo, hi = grid.indptr[node], grid.indptr[node + 1]
+        for nb, c in zip(grid.indices[lo:hi].tolist(), cost[lo:hi].tolist()):
+            if g + c < hours[nb]:
+                hours[nb] = g + c
+                heapq.heappush(heap, (g + c, nb))
+    return np.inf
+
+
+@pytest.mark.parametrize("tol", [0.0, 0.02])
+def test_repaired_plan_matches_cold_dijkstra(tol):
+    wind = synthetic.FIELDS["rotating"](START, FINISH, START_TIME)
+    grid = GN.build_grid(START, FINISH, 3, 20)
+    start, finish = GN.nearest_node(grid, *START), GN.nearest_node(grid, *FINISH)
+    planner = Replanner(grid, start, finish, Polar.load("j99polars.csv"), wind, START_TIME, tol=tol)
+
+    plan = planner.plan()
+    assert plan.hours == pytest.approx(cold_hours(grid, planner.cost, start, finish))
+
+    boat = plan.nodes[len(plan.nodes) // 3]
+    lat, lon = grid.position(boat)
+    update = synthetic.revised(wind, lat - 2, lat + 2, lon - 2, lon + 2, scale=0.3)
+    planner.update(position=boat)
+    repaired = planner.update(wind=update)
+
+    assert repaired.changed > 0 and repaired.nodes[0] == boat
+    if tol == 0.0:
+        assert np.array_equal(planner.cost, planner.edge_costs(update))
+    assert repaired.hours == pytest.approx(cold_hours(grid, planner.cost, boat, finish), rel=1e-12)
+    assert repaired.expanded < len(grid)
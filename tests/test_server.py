@@ -0,0 +1,49 @@
+import io
+import json
+import threading
+import urllib.error
+from datetime import datetime
+import pytest
+import Server
+from benchmarks import synthetic
+
+START = (41.4918, -71.3119)
+FINISH = (32.3078, -64.7505)
+QUERY = {"start": list(START), "finish": list(FINISH), "time": "2026-10-17T00:00", "dt_hours": 6}
+
+
+@pytest.fixture(scope="module")
+def service():
+    wind = synthetic.uniform(START, FINISH, datetime(2026, 10, 17))
+    service = Server.RoutingService("j99polars.csv", wind, workers=2)
+    yield service
+    service.close()
+
+
+def test_http_route_and_malformed_query(service):
+    server = Server.serve(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = "http://%s:%d" % server.server_address[:2]
+    try:
+        result = Server.request(url, "route", QUERY)
+        assert result["hours"] > 0 and len(result["route"]) > 2
+
+        with pytest.raises(urllib.error.HTTPError) as err:
+            Server.request(url, "route", dict(QUERY, dt_hours="soon"))
+        assert err.value.code == 400
+        assert "dt_hours" in json.loads(err.value.read())["error"]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_stdio_round_trip(service):
+    lines = [json.dumps({"id": 1, "kind": "route", "query": QUERY}),
+             json.dumps({"id": 2, "kind": "route", "query": {"start": [1, 2]}})]
+    out = io.StringIO()
+    Server.serve_stdio(service, io.StringIO("\n".join(lines) + "\n"), out)
+
+    first, second = (json.loads(line) for line in out.getvalue().splitlines())
+    assert first["id"] == 1 and first["hours"] > 0
+    assert second["id"] == 2 and "error" in second
@@ -0,0 +1,66 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import Isochrones as iso
+import Stats
+from Polars import Polar
+from Stats import stats
+from benchmarks import synthetic
+
+START = (41.4918, -71.3119)
+FINISH = (32.3078, -64.7505)
+START_TIME = datetime(2026, 10, 17)
+
+
+def test_concurrent_collections_do_not_mix():
+    barrier = threading.Barrier(2)
+    results = {}
+
+    def work(name, n):
+        with Stats.collect() as s:
+            barrier.wait()
+            for _ in range(n):
+                stats.count("work")
+            barrier.wait()
+        results[name] = s.counters["work"]
+
+    threads = [threading.Thread(target=work, args=(name, n)) for name, n in (("a", 300), ("b", 500))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {"a": 300, "b": 500}
+
+
+def test_nested_collection_and_outside_calls():
+    stats.count("ignored")
+    assert not stats.enabled
+    with Stats.collect() as outer:
+        stats.count("outer")
+        with Stats.collect() as inner:
+            stats.count("inner")
+        stats.count("outer")
+    assert dict(outer.counters) == {"outer": 2}
+    assert dict(inner.counters) == {"inner": 1}
+
+
+def test_propagate_reports_pool_work_into_the_caller():
+    with Stats.collect() as s:
+        with ThreadPoolExecutor(4) as pool:
+            futures = [pool.submit(Stats.propagate(stats.count), "task") for _ in range(20)]
+            [future.result() for future in futures]
+            pool.submit(stats.count, "lost").result()
+    assert dict(s.counters) == {"task": 20}
+
+
+def test_isochrone_steps_are_recorded_as_series():
+    wind = synthetic.FIELDS["uniform"](START, FINISH, START_TIME)
+    with Stats.collect() as s:
+        route = iso.route_isochrones(Polar.load("j99polars.csv"), START_TIME, *START, *FINISH, dt_hours=6, wind=wind)
+
+    candidates, pruned = s.series["isochrones.candidates"], s.series["isochrones.pruned"]
+    assert len(candidates) == len(pruned) == len(route.fronts) - 1
+    assert sum(candidates) == s.counters["isochrones.candidates"]
+    assert all(0 <= p <= c for c, p in zip(candidates, pruned))
+    assert "series" in s.to_dict()
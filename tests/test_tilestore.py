@@ -0,0 +1,88 @@
+from datetime import datetime
+import numpy as np
+import pytest
+import TileStore
+import Weather
+
+
+class OfflineStore(TileStore.TileStore):
+    """ Store whose fetch writes whole days of constant wind instead of calling the API """
+
+    def __init__(self, root):
+        super().__init__(root, tile_deg=5.0, spacing=1.0)
+        self.fetched = []
+
+    def fetch_tiles(self, run, corners, start_time, end_time, **fetch_kwargs):
+        self.fetched.append(list(corners))
+        day = Weather.to_epoch(datetime(start_time.year, start_time.month, start_time.day))
+        days = int((Weather.to_epoch(end_time) - day) // 86400) + 1
+        times = day + 3600.0 * np.arange(24 * days)
+        for lat0, lon0 in corners:
+            u = np.full((len(times), self.samples, self.samples), day / 86400, dtype=np.float32)
+            self.write_tile(run, lat0, lon0, times, u, u, (start_time, end_time))
+
+
+def test_corridor_refetches_tiles_stored_for_another_window(tmp_path):
+    store = OfflineStore(str(tmp_path))
+    store.corridor("r", (1, 1), (2, 2), datetime(2026, 10, 1), datetime(2026, 10, 2, 23))
+    field = store.corridor("r", (1, 1), (2, 7), datetime(2026, 10, 5), datetime(2026, 10, 7, 23))
+
+    assert store.fetched[-1] == [(0.0, 0.0), (0.0, 5.0)]
+    assert field.times[0] == Weather.to_epoch(datetime(2026, 10, 5))
+    assert np.all(field.u == Weather.to_epoch(datetime(2026, 10, 5)) / 86400)
+
+
+def test_corridor_reuses_covering_tile_without_copies(tmp_path):
+    store = OfflineStore(str(tmp_path))
+    store.corridor("r", (1, 1), (2, 2), datetime(2026, 10, 1), datetime(2026, 10, 2, 23))
+    field = store.corridor("r", (1, 1), (2, 2), datetime(2026, 10, 1, 6), datetime(2026, 10, 1, 12))
+
+    assert len(store.fetched) == 1
+    assert isinstance(field.u, np.memmap)
+    assert field.times[0] <= Weather.to_epoch(datetime(2026, 10, 1, 6))
+    assert field.times[-1] >= Weather.to_epoch(datetime(2026, 10, 1, 12))
+
+
+def test_load_field_rejects_mismatched_time_axes(tmp_path):
+    store = OfflineStore(str(tmp_path))
+    store.fetch_tiles("r", [(0.0, 0.0)], datetime(2026, 10, 1), datetime(2026, 10, 1, 23))
+    store.fetch_tiles("r", [(0.0, 5.0)], datetime(2026, 10, 3), datetime(2026, 10, 3, 23))
+
+    with pytest.raises(ValueError, match="time axes"):
+        store.load_field("r", 0, 4, 0, 9)
+
+
+def northerly(lats, lons, start_time, end_time, **kwargs):
+    """ fetch_hourly stand-in: wind from the north at 100 + latitude + longitude / 10 knots """
+    times = Weather.to_epoch(datetime(2026, 10, 1)) + 3600.0 * np.arange(24)
+    tws = np.repeat((100 + lats + lons / 10)[:, None], len(times), axis=1)
+    return tws, np.zeros_like(tws), times
+
+
+def test_points_near_tile_edges_are_interpolated_not_clamped(tmp_path, monkeypatch):
+    monkeypatch.setattr(Weather, "fetch_hourly", northerly)
+    store = TileStore.TileStore(str(tmp_path), tile_deg=5.0, spacing=1.0)
+    store.fetch_tiles("r", [(0.0, 0.0), (0.0, 5.0), (5.0, 0.0), (5.0, 5.0)],
+                      datetime(2026, 10, 1), datetime(2026, 10, 1, 23))
+    t = datetime(2026, 10, 1, 6)
+
+    tile = store.load_field("r", 4.5, 4.6, 4.5, 4.6)
+    assert isinstance(tile.u, np.memmap)
+    tws, _ = tile.tws_twd(4.6, 4.7, t)
+    assert np.isclose(tws, 100 + 4.6 + 0.47)
+
+    box = store.load_field("r", 1, 9, 1, 9)
+    assert np.array_equal(box.lats, np.arange(11.0)) and np.array_equal(box.lons, np.arange(11.0))
+    tws, _ = box.tws_twd(np.array([4.6, 5.0, 7.3]), np.array([4.7, 5.0, 2.2]), t)
+    assert np.allclose(tws, 100 + np.array([4.6, 5.0, 7.3]) + np.array([4.7, 5.0, 2.2]) / 10)
+
+
+def test_rewrite_swaps_tile_and_keeps_mapped_reader_valid(tmp_path):
+    store = OfflineStore(str(tmp_path))
+    store.corridor("r", (1, 1), (2, 2), datetime(2026, 10, 1), datetime(2026, 10, 1, 23))
+    mapped = store.load_tile("r", 0.0, 0.0)
+    store.corridor("r", (1, 1), (2, 2), datetime(2026, 10, 3), datetime(2026, 10, 3, 23))
+
+    assert np.all(mapped.u == Weather.to_epoch(datetime(2026, 10, 1)) / 86400)
+    assert np.all(store.load_tile("r", 0.0, 0.0).u == Weather.to_epoch(datetime(2026, 10, 3)) / 86400)
+    assert sorted(p.name for p in (tmp_path / "r").iterdir()) == [store.tile_name(0.0, 0.0)]
@@ -0,0 +1,172 @@
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+import pytest
+import Weather
+
+
+class FakeFetch:
+    """ fetch_day stand-in counting calls, returns a constant day of wind """
+
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def __call__(self, lat, lon, day):
+        with self._lock:
+            self.calls += 1
+            speed = float(self.calls)
+        time.sleep(self.delay)
+        return 0.0, 3600.0, np.full(24, speed), np.full(24, 180.0)
+
+
+def test_entries_expire_after_ttl():
+    now = [0.0]
+    fetch = FakeFetch()
+    cache = Weather.ForecastCache(fetch=fetch, ttl=600, clock=lambda: now[0])
+
+    assert cache.get(10.0, 20.0, 3600.0) == (1.0, 180.0)
+    now[0] = 599
+    assert cache.get(10.0, 20.0, 3600.0) == (1.0, 180.0)
+    now[0] = 1200
+    assert cache.get(10.0, 20.0, 3600.0) == (2.0, 180.0)
+    assert fetch.calls == 2
+
+
+def test_concurrent_misses_share_one_fetch():
+    fetch = FakeFetch(delay=0.05)
+    cache = Weather.ForecastCache(fetch=fetch)
+    threads = [threading.Thread(target=cache.get, args=(10.0, 20.0, 3600.0)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert fetch.calls == 1
+    assert cache.info()["misses"] == 1 and cache.info()["hits"] == 7
+
+
+def test_failed_fetch_is_not_cached():
+    fetch = FakeFetch()
+    attempts = []
+
+    def flaky(lat, lon, day):
+        attempts.append(day)
+        if len(attempts) == 1:
+            raise ConnectionError("offline")
+        return fetch(lat, lon, day)
+
+    cache = Weather.ForecastCache(fetch=flaky)
+    with pytest.raises(ConnectionError):
+        cache.get(10.0, 20.0, 3600.0)
+    assert cache.get(10.0, 20.0, 3600.0) == (1.0, 180.0)
+    assert len(attempts) == 2
+
+
+
+def test_queries_are_fetched_where_asked_unless_snapping():
+    asked = []
+
+    def fetch(lat, lon, day):
+        asked.append((lat, lon))
+        return 0.0, 3600.0, np.full(24, 10.0), np.full(24, 180.0)
+
+    Weather.ForecastCache(fetch=fetch).get(41.4918, -71.3119, 3600.0)
+    snapped = Weather.ForecastCache(fetch=fetch, cell_deg=0.25)
+    snapped.get(41.4918, -71.3119, 3600.0)
+    snapped.get(41.45, -71.21, 3600.0)
+
+    assert asked[0] == (41.4918, -71.3119)
+    assert asked[1:] == [(41.5, -71.25)]
+    assert snapped.info()["hits"] == 1
+
+
+def test_to_epoch_accepts_strings():
+    expected = Weather.to_epoch(datetime(2026, 10, 17, 12))
+    assert Weather.to_epoch("2026-10-17T12:00:00Z") == expected
+    assert Weather.to_epoch("2026-10-17 14:00+02:00") == expected
+    assert np.array_equal(Weather.to_epoch(np.array(["2026-10-17T12:00", "2026-10-17T13:00"])),
+                          [expected, expected + 3600])
+
+class StubForecast(BaseHTTPRequestHandler):
+    """ Open-Meteo stand-in: wind speed is the latitude and direction the longitude
+
+    The first server.fail requests get a 502 so the session has to retry.
+    """
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            attempt = server.requests
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            time.sleep(0.05)
+            if attempt <= server.fail:
+                self.send_response(502)
+                self.end_headers()
+                return
+            query = parse_qs(urlparse(self.path).query)
+            lats = [float(x) for x in query["latitude"][0].split(",")]
+            lons = [float(x) for x in query["longitude"][0].split(",")]
+            server.chunks.append(len(lats))
+            start = datetime.strptime(query["start_date"][0], "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+            days = (datetime.strptime(query["end_date"][0], "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+                    - start) // 86400 + 1
+            times = [start + 3600 * h for h in range(int(days) * 24)]
+            body = [{"hourly": {"time": times, "wind_speed_10m": [lat] * len(times),
+                                "wind_direction_10m": [lon] * len(times)}} for lat, lon in zip(lats, lons)]
+            data = json.dumps(body if len(body) > 1 else body[0]).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def forecast_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubForecast)
+    server.lock = threading.Lock()
+    server.requests = server.active = server.peak = server.fail = 0
+    server.chunks = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_hourly_batches_retries_and_runs_concurrently(forecast_server):
+    import requests
+    from retry_requests import retry
+
+    forecast_server.fail = 2
+    session = Weather.pooled_session(12, retry(requests.Session(), retries=3, backoff_factor=0))
+    url = f"http://127.0.0.1:{forecast_server.server_port}/v1/forecast"
+    lats = np.linspace(30.0, 40.0, 25)
+    lons = np.linspace(-70.0, -60.0, 25)
+
+    tws, twd, times = Weather.fetch_hourly(lats, lons, datetime(2026, 10, 17), datetime(2026, 10, 18, 6),
+                                           chunk=4, workers=12, url=url, session=session)
+
+    adapter = session.get_adapter(url)
+    assert adapter._pool_maxsize == 12 and adapter.max_retries.total == 3
+    assert sorted(forecast_server.chunks) == [1] + [4] * 6
+    assert forecast_server.requests == 7 + 2
+    assert forecast_server.peak > 1
+    assert tws.shape == twd.shape == (25, 48) and len(times) == 48
+    assert np.allclose(tws[:, 0], np.round(lats, 4)) and np.allclose(twd[:, -1], np.round(lons, 4))
+    assert times[0] == Weather.to_epoch(datetime(2026, 10, 17))